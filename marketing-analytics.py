@@ -3,6 +3,15 @@ import pandas as pd
 from datetime import datetime
 import hashlib
 
+from marketing_analytics import (
+    DIRECTION_ICONS, DIRECTIONS, EXPORT_FORMATS, PAGE_SIZES, SERVICE_PRICES, FilterSpec, RunProfile,
+    append_visit, available_months, contacts_path, create_client_id, create_contact_id, delete_visits,
+    export_file, get_cohorts, get_contact_name_index, get_contact_store, get_identity_index, get_month_stats,
+    get_name_index, get_period_summaries, get_profiles, get_query_engine,
+    get_referral_graph, get_rollups, get_scheduler, get_store, get_today_stats, import_visits, load_data,
+    metrics, page_count, page_slice, pending_migrations, read_table, search_names,
+)
+
 # --- КОНФИГУРАЦИЯ ---
 st.set_page_config(
     page_title="Marketing Analytics",
@@ -181,86 +190,38 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- БАЗА ДАННЫХ ---
-def create_client_id(name, phone):
-    unique_string = f"{name}_{phone}"
-    return hashlib.md5(unique_string.encode()).hexdigest()
-
-def load_data():
-    try:
-        df = pd.read_csv("marketing_database.csv", encoding='utf-8')
-        # Создаем visit_id для существующих данных если его нет
-        if 'visit_id' not in df.columns:
-            df['visit_id'] = df.apply(lambda row: hashlib.md5(f"{row['Дата']}_{row['Имя']}_{row['Телефон']}".encode()).hexdigest(), axis=1)
-            df.to_csv("marketing_database.csv", index=False, encoding='utf-8')
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=[
-            "visit_id", "client_id", "Дата", "Направление", "Имя", "Телефон", "Услуга", 
-            "Цена", "Кто_пригласил", "Место_учебы", "Ссылка_VK", "Согласие_рассылка"
-        ])
-
-def save_data(df):
-    df.to_csv("marketing_database.csv", index=False, encoding='utf-8')
-
-# --- ОБНОВЛЕННЫЕ ЦЕНЫ УСЛУГ ---
-SERVICE_PRICES = {
-    "Стрижка": 900,
-    "Борода": 500,
-    "VIP": 500,
-    "Удаление воском 1": 200,
-    "Удаление воском 2": 300,
-    "Уходовая маска Nishman": 1000,
-    "Стрижка+борода": 1400,
-    "Детская": 800,
-    "Под машинку": 900
-}
-
-# --- ЗАГРУЗКА ДАННЫХ ---
-df = load_data()
-
-# --- ФУНКЦИИ ДЛЯ СТАТИСТИКИ ---
-def get_today_stats(df):
-    today = datetime.now().strftime("%Y-%m-%d")
-    today_df = df[(df['Дата'].str.startswith(today)) & (df['Направление'] != 'Рассылка')]
-    
-    clients_today = today_df['Имя'].nunique()
-    records_today = len(today_df)
-    income_today = today_df['Цена'].sum()
-    salary_today = income_today * 0.4
-    
-    return clients_today, records_today, income_today, salary_today
+# --- ИНСТРУМЕНТАЦИЯ ---
+# Этапы запуска засекаются в metrics; профиль снимается с одного запуска по
+# кнопке в панели диагностики
+metrics.start_run()
+run_profile = RunProfile() if st.session_state.pop("profile_next_run", False) else None
 
-def get_month_stats(df, year_month=None):
-    if year_month is None:
-        year_month = datetime.now().strftime("%Y-%m")
-    
-    month_df = df[(df['Дата'].str.startswith(year_month)) & (df['Направление'] != 'Рассылка')]
-    
-    stats = {
-        'all_clients': month_df['Имя'].nunique(),
-        'all_income': month_df['Цена'].sum(),
-        'products_clients': month_df[month_df['Направление'] == 'Продукты']['Имя'].nunique(),
-        'products_income': month_df[month_df['Направление'] == 'Продукты']['Цена'].sum(),
-        'study_clients': month_df[month_df['Направление'] == 'Учеба']['Имя'].nunique(),
-        'study_income': month_df[month_df['Направление'] == 'Учеба']['Цена'].sum(),
-        'flowers_clients': month_df[month_df['Направление'] == 'Цветочный']['Имя'].nunique(),
-        'flowers_income': month_df[month_df['Направление'] == 'Цветочный']['Цена'].sum(),
-        'post_clients': month_df[month_df['Направление'] == 'Почта']['Имя'].nunique(),
-        'post_income': month_df[month_df['Направление'] == 'Почта']['Цена'].sum(),
-        'chop_clients': month_df[month_df['Направление'] == 'Chop']['Имя'].nunique(),
-        'chop_income': month_df[month_df['Направление'] == 'Chop']['Цена'].sum(),
-        'random_clients': month_df[month_df['Направление'] == 'Случайный']['Имя'].nunique(),
-        'random_income': month_df[month_df['Направление'] == 'Случайный']['Цена'].sum()
-    }
-    
-    return stats
+# --- БАЗА ДАННЫХ ---
+# Хранилище, сводки и аналитика - в пакете marketing_analytics; здесь только страница
+store = get_store()
+# Компакция, пересчет когорт и итогов, миграция - в фоновых задачах процесса
+scheduler = get_scheduler(store)
+MIGRATION_WAIT_SECONDS = 5
 
-# --- ФУНКЦИЯ ДЛЯ ПОЛУЧЕНИЯ ИСТОРИИ КЛИЕНТА ---
-def get_client_history(df, client_id):
-    """Возвращает историю всех посещений клиента"""
-    client_history = df[df['client_id'] == client_id].sort_values('Дата', ascending=False)
-    return client_history
+# --- МИГРАЦИЯ СХЕМЫ ---
+# Старую базу нужно один раз обновить явно - при обычной загрузке это не делается
+pending = pending_migrations(store.path)
+if pending:
+    migration = scheduler.jobs["migrate"]
+    st.warning("⚙️ База данных в старом формате: " + ", ".join(m[1] for m in pending))
+    if migration.error:
+        st.error(f"❌ Миграция прервана: {migration.error}")
+    if migration in scheduler.busy():
+        st.info(f"⏳ Обновляем базу данных: {migration.progress or 'подготовка'}")
+        if st.button("🔄 Проверить", use_container_width=True):
+            st.rerun()
+    elif st.button("🔧 Обновить базу данных", use_container_width=True):
+        scheduler.request("migrate")
+        # Небольшая база обновится за секунды - ждем, большая продолжит в фоне
+        with st.spinner("Обновляем базу данных..."):
+            scheduler.wait("migrate", timeout=MIGRATION_WAIT_SECONDS)
+        st.rerun()
+    st.stop()
 
 # --- АДАПТИВНАЯ НАВИГАЦИЯ ---
 st.sidebar.title("🚀 Навигация")
@@ -282,16 +243,39 @@ except:
 
 if is_mobile:
     page = st.sidebar.selectbox("Выберите страницу:", 
-        ["Главная", "Добавить клиента", "Рассылка", "Аналитика", "История клиентов"])
+        ["Главная", "Добавить клиента", "Рассылка", "Импорт", "Аналитика", "Когорты", "История клиентов"])
 else:
     page = st.sidebar.radio("Выберите страницу:", 
-        ["Главная", "Добавить клиента", "Рассылка", "Аналитика", "История клиентов"])
+        ["Главная", "Добавить клиента", "Рассылка", "Импорт", "Аналитика", "Когорты", "История клиентов"])
+
+# --- ЗАГРУЗКА ДАННЫХ ---
+# Помесячной базе Главная и «Сегодня» не нужна вся история: итоги берутся из
+# партиций нужного дня и месяца, а база целиком загружается только на других страницах
+if store.partitioned and page == "Главная":
+    df = None
+    period_stats = get_period_summaries(store)
+else:
+    # Разросшийся журнал сворачивает фоновая задача, а не этот запуск
+    with metrics.stage("load_data"):
+        df = load_data(store, compact=False)
+    with metrics.stage("derived"):
+        rollups = get_rollups(store)
+        name_index = get_name_index(store)
+        profiles = get_profiles(store)
+        referrals = get_referral_graph(store)
+        cohorts = get_cohorts(store)
+        identities = get_identity_index(store)
+        query_engine = get_query_engine(store)
+    period_stats = rollups
+
+HISTORY_PAGE_SIZE = 10
 
 # --- СТАТИСТИКА ЗА ДЕНЬ В САЙДБАРЕ ---
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📊 Сегодня")
 
-clients_today, records_today, income_today, salary_today = get_today_stats(df)
+with metrics.stage("today_stats"):
+    clients_today, records_today, income_today, salary_today = get_today_stats(period_stats)
 
 st.sidebar.markdown(f"""
 <div style='background: linear-gradient(135deg, #2D2D2D, #3D3D3D); padding: 1rem; border-radius: 12px; border: 1px solid #3D3D3D;'>
@@ -308,17 +292,17 @@ if page == "Главная":
     st.markdown("---")
     
     # Выбор месяца для аналитики
-    if not df.empty:
-        df['Месяц'] = df['Дата'].str[:7]
-        available_months = sorted(df['Месяц'].unique(), reverse=True)
+    months = available_months(period_stats)
+    if months:
         selected_month = st.selectbox("Выберите месяц для аналитики:", 
-                                    available_months, index=0)
+                                    months, index=0)
     else:
         selected_month = datetime.now().strftime("%Y-%m")
         st.selectbox("Выберите месяц для аналитики:", [selected_month])
     
     # Статистика за выбранный месяц
-    month_stats = get_month_stats(df, selected_month)
+    with metrics.stage("month_stats"):
+        month_stats = get_month_stats(period_stats, selected_month)
     
     # Основная статистика за месяц
     st.subheader(f"📊 Статистика за {selected_month}")
@@ -334,24 +318,45 @@ if page == "Главная":
     with col2:
         # Аналитика по направлениям (компактно)
         st.markdown("**📈 По направлениям:**")
-        st.markdown(f"📚 Учеба {month_stats['study_income']:,} ₽")
-        st.markdown(f"🛍️ Продукты {month_stats['products_income']:,} ₽")
-        st.markdown(f"💐 Цветочный{month_stats['flowers_income']:,} ₽")
-        st.markdown(f"📮 Почта {month_stats['post_income']:,} ₽")
-        st.markdown(f"✂️ Chop {month_stats['chop_income']:,} ₽")
-        st.markdown(f"🎲 Случайный {month_stats['random_income']:,} ₽")
+        for row in month_stats['by_direction'].itertuples(index=False):
+            icon = DIRECTION_ICONS.get(row.Направление, "•")
+            st.markdown(f"{icon} {row.Направление} {row.income:,} ₽")
+
+    # Итоги за все время - у помесячной базы из манифеста партиций
+    with metrics.stage("all_time_stats"):
+        totals = store.totals()
+    if totals["visits"]:
+        # Дат может не быть вовсе - например, если ни одна не разобрана
+        period_text = (f" ({totals['first_date']:%d.%m.%Y} — {totals['last_date']:%d.%m.%Y})"
+                       if totals["first_date"] is not None else "")
+        st.caption(
+            f"🗄 За все время: {totals['visits']:,} посещений, {totals['revenue']:,} ₽{period_text}"
+        )
 
 # --- ДОБАВИТЬ КЛИЕНТА ---
 elif page == "Добавить клиента":
     st.title("👥 Добавить клиента")
     st.markdown("---")
     
+    # Направление и "Кто пригласил" вне формы: поиск пригласившего
+    # обновляется сразу, а не только после отправки формы
+    direction = st.selectbox("Направление*", DIRECTIONS)
+    
+    # Поле "Кто пригласил" только для Учебы
+    if direction == "Учеба":
+        referrer_query = st.text_input("🔎 Кто пригласил: начните вводить имя или телефон")
+        # Пригласить мог и клиент, и контакт рассылки - ищем в обоих
+        contact_names = get_contact_name_index(get_contact_store(contacts_path(store.path)))
+        referrers = search_names([name_index, contact_names], referrer_query) if referrer_query else []
+        invited_by = st.selectbox("Кто пригласил", [""] + referrers)
+    else:
+        invited_by = ""
+    
     # Создаем форму с уникальным ключом
     with st.form("client_form", clear_on_submit=True):
         col1, col2 = st.columns(2)
         
         with col1:
-            direction = st.selectbox("Направление*", ["Учеба", "Продукты", "Цветочный", "Почта", "Chop", "Случайный"])
             name = st.text_input("Имя клиента*")
             phone = st.text_input("Номер телефона*")
             
@@ -359,39 +364,34 @@ elif page == "Добавить клиента":
             service = st.selectbox("Услуга*", list(SERVICE_PRICES.keys()))
             price = SERVICE_PRICES[service]
             st.info(f"💰 Стоимость услуги: **{price} руб.**")
-            
-            # Поле "Кто пригласил" только для Учебы
-            if direction == "Учеба":
-                all_people = list(df[df['Направление'] != 'Рассылка']["Имя"].unique())
-                mailing_contacts = list(df[df["Направление"] == "Рассылка"]["Имя"].unique())
-                all_available_people = list(set(all_people + mailing_contacts))
-                
-                invited_by = st.selectbox("Кто пригласил", [""] + sorted(all_available_people))
-            else:
-                invited_by = ""
         
         submitted = st.form_submit_button("💾 Сохранить клиента", use_container_width=True)
         
         if submitted:
             if name and phone and service:
-                client_id = create_client_id(name, phone)
                 visit_id = hashlib.md5(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_{name}_{phone}".encode()).hexdigest()
                 
-                # Проверка на существующего клиента
-                existing_client = df[df['client_id'] == client_id]
+                # Проверка на существующего клиента - по словарю нормализованных
+                # ключей: «8 900…» и «+7 900…», регистр и пробелы в имени не важны
+                known = identities.find(name, phone)
+                client_id = known.client_id if known is not None else create_client_id(name, phone)
+                profile = profiles.get(client_id) if known is not None else None
                 
-                if len(existing_client) > 0:
+                if profile is None:
+                    phone_owners = [client.name for client in identities.by_phone(phone)]
+                    if phone_owners:
+                        st.info(f"📞 Этот номер уже записан на: {', '.join(phone_owners)}")
+                else:
                     st.warning(f"👤 Клиент {name} уже существует в базе. Добавляем новое посещение...")
                     
                     # Показываем историю клиента
-                    client_history = get_client_history(df, client_id)
-                    st.info(f"📋 История клиента {name} ({len(client_history)} посещений):")
+                    st.info(f"📋 История клиента {name} ({profile.visits} посещений):")
                     
-                    for _, visit in client_history.head(3).iterrows():
-                        st.write(f"• {visit['Дата'][:16]} - {visit['Услуга']} ({visit['Цена']} руб.)")
+                    for _, visit_date, _, visit_service, visit_price, _ in profile.recent[:3]:
+                        st.write(f"• {visit_date:%Y-%m-%d %H:%M} - {visit_service} ({visit_price} руб.)")
                     
-                    if len(client_history) > 3:
-                        st.write(f"... и еще {len(client_history) - 3} посещений")
+                    if profile.visits > 3:
+                        st.write(f"... и еще {profile.visits - 3} посещений")
                 
                 # Добавляем новую запись (посещение)
                 new_visit = {
@@ -408,9 +408,8 @@ elif page == "Добавить клиента":
                     "Ссылка_VK": "",
                     "Согласие_рассылка": ""
                 }
-                df = pd.concat([df, pd.DataFrame([new_visit])], ignore_index=True)
-                
-                save_data(df)
+                with metrics.stage("save_visit"):
+                    df = append_visit(new_visit, store)
                 st.success(f"✅ Посещение клиента {name} успешно сохранено!")
                 
             else:
@@ -421,6 +420,8 @@ elif page == "Рассылка":
     st.title("📧 Рассылка")
     st.markdown("---")
     
+    contacts = get_contact_store(contacts_path(store.path))
+    
     # На мобильных используем selectbox вместо tabs
     if is_mobile:
         tab_option = st.selectbox("Выберите раздел:", ["Добавить контакт", "База контактов"])
@@ -443,74 +444,113 @@ elif page == "Рассылка":
             
             if submitted_mailing:
                 if mailing_name:
-                    client_id = create_client_id(mailing_name, "")
-                    visit_id = hashlib.md5(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_{mailing_name}_".encode()).hexdigest()
-                    
-                    new_mailing = {
-                        "visit_id": visit_id,
-                        "client_id": client_id,
+                    new_contact = {
+                        "client_id": create_contact_id(mailing_name, vk_link),
                         "Дата": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "Направление": "Рассылка",
                         "Имя": mailing_name,
-                        "Телефон": "",
-                        "Услуга": "",
-                        "Цена": 0,
-                        "Кто_пригласил": "",
                         "Место_учебы": study_place,
                         "Ссылка_VK": vk_link,
                         "Согласие_рассылка": mailing_consent
                     }
-                    df = pd.concat([df, pd.DataFrame([new_mailing])], ignore_index=True)
-                    save_data(df)
+                    with metrics.stage("save_contact"):
+                        contacts.upsert(new_contact)
                     st.success(f"✅ {mailing_name} добавлен в базу рассылки!")
                 else:
                     st.error("❌ Пожалуйста, укажите имя")
     
     else:  # База контактов
-        mailing_df = df[df["Направление"] == "Рассылка"]
+        mailing_df = contacts.frame()
         if not mailing_df.empty:
             st.dataframe(mailing_df[["Имя", "Место_учебы", "Ссылка_VK", "Согласие_рассылка"]])
             
+            # Выгрузка для рассылки - только контакты с согласием; файл собирается
+            # порциями и только при нажатии кнопки, а не на каждом rerun
+            st.download_button(
+                label="📤 Скачать контакты с согласием (CSV)",
+                data=contacts.export_file,
+                file_name="mailing_contacts.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+            
             contacts_to_delete = st.multiselect(
                 "Выберите контакты для удаления:",
-                mailing_df["Имя"].unique()
+                mailing_df["client_id"],
+                format_func=lambda client_id: contacts.get(client_id)["Имя"]
             )
             
             if contacts_to_delete and st.button("🗑️ Удалить выбранные контакты", use_container_width=True):
-                df = df[~((df["Направление"] == "Рассылка") & (df["Имя"].isin(contacts_to_delete)))]
-                save_data(df)
+                # Одна запись журнала контактов - история посещений не переписывается
+                contacts.delete(contacts_to_delete)
                 st.success(f"✅ Удалено {len(contacts_to_delete)} контактов!")
                 st.rerun()
         else:
             st.info("📭 База рассылки пуста")
 
+# --- ИМПОРТ ---
+elif page == "Импорт":
+    st.title("📥 Импорт")
+    st.markdown("---")
+    
+    st.caption("CSV или XLSX с колонками базы: обязательны Дата, Направление, Имя; "
+               "для посещений - Телефон и Услуга. Пустая цена берется из прайса, "
+               "строки с Направлением «Рассылка» становятся контактами. "
+               "Для XLSX нужен пакет openpyxl.")
+    uploaded = st.file_uploader("Файл для импорта", type=["csv", "xlsx"])
+    keep_prices = st.checkbox("Не сверять цены с прайсом (старые посещения)")
+    
+    if uploaded is not None and st.button("📥 Импортировать", use_container_width=True):
+        progress_bar = st.progress(0.0, text="Проверяем строки...")
+        
+        def show_progress(done, total):
+            progress_bar.progress(done / total, text=f"Проверено {done:,} из {total:,}")
+        
+        try:
+            with metrics.stage("import"):
+                imported, rejected = import_visits(read_table(uploaded, uploaded.name), store,
+                                                   strict_prices=not keep_prices, progress=show_progress,
+                                                   compact=False)
+        except (ValueError, ImportError) as error:
+            # ImportError - XLSX без установленного openpyxl
+            st.error(f"❌ {error}")
+        else:
+            df = store.data()
+            st.success(f"✅ Импортировано записей: {imported}")
+            if len(rejected):
+                st.warning(f"⚠️ Отклонено строк: {len(rejected)}")
+                st.dataframe(rejected, use_container_width=True, hide_index=True)
+                st.download_button(
+                    label="📥 Скачать отклоненные строки",
+                    data=rejected.to_csv(index=False).encode('utf-8'),
+                    file_name="rejected_rows.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
+
 # --- АНАЛИТИКА ---
 elif page == "Аналитика":
     st.title("📈 Аналитика")
     st.markdown("---")
     
     if not df.empty:
-        # Статистика
+        # Статистика - итоги запроса без фильтров, из кэша движка запросов
         st.subheader("📊 Общая статистика")
+        with metrics.stage("analytics_overview"):
+            overview = query_engine.query()
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_income = df[df['Направление'] != 'Рассылка']["Цена"].sum()
-            st.metric("💰 Выручка", f"{total_income:,} ₽")
+            st.metric("💰 Выручка", f"{overview.revenue:,} ₽")
             
         with col2:
-            total_clients = df[df['Направление'] != 'Рассылка']["Имя"].nunique()
-            st.metric("👥 Клиентов", total_clients)
+            st.metric("👥 Клиентов", overview.clients)
             
         with col3:
-            total_services = len(df[df['Направление'] != 'Рассылка'])
-            st.metric("📝 Услуг", total_services)
+            st.metric("📝 Услуг", overview.services)
             
         with col4:
-            filtered_df = df[df['Направление'] != 'Рассылка']
-            avg_price = filtered_df["Цена"].mean() if len(filtered_df) > 0 else 0
-            st.metric("💳 Средний чек", f"{avg_price:.0f} ₽")
+            st.metric("💳 Средний чек", f"{overview.avg_check:.0f} ₽")
         
         # Фильтры
         st.subheader("🔍 Фильтры")
@@ -518,26 +558,77 @@ elif page == "Аналитика":
         col1, col2 = st.columns(2)
         
         with col1:
-            filter_direction = st.multiselect("Направление", df["Направление"].unique())
-            filter_service = st.multiselect("Услуга", df["Услуга"].unique())
+            filter_direction = st.multiselect("Направление", query_engine.options("Направление"))
+            filter_service = st.multiselect("Услуга", query_engine.options("Услуга"))
             
         with col2:
             min_price = st.number_input("Минимальная цена", 0, value=0)
-            max_price = st.number_input("Максимальная цена", 0, value=int(df["Цена"].max()))
-        
-        # Применяем фильтры
-        filtered_df = df.copy()
-        
-        if filter_direction:
-            filtered_df = filtered_df[filtered_df["Направление"].isin(filter_direction)]
-        if filter_service:
-            filtered_df = filtered_df[filtered_df["Услуга"].isin(filter_service)]
+            max_price = st.number_input("Максимальная цена", 0, value=overview.max_price)
+            dated = df["Дата"].dropna()
+            if len(dated):
+                first_day, last_day = dated.iloc[0].date(), dated.iloc[-1].date()
+                period = st.date_input("Период", (first_day, last_day))
+            else:
+                # Ни одной разобранной даты - ограничивать по периоду нечего
+                first_day = last_day = None
+                period = ()
         
-        filtered_df = filtered_df[(filtered_df["Цена"] >= min_price) & (filtered_df["Цена"] <= max_price)]
+        # Применяем фильтры: одна маска по кодам категорий, результат кэшируется
+        # по (фильтр, версия данных); границы цены и периода по умолчанию не фильтруют,
+        # поэтому посещения с неразобранной датой остаются в таблице и выгрузке
+        narrowed = len(period) == 2 and tuple(period) != (first_day, last_day)
+        spec = FilterSpec(
+            start=period[0] if narrowed else None,
+            end=pd.Timestamp(period[1]) + pd.Timedelta(days=1) if narrowed else None,
+            directions=filter_direction,
+            services=filter_service,
+            min_price=min_price if min_price > 0 else None,
+            max_price=max_price if max_price < overview.max_price else None,
+        )
+        with metrics.stage("analytics_filters"):
+            filtered_df = query_engine.query(spec).rows
         
         # Данные
         st.subheader("📋 Данные")
-        st.dataframe(filtered_df, use_container_width=True)
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            page_size = st.selectbox("Строк на странице", PAGE_SIZES)
+        with col2:
+            columns = list(filtered_df.columns)
+            sort_by = st.selectbox("Сортировка", columns, index=columns.index('Дата'))
+        with col3:
+            descending = st.checkbox("По убыванию", value=True)
+        with col4:
+            total_rows = len(filtered_df)
+            page_number = st.number_input("Страница", 1, page_count(total_rows, page_size), 1)
+        
+        # В браузер уходит только видимая страница
+        with metrics.stage("render_table"):
+            page_df = page_slice(filtered_df, page_number - 1, page_size, sort_by, descending)
+            st.dataframe(page_df, use_container_width=True)
+        first_row = (page_number - 1) * page_size
+        st.caption(f"Строки {min(first_row + 1, total_rows)}–{first_row + len(page_df)} из {total_rows}")
+        
+        # Рефералы
+        st.subheader("🔗 Рефералы")
+        with metrics.stage("referrals"):
+            referral_table = referrals.metrics()
+        
+        if not referral_table.empty:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown("**Пригласившие за все время**")
+                st.dataframe(referral_table.head(20), use_container_width=True, hide_index=True)
+                
+            with col2:
+                referral_month = st.selectbox("Месяц приглашений", available_months(rollups))
+                st.markdown("**Лучшие за месяц**")
+                st.dataframe(referrals.top_influencers(referral_month), use_container_width=True, hide_index=True)
+        else:
+            st.info("🔗 Приглашений пока нет")
         
         # Управление клиентами
         st.subheader("🗑️ Управление клиентами")
@@ -547,86 +638,163 @@ elif page == "Аналитика":
             clients_to_delete = st.multiselect("Выберите клиентов для удаления:", all_clients)
             
             if clients_to_delete and st.button("🗑️ Удалить выбранных клиентов", use_container_width=True):
-                df = df[~df["Имя"].isin(clients_to_delete)]
-                save_data(df)
+                df = delete_visits(df, df["Имя"].isin(clients_to_delete), store)
                 st.success(f"✅ Удалено {len(clients_to_delete)} клиентов!")
                 st.rerun()
         
         # Экспорт
         st.subheader("📤 Экспорт данных")
-        csv = filtered_df.to_csv(index=False).encode('utf-8')
+        export_format = st.selectbox("Формат", list(EXPORT_FORMATS),
+                                     format_func=lambda fmt: EXPORT_FORMATS[fmt][0])
+        label, extension, mime = EXPORT_FORMATS[export_format]
+        # Файл собирается только при нажатии кнопки, а не на каждом rerun
         st.download_button(
-            label="📥 Скачать CSV",
-            data=csv,
-            file_name=f"marketing_data_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
+            label=f"📥 Скачать {label}",
+            data=lambda rows=filtered_df, fmt=export_format: export_file(rows, fmt),
+            file_name=f"marketing_data_{datetime.now().strftime('%Y%m%d')}{extension}",
+            mime=mime,
             use_container_width=True
         )
         
     else:
         st.info("📊 Данные появятся здесь после добавления клиентов")
 
+# --- КОГОРТЫ ---
+elif page == "Когорты":
+    st.title("🧬 Когорты")
+    st.markdown("---")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        cohort_metric = st.radio("Показатель", ["Удержание", "LTV"], horizontal=True)
+    with col2:
+        by_direction = st.checkbox("По направлениям первого посещения", value=True)
+    
+    # Отчет пересчитывается фоновой задачей после записей - показываем готовый
+    with metrics.stage("cohorts"):
+        report, fresh = cohorts.latest(by_direction)
+        if report is None:
+            report = cohorts.report(by_direction)
+        elif not fresh:
+            st.caption("⏳ Отчет обновляется в фоне - показаны данные предыдущего расчета")
+    
+    if not report.empty:
+        if cohort_metric == "Удержание":
+            st.caption("Доля клиентов когорты, пришедших снова через N месяцев, %")
+            table = (report.retention * 100).round(1)
+        else:
+            st.caption("Накопленная выручка на одного клиента когорты, ₽")
+            table = report.ltv.round(0)
+        table.columns = [f"+{month} мес" for month in table.columns]
+        table.insert(0, "Клиентов", report.sizes)
+        st.dataframe(table.iloc[::-1], use_container_width=True)
+    else:
+        st.info("🧬 Когорты появятся здесь после добавления клиентов")
+
 # --- ИСТОРИЯ КЛИЕНТОВ ---
 elif page == "История клиентов":
     st.title("📋 История клиентов")
     st.markdown("---")
     
     if not df.empty:
-        # Выбор клиента для просмотра истории
-        all_clients = sorted(df[df['Направление'] != 'Рассылка']['Имя'].unique())
+        # Выбор клиента для просмотра истории - поиск по индексу имен и телефонов
+        client_query = st.text_input("🔎 Поиск клиента по имени или телефону")
+        with metrics.stage("client_search"):
+            found_clients = name_index.search(client_query)
         
-        if all_clients:
-            selected_client = st.selectbox("Выберите клиента для просмотра истории:", all_clients)
+        if found_clients:
+            selected_client = st.selectbox("Выберите клиента для просмотра истории:", found_clients,
+                                           format_func=lambda entry: f"{entry[0]} · {entry[1]}")
             
             if selected_client:
-                # Находим client_id выбранного клиента
-                client_data = df[df['Имя'] == selected_client]
-                if not client_data.empty:
-                    client_id = client_data.iloc[0]['client_id']
-                    
-                    # Получаем историю клиента
-                    client_history = get_client_history(df, client_id)
-                    
+                # client_id выбранного клиента берем прямо из индекса
+                client_id = selected_client[2]
+                
+                # Профиль клиента поддерживается при каждой записи
+                with metrics.stage("client_history"):
+                    profile = profiles.get(client_id)
+                if profile is not None:
                     # Основная информация о клиенте
                     col1, col2, col3 = st.columns(3)
                     
                     with col1:
-                        total_visits = len(client_history)
-                        st.metric("📊 Всего посещений", total_visits)
+                        st.metric("📊 Всего посещений", profile.visits)
                     
                     with col2:
-                        total_spent = client_history['Цена'].sum()
-                        st.metric("💰 Всего потрачено", f"{total_spent:,} ₽")
+                        st.metric("💰 Всего потрачено", f"{profile.total_spent:,} ₽")
                     
                     with col3:
-                        avg_spent = total_spent / total_visits if total_visits > 0 else 0
-                        st.metric("💳 Средний чек", f"{avg_spent:.0f} ₽")
+                        st.metric("💳 Средний чек", f"{profile.average_check:.0f} ₽")
+                    
+                    st.caption(f"Первое посещение: {profile.first_visit:%Y-%m-%d} · "
+                               f"последнее: {profile.last_visit:%Y-%m-%d}")
                     
                     st.markdown("---")
                     
-                    # История посещений
+                    # История посещений - одной таблицей, постранично
                     st.subheader("📅 История посещений")
-                    for _, visit in client_history.iterrows():
-                        with st.container():
-                            col1, col2, col3 = st.columns([2, 1, 1])
-                            with col1:
-                                st.write(f"**{visit['Дата'][:16]}**")
-                            with col2:
-                                st.write(f"**{visit['Услуга']}**")
-                            with col3:
-                                st.write(f"**{visit['Цена']} ₽**")
-                            
-                            if visit['Направление'] == 'Учеба' and visit['Кто_пригласил']:
-                                st.write(f"Пригласил: {visit['Кто_пригласил']}")
-                            
-                            st.markdown("---")
+                    visits_page_number = st.number_input(
+                        "Страница", 1, page_count(profile.visits, HISTORY_PAGE_SIZE), 1)
+                    with metrics.stage("client_history"):
+                        visits_page = profiles.visits_page(client_id, visits_page_number - 1, HISTORY_PAGE_SIZE)
+                    st.dataframe(
+                        visits_page[["Дата", "Направление", "Услуга", "Цена", "Кто_пригласил"]],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
                 else:
                     st.info("Клиент не найден в базе данных")
+        elif client_query:
+            st.info("🔎 Клиенты не найдены")
         else:
             st.info("📊 В базе данных пока нет клиентов")
     else:
         st.info("📊 Данные появятся здесь после добавления клиентов")
 
+# --- ДИАГНОСТИКА ---
+run_timings = metrics.finish_run()
+if run_profile is not None:
+    st.session_state["profile_report"] = run_profile.stop()
+metrics.write_prometheus(extra=store.write_stats.as_dict())
+
+st.sidebar.markdown("---")
+# --- ФОНОВЫЕ ЗАДАЧИ ---
+busy_jobs = scheduler.busy()
+if busy_jobs:
+    st.sidebar.caption("⏳ В фоне: " + ", ".join(job.title for job in busy_jobs))
+else:
+    st.sidebar.caption("✅ Фоновые задачи выполнены")
+with st.sidebar.expander("⚙️ Фоновые задачи"):
+    st.dataframe(pd.DataFrame(scheduler.status()), hide_index=True, use_container_width=True)
+
+if st.sidebar.checkbox("🛠 Диагностика"):
+    st.sidebar.markdown("**⏱ Этапы запуска, мс**")
+    st.sidebar.dataframe(
+        pd.DataFrame({"Этап": list(run_timings), "мс": [round(t * 1000, 1) for t in run_timings.values()]}),
+        hide_index=True, use_container_width=True,
+    )
+    counters = dict(metrics.counters)
+    st.sidebar.markdown(
+        f"📥 Прочитано: {counters.get('rows_read', 0):,} строк, {counters.get('bytes_read', 0):,} байт  \n"
+        f"📤 Записано: {counters.get('rows_written', 0):,} строк, {counters.get('bytes_written', 0):,} байт  \n"
+        + (f"🗂 Строк в памяти: {len(df):,}" if df is not None else "🗂 База не загружена: итоги из партиций")
+    )
+    for cache, (hits, misses) in metrics.cache.items():
+        st.sidebar.markdown(f"🎯 Кэш {cache}: {hits} попаданий / {misses} промахов")
+    write_stats = store.write_stats
+    if write_stats.writes:
+        st.sidebar.markdown(
+            f"🔒 Записей: {write_stats.writes}, ожидание блокировки до {write_stats.lock_wait_max * 1000:.1f} мс, "
+            f"запись до {write_stats.write_max * 1000:.1f} мс"
+        )
+    if st.sidebar.button("🔬 Профилировать следующий запуск", use_container_width=True):
+        st.session_state["profile_next_run"] = True
+        st.rerun()
+    if "profile_report" in st.session_state:
+        with st.sidebar.expander("Профиль cProfile"):
+            st.code(st.session_state["profile_report"])
+
 # --- JavaScript для автоматического скрытия сайдбара на телефоне ---
 if is_mobile:
     st.markdown("""
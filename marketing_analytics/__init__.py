@@ -0,0 +1,92 @@
+"""Ядро учета посещений: хранилище, сводки и аналитика без Streamlit.
+
+Подмодули (и вместе с ними pandas, numpy, pyarrow) импортируются при первом
+обращении к имени, поэтому ``import marketing_analytics`` почти ничего не
+стоит - пакетным заданиям и сервисам не нужно платить за то, чем они не
+пользуются.
+"""
+import importlib
+
+# имя -> подмодуль, где оно определено
+_EXPORTS = {
+    # core
+    "append_visit": "core",
+    "create_client_id": "core",
+    "delete_visits": "core",
+    "get_client_history": "core",
+    "load_data": "core",
+    "save_data": "core",
+    # storage
+    "get_store": "storage",
+    "day_slice": "storage",
+    "month_slice": "storage",
+    "time_slice": "storage",
+    # контакты рассылки
+    "contacts_path": "contacts",
+    "get_contact_store": "contacts",
+    # stats
+    "DIRECTIONS": "stats",
+    "DIRECTION_ICONS": "stats",
+    "SERVICE_PRICES": "stats",
+    "available_months": "stats",
+    "get_month_stats": "stats",
+    "get_today_stats": "stats",
+    # производные структуры
+    "get_cohorts": "cohorts",
+    "get_contact_name_index": "name_index",
+    "get_name_index": "name_index",
+    "search_names": "name_index",
+    "get_profiles": "profiles",
+    "get_referral_graph": "referrals",
+    "get_period_summaries": "rollups",
+    "get_rollups": "rollups",
+    # запросы страницы Аналитика
+    "FilterSpec": "query",
+    "get_query_engine": "query",
+    # идентичность клиентов
+    "create_contact_id": "identity",
+    "get_identity_index": "identity",
+    # страницы и выгрузка
+    "EXPORT_FORMATS": "export",
+    "export_file": "export",
+    "PAGE_SIZES": "paging",
+    "page_count": "paging",
+    "page_slice": "paging",
+    # импорт
+    "import_visits": "importer",
+    "read_table": "importer",
+    # инструментация
+    "RunProfile": "instrumentation",
+    "metrics": "instrumentation",
+    # HTTP API
+    "ApiClient": "api",
+    "create_app": "api",
+    # фоновые задачи
+    "get_scheduler": "scheduler",
+    # миграции
+    "migrate": "migrations",
+    "pending_migrations": "migrations",
+}
+
+_SUBMODULES = {
+    "api", "bench", "cohorts", "contacts", "core", "export", "identity", "importer", "instrumentation",
+    "migrations", "name_index", "paging", "profiles", "query", "referrals", "rollups", "scheduler",
+    "stats", "storage", "synthetic",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _SUBMODULES)
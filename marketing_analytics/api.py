@@ -0,0 +1,290 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from .importer import import_visits
+from .migrations import pending_migrations
+from .profiles import get_profiles
+from .rollups import get_rollups
+from .scheduler import get_scheduler
+from .stats import get_month_stats, get_today_stats
+from .storage import DB_PATH, get_store
+
+# --- HTTP API ---
+# Небольшой WSGI-сервис поверх того же хранилища и тех же сводок, что и
+# страница: статистика дня и месяца, история клиента, прием посещений пачкой.
+# Ответы на GET кэшируются по (путь, параметры, отпечаток файлов базы); ETag -
+# хэш того же отпечатка, поэтому If-None-Match отвечает 304 без пересчета, а
+# после перезапуска или в другом процессе API ETag не меняется, пока не
+# изменятся файлы. Приложение - обычная
+# WSGI-функция, в тестах ее вызывает ApiClient без сети.
+# Запуск: python -m marketing_analytics.api [--host 127.0.0.1] [--port 8502]
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+CACHE_SIZE = 256
+HISTORY_PAGE_SIZE = 50
+MAX_BODY_BYTES = 10 * 1024 * 1024
+# Если задан, запись (POST) требует заголовок Authorization: Bearer <токен>
+API_TOKEN = os.environ.get("MARKETING_API_TOKEN", "")
+
+STATUS_TEXT = {
+    200: "200 OK",
+    201: "201 Created",
+    304: "304 Not Modified",
+    400: "400 Bad Request",
+    401: "401 Unauthorized",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    413: "413 Payload Too Large",
+    503: "503 Service Unavailable",
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def json_value(value):
+    """Значения pandas/numpy -> типы JSON"""
+    if value is None:
+        return None
+    if hasattr(value, "strftime"):
+        return None if value != value else value.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def frame_records(df):
+    return [{column: json_value(value) for column, value in zip(df.columns, row)}
+            for row in df.itertuples(index=False)]
+
+
+class ApiApp:
+    """WSGI-приложение API поверх хранилища посещений"""
+
+    def __init__(self, store, token=API_TOKEN, cache_size=CACHE_SIZE):
+        self.store = store
+        self.token = token
+        self.cache_size = cache_size
+        self.rollups = get_rollups(store)
+        self.profiles = get_profiles(store)
+        # Компакция после приема посещений - в фоне, как и в приложении
+        self.scheduler = get_scheduler(store)
+        self._responses = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.routes = {
+            "/api/today": self.today,
+            "/api/month": self.month,
+        }
+
+    # --- ОБРАБОТЧИКИ ---
+    def today(self, query):
+        day = datetime.now().strftime("%Y-%m-%d")
+        clients, visits, income, salary = get_today_stats(self.rollups)
+        return {"date": day, "clients": clients, "visits": visits, "income": income, "salary": salary}
+
+    def month(self, query):
+        year_month = query.get("month") or datetime.now().strftime("%Y-%m")
+        try:
+            datetime.strptime(year_month, "%Y-%m")
+        except ValueError:
+            raise ApiError(400, "month - в формате ГГГГ-ММ")
+        stats = get_month_stats(self.rollups, year_month)
+        return {
+            "month": year_month,
+            "clients": stats["all_clients"],
+            "income": stats["all_income"],
+            "by_direction": frame_records(stats["by_direction"]),
+        }
+
+    def history(self, query, client_id):
+        page = self._int_param(query, "page", 0)
+        page_size = min(self._int_param(query, "page_size", HISTORY_PAGE_SIZE), 1000)
+        profile = self.profiles.get(client_id)
+        if profile is None:
+            raise ApiError(404, "Клиент не найден")
+        return {
+            "client_id": client_id,
+            "name": profile.name,
+            "phone": profile.phone,
+            "visits": profile.visits,
+            "total_spent": profile.total_spent,
+            "first_visit": json_value(profile.first_visit),
+            "last_visit": json_value(profile.last_visit),
+            "page": page,
+            "page_size": page_size,
+            "items": frame_records(self.profiles.visits_page(client_id, page, page_size)),
+        }
+
+    def ingest(self, body):
+        """Посещение (объект) или пачка (список) - через проверки пакетного импорта"""
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            raise ApiError(400, "Тело запроса - не JSON")
+        if isinstance(payload, dict):
+            payload = [payload]
+        if not isinstance(payload, list) or not payload or not all(isinstance(item, dict) for item in payload):
+            raise ApiError(400, "Ожидается посещение или список посещений")
+        raw = pd.DataFrame(payload).astype(str).replace({"None": "", "nan": ""})
+        try:
+            imported, rejected = import_visits(raw, self.store, compact=False)
+        except ValueError as error:
+            raise ApiError(400, str(error))
+        return {"imported": imported, "rejected": frame_records(rejected)}
+
+    @staticmethod
+    def _int_param(query, name, default):
+        try:
+            value = int(query.get(name, default))
+        except ValueError:
+            raise ApiError(400, f"{name} - целое число")
+        if value < 0:
+            raise ApiError(400, f"{name} - не меньше нуля")
+        return value
+
+    # --- КЭШ ОТВЕТОВ ---
+    def _cached(self, key, version, build):
+        with self._lock:
+            if self._version != version:
+                # Данные изменились - старые ответы больше не понадобятся
+                self._responses.clear()
+                self._version = version
+            body = self._responses.get(key)
+            if body is not None:
+                self._responses.move_to_end(key)
+                return body
+        body = json.dumps(build(), ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            self._responses[key] = body
+            if len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+        return body
+
+    # --- WSGI ---
+    def __call__(self, environ, start_response):
+        try:
+            status, headers, body = self._handle(environ)
+        except ApiError as error:
+            status, headers = error.status, []
+            body = json.dumps({"error": str(error)}, ensure_ascii=False).encode('utf-8')
+        headers = [("Content-Type", "application/json; charset=utf-8"),
+                   ("Content-Length", str(len(body)))] + headers
+        start_response(STATUS_TEXT[status], headers)
+        return [body]
+
+    def _handle(self, environ):
+        method = environ.get("REQUEST_METHOD", "GET")
+        path = environ.get("PATH_INFO", "") or "/"
+        query = {name: values[-1] for name, values in parse_qs(environ.get("QUERY_STRING", "")).items()}
+
+        if path == "/api/visits":
+            if method != "POST":
+                raise ApiError(405, "Только POST")
+            if self.token and environ.get("HTTP_AUTHORIZATION", "") != f"Bearer {self.token}":
+                raise ApiError(401, "Нужен токен API")
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ApiError(413, "Слишком большой запрос")
+            if pending_migrations(self.store.path):
+                # Старую схему сначала нужно обновить - иначе запись может потеряться при перезаписи
+                raise ApiError(503, "База данных ожидает миграции, запись временно недоступна")
+            result = self.ingest(environ["wsgi.input"].read(length))
+            return 201, [], json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+        if method not in ("GET", "HEAD"):
+            raise ApiError(405, "Только GET")
+        parts = path.strip("/").split("/")
+        if len(parts) == 4 and parts[:2] == ["api", "clients"] and parts[3] == "visits":
+            handler = lambda query: self.history(query, parts[2])
+        elif path in self.routes:
+            handler = self.routes[path]
+        else:
+            raise ApiError(404, "Нет такого адреса")
+
+        # Отпечаток файлов базы (и день - для «сегодня») определяет и ключ кэша, и ETag;
+        # в отличие от store.version он не сбрасывается при перезапуске процесса
+        self.store.data()
+        version = self.store.signature
+        resource = f"{path}?{sorted(query.items())}@{datetime.now():%Y-%m-%d}"
+        etag = '"' + hashlib.blake2b(repr((version, resource)).encode(), digest_size=8).hexdigest() + '"'
+        headers = [("ETag", etag), ("Cache-Control", "no-cache")]
+        if environ.get("HTTP_IF_NONE_MATCH") == etag:
+            return 304, headers, b""
+        body = self._cached(resource, version, lambda: handler(query))
+        return 200, headers, b"" if method == "HEAD" else body
+
+
+def create_app(store=None, token=API_TOKEN):
+    return ApiApp(store or get_store(), token)
+
+
+class ApiClient:
+    """Вызывает WSGI-приложение в том же процессе - для тестов и скриптов"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body=None, headers=None):
+        from wsgiref.util import setup_testing_defaults
+
+        path, _, query = path.partition("?")
+        data = b"" if body is None else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "CONTENT_LENGTH": str(len(data)),
+            "wsgi.input": io.BytesIO(data),
+        }
+        for name, value in (headers or {}).items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, response_headers):
+            response["status"] = int(status.split()[0])
+            response["headers"] = dict(response_headers)
+
+        content = b"".join(self.app(environ, start_response))
+        return response["status"], response["headers"], json.loads(content) if content else None
+
+    def get(self, path, headers=None):
+        return self.request("GET", path, headers=headers)
+
+    def post(self, path, body, headers=None):
+        return self.request("POST", path, body, headers)
+
+
+if __name__ == "__main__":
+    import argparse
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    parser = argparse.ArgumentParser(description="HTTP API статистики и посещений")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", default=DB_PATH, help="файл базы")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, create_app(get_store(args.db)),
+                         server_class=ThreadingWSGIServer)
+    print(f"API: http://{args.host}:{args.port}/api/today")
+    server.serve_forever()
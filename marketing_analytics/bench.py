@@ -0,0 +1,160 @@
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .cohorts import cohort_report
+from .query import FilterSpec, QueryColumns, run_query
+from .rollups import PeriodSummaries, Rollups
+from .stats import get_month_stats, get_today_stats
+from .storage import FORMAT_SUFFIXES, store_class, write_frame
+from .synthetic import generate_visits, parse_size
+
+# --- ЗАМЕРЫ ---
+# Время и пиковая память основных операций на синтетической базе, без Streamlit.
+# Каждая операция выполняется repeat раз (перцентили времени), затем еще раз под
+# tracemalloc (пик выделенной памяти). Результат можно сохранить как базовую
+# линию и сравнивать с ней следующие прогоны: замедление p50 больше чем в
+# REGRESSION_RATIO раз считается регрессией.
+
+DEFAULT_SIZES = ["10k", "100k"]
+DEFAULT_REPEAT = 5
+REGRESSION_RATIO = 1.5
+PERCENTILES = [50, 90, 99]
+
+
+def open_store(path):
+    """Новое хранилище без общего кэша процесса - чтобы загрузка была холодной"""
+    return store_class(path)(path)
+
+
+def analytics_filter(df, columns):
+    """Фильтры страницы Аналитика: период, направления, услуги, цена, итоги - без кэша результатов"""
+    last_day = df['Дата'].iloc[-1].normalize()
+    spec = FilterSpec(
+        start=last_day - np.timedelta64(90, 'D'),
+        end=last_day + np.timedelta64(1, 'D'),
+        directions=df['Направление'].cat.categories[:2],
+        services=['Стрижка', 'Стрижка+борода'],
+        min_price=500,
+        max_price=1500,
+    )
+    result = run_query(df, columns, spec)
+    return result.revenue, result.clients, result.services, result.avg_check
+
+
+def operations(path, df):
+    """(имя, функция) в порядке выполнения; функции разделяют одно хранилище"""
+    store = open_store(path)
+    store.data()
+    rollups = Rollups()
+    rollups.rebuild(df)
+    columns = QueryColumns(df)
+    month = df['Дата'].iloc[-1].strftime('%Y-%m')
+    clients = df['client_id'].unique()
+    rng = np.random.default_rng(0)
+    visit = df.iloc[-1].to_dict()
+
+    def append():
+        visit['visit_id'] = f"bench{rng.integers(1 << 62):x}"
+        store.append(dict(visit, Дата=visit['Дата'].strftime('%Y-%m-%d %H:%M:%S')))
+
+    return [
+        ("load_data", lambda: open_store(path).data()),
+        ("rollups_rebuild", lambda: Rollups().rebuild(df)),
+        ("get_today_stats", lambda: get_today_stats(rollups)),
+        ("get_month_stats", lambda: get_month_stats(rollups, month)),
+        # Итоги месяца с холодного старта: помесячная база читает одну партицию
+        ("cold_month_stats", lambda: get_month_stats(PeriodSummaries(open_store(path)), month)),
+        ("get_client_history", lambda: store.client_history(clients[rng.integers(len(clients))])),
+        ("analytics_filter", lambda: analytics_filter(df, columns)),
+        ("cohort_report", lambda: cohort_report(df)),
+        ("append_visit", append),
+        # Новый объект вместо кэшированного - полная перезапись снимка
+        ("save_data", lambda: store.compact(store.data().iloc[:])),
+    ]
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {f"p{q}_ms": round(float(np.percentile(timings, q)) * 1000, 3) for q in PERCENTILES}
+    result["peak_mb"] = round(peak / 2 ** 20, 2)
+    return result
+
+
+def run(sizes=DEFAULT_SIZES, fmt="csv", repeat=DEFAULT_REPEAT, seed=0, progress=print):
+    """{размер: {операция: {p50_ms, p90_ms, p99_ms, peak_mb}}}"""
+    results = {}
+    for size in sizes:
+        df = generate_visits(parse_size(size), seed)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "marketing_database" + FORMAT_SUFFIXES[fmt])
+            write_frame(df, path)
+            results[size] = {}
+            for name, func in operations(path, df):
+                results[size][name] = measure(func, repeat)
+                if progress:
+                    progress(f"{size:>6} {name:<20} " + "  ".join(
+                        f"{key}={value}" for key, value in results[size][name].items()))
+    return results
+
+
+def save_baseline(results, path, fmt):
+    payload = {
+        "format": fmt,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w", encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def compare(results, baseline_path, ratio=REGRESSION_RATIO):
+    """Операции, у которых p50 вырос больше чем в ratio раз: (размер, операция, было, стало)"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for size, by_operation in results.items():
+        for name, current in by_operation.items():
+            before = baseline.get(size, {}).get(name)
+            if before and current["p50_ms"] > before["p50_ms"] * ratio:
+                regressions.append((size, name, before["p50_ms"], current["p50_ms"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Замеры основных операций на синтетических данных")
+    parser.add_argument("sizes", nargs="*", default=DEFAULT_SIZES, help="10k, 100k, 1m, 10m или число строк")
+    parser.add_argument("--format", choices=list(FORMAT_SUFFIXES), default="csv")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="сохранить результаты как базовую линию (JSON)")
+    parser.add_argument("--compare", help="сравнить с базовой линией (JSON)")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.format, args.repeat, args.seed)
+    if args.save:
+        save_baseline(results, args.save, args.format)
+    if args.compare:
+        regressions = compare(results, args.compare)
+        for size, name, before, after in regressions:
+            print(f"РЕГРЕССИЯ {size} {name}: p50 {before} -> {after} мс")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- КОГОРТЫ ---
+# Когорта - клиенты, впервые пришедшие в одном месяце, в разрезе направления
+# первого посещения. Для каждой когорты считаются удержание (доля клиентов,
+# вернувшихся через k месяцев) и накопленная выручка на клиента (LTV).
+# Все вычисления - групповые операции над целыми колонками, без циклов по
+# клиентам. Отчет кэшируется до следующего изменения данных (store.version).
+
+ALL_DIRECTIONS = "Все направления"
+
+
+def month_number(dates):
+    """Номер месяца от начала эпохи - чтобы разница месяцев была вычитанием"""
+    return (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+
+
+def month_label(number):
+    return f"{number // 12}-{number % 12 + 1:02d}"
+
+
+class CohortReport:
+    """Размеры когорт, удержание и LTV; строки - (Когорта, Направление), колонки - месяц от прихода"""
+
+    def __init__(self, sizes, retention, ltv):
+        self.sizes = sizes
+        self.retention = retention
+        self.ltv = ltv
+
+    @property
+    def empty(self):
+        return self.sizes.empty
+
+
+def cohort_report(df, by_direction=True):
+    visits = df[['client_id', 'Дата', 'Направление', 'Цена']]
+    visits = visits[visits['Дата'].notna()]
+    if visits.empty:
+        empty = pd.DataFrame()
+        return CohortReport(pd.Series(dtype='int64'), empty, empty)
+
+    month = month_number(visits['Дата'])
+    first_month = month.min()
+    span = month.max() - first_month + 1
+    month = month - first_month
+
+    # Строки упорядочены по времени, а factorize нумерует клиентов в порядке
+    # появления: первое посещение клиента - строка, где номер превысил все предыдущие
+    clients, _ = pd.factorize(visits['client_id'])
+    first_rows = np.flatnonzero(clients > np.maximum.accumulate(np.r_[-1, clients[:-1]]))
+    if by_direction:
+        directions, direction_names = pd.factorize(visits['Направление'])
+        direction_names = pd.Index(np.asarray(direction_names, dtype=object))
+    else:
+        directions, direction_names = np.zeros(len(visits), dtype=np.intp), pd.Index([ALL_DIRECTIONS])
+
+    # Ключ когорты клиента: (месяц прихода, направление первого посещения)
+    client_cohort = month[first_rows] * len(direction_names) + directions[first_rows]
+    client_month = month[first_rows]
+    offset = month - client_month[clients]
+    cell = client_cohort[clients] * span + offset
+    cells = len(direction_names) * span * span
+
+    sizes = np.bincount(client_cohort, minlength=len(direction_names) * span)
+    first_in_month = np.unique(clients.astype(np.int64) * span + offset, return_index=True)[1]
+    active = np.bincount(cell[first_in_month], minlength=cells).reshape(-1, span)
+    revenue = np.bincount(cell, weights=visits['Цена'].to_numpy(), minlength=cells).reshape(-1, span)
+
+    present = np.flatnonzero(sizes)
+    cohort_month, direction = np.divmod(present, len(direction_names))
+    index = pd.MultiIndex.from_arrays(
+        [[month_label(first_month + number) for number in cohort_month], direction_names[direction]],
+        names=['Когорта', 'Направление'])
+    columns = pd.RangeIndex(span, name='Месяц')
+
+    # Месяцы, которые для когорты еще не наступили, - пропуски, а не нули
+    future = cohort_month[:, None] + np.arange(span)[None, :] >= span
+    per_client = sizes[present][:, None]
+    retention = np.where(future, np.nan, active[present] / per_client)
+    ltv = np.where(future, np.nan, revenue[present].cumsum(axis=1) / per_client)
+    return CohortReport(
+        pd.Series(sizes[present], index=index, name='Клиентов'),
+        pd.DataFrame(retention, index=index, columns=columns),
+        pd.DataFrame(ltv, index=index, columns=columns),
+    )
+
+
+class Cohorts:
+    """Отчет по когортам, пересчитываемый только при смене версии данных"""
+
+    def __init__(self, store):
+        self.store = store
+        self._reports = {}  # by_direction -> (версия данных, отчет)
+        self._lock = threading.Lock()
+
+    def report(self, by_direction=True):
+        df = self.store.data()
+        version = self.store.version
+        with self._lock:
+            cached = self._reports.get(by_direction)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Считаем без блокировки - latest() не ждет фоновый пересчет
+        report = cohort_report(df, by_direction)
+        with self._lock:
+            self._reports[by_direction] = (version, report)
+        return report
+
+    def latest(self, by_direction=True):
+        """Последний готовый отчет без пересчета и признак, что он по текущим данным"""
+        with self._lock:
+            cached = self._reports.get(by_direction)
+        if cached is None:
+            return None, False
+        return cached[1], cached[0] == self.store.version
+
+
+_cohorts = {}
+_cohorts_lock = threading.Lock()
+
+
+def get_cohorts(store):
+    """Кэш когорт для хранилища - один на процесс"""
+    with _cohorts_lock:
+        cohorts = _cohorts.get(store.path)
+        if cohorts is None:
+            cohorts = _cohorts[store.path] = Cohorts(store)
+        return cohorts
@@ -0,0 +1,234 @@
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+from .export import SPOOL_MAX_BYTES
+from .instrumentation import metrics
+from .storage import DB_PATH, LOCK_SUFFIX, LOG_SUFFIX, file_lock, write_frame_atomic
+
+# --- КОНТАКТЫ РАССЫЛКИ ---
+# Контакты хранятся отдельно от посещений: снимок marketing_database.contacts.csv
+# и журнал изменений рядом с ним, в памяти - словарь client_id -> контакт.
+# Добавление или правка контакта - одна строка журнала и одна операция со
+# словарем, удаление пачки - одна запись со списком client_id. Аналитика
+# посещений контактов не видит и отфильтровывать их не должна.
+
+CONTACTS_SUFFIX = ".contacts.csv"
+CONTACT_COLUMNS = ["client_id", "Дата", "Имя", "Место_учебы", "Ссылка_VK", "Согласие_рассылка"]
+CONSENT_YES = "Да"
+COMPACT_THRESHOLD = 1000
+EXPORT_CHUNK_ROWS = 10_000
+
+
+def contacts_path(path=DB_PATH):
+    return os.path.splitext(path)[0] + CONTACTS_SUFFIX
+
+
+def contact_value(value):
+    """Значение поля контакта строкой; пустые ячейки (None, NaN) - пустая строка"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    return str(value)
+
+
+class ContactStore:
+    """Контакты рассылки по client_id с согласием на рассылку"""
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD):
+        self.path = path
+        stem = os.path.splitext(path)[0]
+        self.log_path = stem + LOG_SUFFIX
+        self.lock_path = stem + LOCK_SUFFIX
+        self.compact_threshold = compact_threshold
+        self.log_records = 0
+        self.version = 0
+        self._contacts = None
+        self._frame = None
+        self._signature = None
+        self._lock = threading.RLock()
+
+    # --- ЧТЕНИЕ ---
+    def _file_signature(self):
+        signature = []
+        for path in (self.path, self.log_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def load(self):
+        try:
+            base = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+            contacts = {row["client_id"]: row for row in base.reindex(columns=CONTACT_COLUMNS, fill_value='')
+                        .to_dict('records')}
+        except FileNotFoundError:
+            contacts = {}
+        records = 0
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после сбоя - пропускаем
+                        continue
+                    records += 1
+                    if record["op"] == "upsert":
+                        for contact in record["contacts"]:
+                            contacts[contact["client_id"]] = contact
+                    elif record["op"] == "del":
+                        for client_id in record["client_ids"]:
+                            contacts.pop(client_id, None)
+        except FileNotFoundError:
+            pass
+        self.log_records = records
+        return contacts
+
+    def _refresh(self):
+        signature = self._file_signature()
+        current = self._contacts is not None and signature == self._signature
+        metrics.cache_hit("contacts", current)
+        if not current:
+            self._contacts = self.load()
+            self._signature = signature
+            self._frame = None
+            self.version += 1
+
+    def contacts(self):
+        """Словарь client_id -> контакт; общий для сессий, изменять на месте нельзя"""
+        with self._lock:
+            self._refresh()
+            return self._contacts
+
+    def get(self, client_id):
+        return self.contacts().get(client_id)
+
+    def frame(self):
+        """Все контакты таблицей (строится один раз на версию)"""
+        with self._lock:
+            self._refresh()
+            if self._frame is None:
+                self._frame = pd.DataFrame(list(self._contacts.values()), columns=CONTACT_COLUMNS)
+            return self._frame
+
+    # --- ЗАПИСЬ ---
+    def _write(self, record, apply):
+        with self._lock, file_lock(self.lock_path):
+            # Сначала подтягиваем изменения других процессов, затем дописываем свое
+            self._refresh()
+            data = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+            with open(self.log_path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            metrics.add("bytes_written", len(data))
+            apply(self._contacts)
+            self.log_records += 1
+            self._signature = self._file_signature()
+            self._frame = None
+            self.version += 1
+        if self.log_records >= self.compact_threshold:
+            self.compact()
+
+    def upsert_many(self, contacts):
+        """Добавляет или обновляет контакты (ключ - client_id) одной записью журнала"""
+        contacts = [{column: contact_value(contact.get(column)) for column in CONTACT_COLUMNS}
+                    for contact in contacts]
+        if not contacts:
+            return
+
+        def apply(store):
+            for contact in contacts:
+                store[contact["client_id"]] = contact
+
+        self._write({"op": "upsert", "contacts": contacts}, apply)
+
+    def upsert(self, contact):
+        self.upsert_many([contact])
+
+    def delete(self, client_ids):
+        """Удаляет контакты по множеству client_id"""
+        client_ids = sorted(set(client_ids))
+        if not client_ids:
+            return
+
+        def apply(store):
+            for client_id in client_ids:
+                store.pop(client_id, None)
+
+        self._write({"op": "del", "client_ids": client_ids}, apply)
+
+    def compact(self):
+        """Сворачивает журнал в снимок"""
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            frame = pd.DataFrame(list(self._contacts.values()), columns=CONTACT_COLUMNS)
+            write_frame_atomic(frame, self.path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.log_records = 0
+            self._signature = self._file_signature()
+
+    def rekey(self, client_ids_for):
+        """Пересчитывает client_id всех контактов функцией над таблицей контактов.
+
+        Контакты, получившие один ключ, сливаются - остается последний по Дате.
+        """
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            if not self._contacts:
+                return
+            frame = pd.DataFrame(list(self._contacts.values()), columns=CONTACT_COLUMNS)
+            frame['client_id'] = client_ids_for(frame)
+            frame = frame.sort_values('Дата', kind='stable').drop_duplicates('client_id', keep='last')
+            write_frame_atomic(frame, self.path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.log_records = 0
+            self._contacts = {row["client_id"]: row for row in frame.to_dict('records')}
+            self._signature = self._file_signature()
+            self._frame = None
+            self.version += 1
+
+    # --- ВЫГРУЗКА ---
+    def iter_consenting(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Контакты с согласием на рассылку порциями по chunk_rows - для задания отправки"""
+        consenting = [contact for contact in self.contacts().values()
+                      if contact["Согласие_рассылка"] == CONSENT_YES]
+        for start in range(0, len(consenting), chunk_rows):
+            yield pd.DataFrame(consenting[start:start + chunk_rows], columns=CONTACT_COLUMNS)
+
+    def export_consenting(self, out, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Пишет CSV контактов с согласием в бинарный файловый объект out"""
+        header = True
+        for chunk in self.iter_consenting(chunk_rows):
+            out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+            header = False
+        if header:
+            out.write(pd.DataFrame(columns=CONTACT_COLUMNS).to_csv(index=False).encode('utf-8'))
+
+    def export_file(self):
+        """Готовая выгрузка контактов с согласием во временном файле - для st.download_button(data=...)"""
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self.export_consenting(out)
+        out.seek(0)
+        return out
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_contact_store(path=None):
+    """Хранилище контактов рядом с базой посещений - одно на процесс"""
+    path = path or contacts_path()
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ContactStore(path)
+        return store
@@ -0,0 +1,58 @@
+# --- ОПЕРАЦИИ НАД БАЗОЙ ---
+# То, что раньше жило в самом скрипте Streamlit: загрузка, сохранение,
+# добавление и удаление посещений, история клиента. Без store берется общее
+# хранилище процесса (get_store()), так что страница, пакетные задания и
+# замеры работают с одним и тем же кэшем. Хранилище (а с ним и pandas)
+# импортируется только при первой операции над базой.
+
+
+def _store(store):
+    if store is None:
+        from .storage import get_store
+
+        store = get_store()
+    return store
+
+
+def create_client_id(name, phone):
+    """client_id по нормализованным имени и телефону - 64-битный ключ в hex"""
+    from .identity import client_ids_for
+
+    return str(client_ids_for([name], [phone])[0])
+
+
+def load_data(store=None, compact=True):
+    """Берет данные из общего кэша процесса - без разбора файла на каждом rerun.
+
+    compact=False - журнал сворачивает кто-то другой (фоновая задача приложения).
+    """
+    store = _store(store)
+    df = store.data()
+    if compact and store.needs_compaction():
+        # Журнал разросся - сворачиваем его в снимок, пока данные уже в памяти
+        store.compact(df)
+    return df
+
+
+def save_data(df, store=None):
+    """Полная перезапись базы (компакция журнала)"""
+    _store(store).compact(df)
+
+
+def append_visit(visit, store=None):
+    """Дописывает одно посещение в журнал; возвращает обновленный DataFrame"""
+    store = _store(store)
+    store.append(visit)
+    return store.data()
+
+
+def delete_visits(df, mask, store=None):
+    """Удаляет посещения по маске через tombstone-записи в журнале"""
+    store = _store(store)
+    store.delete(df.loc[mask, 'visit_id'].tolist())
+    return store.data()
+
+
+def get_client_history(client_id, store=None):
+    """Посещения клиента, новые сверху"""
+    return _store(store).client_history(client_id)
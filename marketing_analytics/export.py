@@ -0,0 +1,89 @@
+import gzip
+import tempfile
+
+# --- ЭКСПОРТ ---
+# Файл выгрузки собирается порциями и только по запросу (кнопка скачивания
+# или ночная выгрузка из командной строки). В памяти одновременно держится
+# одна порция строк, остальное уходит во временный файл на диске.
+# CSV побайтно совпадает с DataFrame.to_csv(index=False).
+
+CHUNK_ROWS = 10_000
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# формат: (подпись, расширение файла, MIME-тип)
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_csv(df, chunk_rows=CHUNK_ROWS):
+    """CSV порциями по chunk_rows строк, уже в байтах"""
+    if df.empty:
+        yield df.to_csv(index=False).encode('utf-8')
+        return
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=start == 0).encode('utf-8')
+
+
+def write_parquet(df, out, chunk_rows=CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            table = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_export(df, out, fmt="csv", chunk_rows=CHUNK_ROWS):
+    """Пишет выгрузку в бинарный файловый объект out"""
+    if fmt == "csv":
+        for chunk in iter_csv(df, chunk_rows):
+            out.write(chunk)
+    elif fmt == "csv.gz":
+        # mtime=0 - одинаковые данные дают одинаковый архив
+        with gzip.GzipFile(fileobj=out, mode="wb", mtime=0) as archive:
+            for chunk in iter_csv(df, chunk_rows):
+                archive.write(chunk)
+    elif fmt == "parquet":
+        write_parquet(df, out, chunk_rows)
+    else:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+
+def export_file(df, fmt="csv"):
+    """Готовая выгрузка во временном файле - для st.download_button(data=...)"""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    write_export(df, out, fmt)
+    out.seek(0)
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    from .storage import get_store, month_slice
+
+    parser = argparse.ArgumentParser(description="Выгрузка базы посещений")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--month", help="только указанный месяц, YYYY-MM")
+    parser.add_argument("--output", help="файл выгрузки (по умолчанию marketing_data_ДАТА.*)")
+    args = parser.parse_args()
+
+    df = get_store().data()
+    if args.month:
+        df = month_slice(df, args.month)
+    output = args.output or f"marketing_data_{datetime.now().strftime('%Y%m%d')}{EXPORT_FORMATS[args.format][1]}"
+    with open(output, "wb") as f:
+        write_export(df, f, args.format)
+    print(f"{output}: {len(df)} строк")
@@ -0,0 +1,223 @@
+import binascii
+import secrets
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- ИДЕНТИЧНОСТЬ КЛИЕНТОВ ---
+# Клиент определяется нормализованными именем и телефоном: регистр, «ё» и
+# лишние пробелы в имени не важны, телефон сводится к цифрам в формате 7XXXXXXXXXX
+# («+7 900…», «8900…» и «900…» - один номер). Ключ клиента - 64-битный
+# некриптографический хэш (pd.util.hash_array) пары, client_id - тот же ключ в
+# виде 16 hex-символов, как у visit_id. Ключи считаются векторно для целых
+# колонок; в памяти держится словарь ключ -> клиент для проверки дублей за O(1).
+# Контакт рассылки без телефона определяется именем и ссылкой VK; без ссылки
+# однофамильцев не различить, и такой контакт получает собственный случайный ключ.
+
+SEPARATOR = "\x1f"
+
+
+def hex_ids(hashes):
+    """64-битные хэши -> строки из 16 hex-символов"""
+    hex_bytes = binascii.hexlify(np.asarray(hashes).astype('>u8').tobytes())
+    return np.frombuffer(hex_bytes, dtype='S16').astype(str)
+
+
+# --- НОРМАЛИЗАЦИЯ ---
+# Колонки нормализуются векторно, одиночные значения - теми же функциями,
+# поэтому ключ формы и ключ пакетной миграции всегда совпадают.
+def _text(values):
+    return pd.Series(np.asarray(values, dtype=object)).fillna("").astype(str)
+
+
+def normalize_names(names):
+    names = _text(names).str.lower().str.replace("ё", "е", regex=False).str.replace("\u00a0", " ", regex=False)
+    return names.str.replace(r"\s+", " ", regex=True).str.strip().to_numpy(dtype=object)
+
+
+def normalize_phones(phones):
+    """Цифры номера в виде 7XXXXXXXXXX: 8 в начале и номера без кода страны приводятся к 7"""
+    digits = _text(phones).str.replace(r"\D", "", regex=True)
+    length = digits.str.len()
+    digits = digits.where(~((length == 11) & digits.str.startswith("8")), "7" + digits.str[1:])
+    digits = digits.where(~((length == 10) & digits.str.startswith("9")), "7" + digits)
+    return digits.to_numpy(dtype=object)
+
+
+def normalize_vk_links(links):
+    links = _text(links).str.strip().str.lower()
+    links = links.str.replace(r"^(https?://)?(www\.|m\.)?", "", regex=True)
+    return links.str.rstrip("/").to_numpy(dtype=object)
+
+
+def normalize_name(name):
+    return normalize_names([name])[0]
+
+
+def normalize_phone(phone):
+    return normalize_phones([phone])[0]
+
+
+# --- КЛЮЧИ ---
+def identity_keys(names, other):
+    """uint64-ключи по колонке имен и второму, уже нормализованному признаку"""
+    return pd.util.hash_array(normalize_names(names) + SEPARATOR + np.asarray(other, dtype=object))
+
+
+def client_keys(names, phones):
+    return identity_keys(names, normalize_phones(phones))
+
+
+def client_ids_for(names, phones):
+    return hex_ids(client_keys(names, phones))
+
+
+def contact_ids_for(names, vk_links, own_ids):
+    """client_id контактов по имени и ссылке VK; контакт без ссылки сохраняет own_ids"""
+    links = normalize_vk_links(vk_links)
+    ids = hex_ids(identity_keys(names, "vk" + SEPARATOR + links))
+    return np.where(links == "", np.asarray(own_ids, dtype=object), ids.astype(object))
+
+
+def client_key(name, phone):
+    return int(client_keys([name], [phone])[0])
+
+
+def create_contact_id(name, vk_link):
+    """client_id контакта рассылки: однофамильцы различаются ссылкой VK, без нее - случайным ключом"""
+    return str(contact_ids_for([name], [vk_link], [secrets.token_hex(8)])[0])
+
+
+# --- СЛОВАРЬ КЛИЕНТОВ ---
+class KnownClient:
+    __slots__ = ("key", "client_id", "name", "phone", "visits")
+
+    def __init__(self, key, client_id, name, phone, visits=0):
+        self.key = key
+        self.client_id = client_id
+        self.name = name
+        self.phone = phone
+        self.visits = visits
+
+
+class IdentityIndex:
+    """Ключ клиента -> клиент; нормализованный телефон -> ключи клиентов"""
+
+    def __init__(self):
+        self.clients = {}
+        # Словарь телефонов нужен только подсказке формы - строится при первом обращении
+        self._phones = None
+        self._lock = threading.RLock()
+
+    # --- ОБНОВЛЕНИЕ ---
+    def _update(self, rows, sign):
+        if rows.empty:
+            return
+        # Группируем по client_id, ключ считаем по последней строке клиента -
+        # его актуальным имени и телефону
+        codes, client_ids = pd.factorize(rows['client_id'].fillna(''))
+        visits = np.bincount(codes, minlength=len(client_ids)).tolist()
+        last = len(codes) - 1 - np.unique(codes[::-1], return_index=True)[1]
+        names = rows['Имя'].iloc[last].to_numpy(dtype=object)
+        phones = rows['Телефон'].iloc[last].to_numpy(dtype=object)
+        keys = client_keys(names, phones).tolist()
+        client_ids = np.asarray(client_ids, dtype=object)
+        with self._lock:
+            if sign > 0 and not self.clients:
+                # Первое заполнение - одним словарем, если ключи не повторяются
+                self.clients = dict(zip(keys, map(KnownClient, keys, client_ids, names, phones, visits)))
+                if len(self.clients) == len(keys):
+                    # Словарь телефонов мог быть построен по пустому индексу - строим заново
+                    self._phones = None
+                    return
+                self.clients = {}
+            for key, client_id, name, phone, count in zip(keys, client_ids, names, phones, visits):
+                client = self.clients.get(key)
+                if client is None:
+                    if sign < 0:
+                        continue
+                    client = self.clients[key] = KnownClient(key, client_id, name, phone)
+                    self._add_phone(client)
+                elif sign > 0:
+                    if normalize_phone(client.phone) != normalize_phone(phone):
+                        self._remove_phone(client)
+                        client.phone = phone
+                        self._add_phone(client)
+                    client.name, client.phone = name, phone
+                client.visits += sign * count
+                if client.visits <= 0:
+                    del self.clients[key]
+                    self._remove_phone(client)
+
+    def _add_phone(self, client):
+        if self._phones is not None:
+            number = normalize_phone(client.phone)
+            if number:
+                self._phones.setdefault(number, set()).add(client.key)
+
+    def _remove_phone(self, client):
+        if self._phones is not None:
+            number = normalize_phone(client.phone)
+            owners = self._phones.get(number)
+            if owners is not None:
+                owners.discard(client.key)
+                if not owners:
+                    del self._phones[number]
+
+    def on_reload(self, df):
+        with self._lock:
+            self.clients = {}
+            self._phones = None
+            self._update(df, 1)
+
+    def on_append(self, rows):
+        self._update(rows, 1)
+
+    def on_delete(self, rows):
+        self._update(rows, -1)
+
+    # --- ПОИСК ---
+    def find(self, name, phone):
+        """Уже известный клиент с теми же нормализованными именем и телефоном или None"""
+        with self._lock:
+            return self.clients.get(client_key(name, phone))
+
+    def by_phone(self, phone):
+        """Клиенты с этим номером (после нормализации)"""
+        with self._lock:
+            if self._phones is None:
+                clients = list(self.clients.values())
+                self._phones = {}
+                numbers = normalize_phones([client.phone for client in clients])
+                for client, number in zip(clients, numbers):
+                    if number:
+                        self._phones.setdefault(number, set()).add(client.key)
+            keys = self._phones.get(normalize_phone(phone), ())
+            return [self.clients[key] for key in keys]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_identity_index(store):
+    """Словарь клиентов, подписанный на хранилище, - один на процесс"""
+    with _indexes_lock:
+        index = _indexes.get(store.path)
+        if index is None:
+            index = _indexes[store.path] = IdentityIndex()
+            store.subscribe(index)
+        return index
+
+
+if __name__ == "__main__":
+    from .storage import get_store
+
+    df = get_store().data()
+    ids = client_ids_for(df['Имя'], df['Телефон'])
+    merged = df['client_id'].nunique() - pd.unique(ids).size
+    print(f"Клиентов: {df['client_id'].nunique()}, после нормализации: {pd.unique(ids).size}, "
+          f"дублей: {merged}")
+    if merged:
+        print("Слить дубли: python -m marketing_analytics.migrations")
@@ -0,0 +1,154 @@
+import os
+
+import pandas as pd
+
+from .contacts import contacts_path, get_contact_store
+from .identity import client_ids_for, contact_ids_for
+from .migrations import visit_ids_for
+from .stats import DIRECTIONS, SERVICE_PRICES
+from .storage import COLUMNS, DATE_FORMAT, get_store
+
+# --- ПАКЕТНЫЙ ИМПОРТ ---
+# Загрузка старых посещений и контактов рассылки из CSV/XLSX. Файл проверяется
+# целыми колонками: направление, услуга и цена сверяются с прайсом, дата и
+# обязательные поля - с форматом базы. client_id и visit_id считаются для всей
+# пачки сразу; visit_id без явного значения - тот же хэш (Дата, Имя, Телефон),
+# что и в миграции, поэтому повторный импорт того же файла ничего не дублирует.
+# Принятые посещения записываются в хранилище одной операцией, контакты рассылки -
+# одной записью в хранилище контактов; отклоненные строки возвращаются
+# отдельной таблицей с причиной. Для XLSX нужен пакет openpyxl
+# (pip install openpyxl) - CSV читается и без него.
+
+CHUNK_ROWS = 10_000
+REQUIRED_COLUMNS = ["Дата", "Направление", "Имя"]
+CONTACT_DIRECTION = "Рассылка"
+REASON_COLUMN = "Причина"
+
+
+def read_table(path_or_file, name=None):
+    """CSV или XLSX (по расширению имени) - все колонки как текст"""
+    name = name or getattr(path_or_file, "name", None) or str(path_or_file)
+    if os.path.splitext(name)[1].lower() in (".xlsx", ".xls"):
+        try:
+            return pd.read_excel(path_or_file, dtype=str).fillna('')
+        except ImportError as error:
+            raise ImportError("Для импорта XLSX нужен пакет openpyxl (pip install openpyxl) "
+                              "или сохраните файл как CSV") from error
+    return pd.read_csv(path_or_file, dtype=str, keep_default_na=False)
+
+
+def validate(chunk, strict_prices=True):
+    """Приводит порцию к колонкам базы; отдает (строки, причины отказа по строкам)"""
+    chunk = chunk.reindex(columns=COLUMNS, fill_value='').fillna('')
+    for column in COLUMNS:
+        if column != 'Цена':
+            chunk[column] = chunk[column].astype(str).str.strip()
+    reasons = pd.Series('', index=chunk.index)
+
+    def reject(mask, reason):
+        reasons[mask] = reasons[mask] + reason + "; "
+
+    dates = pd.to_datetime(chunk['Дата'], format='ISO8601', errors='coerce')
+    reject(dates.isna(), "неверная дата")
+    reject(chunk['Имя'] == '', "нет имени")
+
+    contact = chunk['Направление'] == CONTACT_DIRECTION
+    visit = ~contact
+    reject(visit & ~chunk['Направление'].isin(DIRECTIONS), "неизвестное направление")
+    reject(visit & ~chunk['Услуга'].isin(SERVICE_PRICES.keys()), "неизвестная услуга")
+    reject(visit & (chunk['Телефон'] == ''), "нет телефона")
+
+    catalog = chunk['Услуга'].map(SERVICE_PRICES)
+    price_text = chunk['Цена'].astype(str).str.strip()
+    prices = pd.to_numeric(price_text, errors='coerce')
+    # Пустая цена берется из прайса, у контактов рассылки цены нет
+    prices = prices.where(price_text != '', catalog)
+    prices = prices.where(visit, 0)
+    reject(visit & (prices.isna() | (prices <= 0) | (prices % 1 != 0)), "неверная цена")
+    if strict_prices:
+        reject(visit & prices.notna() & catalog.notna() & (prices != catalog), "цена не совпадает с прайсом")
+
+    chunk['Дата'] = dates.dt.strftime(DATE_FORMAT)
+    chunk['Цена'] = prices.fillna(0).astype('int64')
+    chunk.loc[contact, ['Телефон', 'Услуга']] = ''
+    return chunk, reasons.str.rstrip('; ')
+
+
+def assign_ids(rows):
+    """visit_id - по хэшу строки; client_id по нормализованным (Имя, Телефон),
+    у контактов - (Имя, Ссылка VK), а без ссылки - visit_id строки"""
+    missing = rows['visit_id'] == ''
+    if missing.any():
+        rows.loc[missing, 'visit_id'] = visit_ids_for(rows.loc[missing])
+    rows['client_id'] = client_ids_for(rows['Имя'], rows['Телефон'])
+    contact = (rows['Направление'] == CONTACT_DIRECTION).to_numpy()
+    if contact.any():
+        rows.loc[contact, 'client_id'] = contact_ids_for(
+            rows.loc[contact, 'Имя'], rows.loc[contact, 'Ссылка_VK'], rows.loc[contact, 'visit_id'])
+    return rows
+
+
+def prepare_import(raw, existing_ids=(), strict_prices=True, chunk_rows=CHUNK_ROWS, progress=None):
+    """Проверяет таблицу порциями; отдает (принятые строки, отклоненные строки с причиной)"""
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in raw.columns]
+    if missing_columns:
+        raise ValueError("В файле нет колонок: " + ", ".join(missing_columns))
+
+    chunks, chunk_reasons = [], []
+    total = len(raw)
+    for start in range(0, total, chunk_rows):
+        rows, reasons = validate(raw.iloc[start:start + chunk_rows].copy(), strict_prices)
+        chunks.append(assign_ids(rows))
+        chunk_reasons.append(reasons)
+        if progress:
+            progress(min(start + chunk_rows, total), total)
+    if not chunks:
+        return pd.DataFrame(columns=COLUMNS), pd.DataFrame(columns=list(raw.columns) + [REASON_COLUMN])
+    rows = pd.concat(chunks, ignore_index=True)
+    reasons = pd.concat(chunk_reasons, ignore_index=True)
+
+    # Повторы - одна проверка по хэш-таблице visit_id базы и внутри файла
+    valid = reasons == ''
+    in_store = valid & rows['visit_id'].isin(pd.Index(existing_ids))
+    reasons[in_store] = "уже есть в базе"
+    valid &= ~in_store
+    repeated = valid & rows['visit_id'].where(valid).duplicated()
+    reasons[repeated] = "повтор в файле"
+    valid &= ~repeated
+
+    rejected = raw.reset_index(drop=True)[~valid].assign(**{REASON_COLUMN: reasons[~valid]})
+    return rows[valid].reset_index(drop=True), rejected.reset_index(drop=True)
+
+
+def import_visits(raw, store=None, strict_prices=True, progress=None, compact=True):
+    """Импорт в хранилища одной записью; отдает (число принятых, отклоненные строки)"""
+    store = store or get_store()
+    existing_ids = store.data()['visit_id']
+    accepted, rejected = prepare_import(raw, existing_ids, strict_prices, progress=progress)
+    contact = accepted['Направление'] == CONTACT_DIRECTION
+    if contact.any():
+        get_contact_store(contacts_path(store.path)).upsert_many(accepted[contact].to_dict('records'))
+    store.append_many(accepted[~contact])
+    if compact and store.needs_compaction():
+        store.compact()
+    return len(accepted), rejected
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Импорт посещений и контактов из CSV/XLSX")
+    parser.add_argument("file")
+    parser.add_argument("--keep-prices", action="store_true",
+                        help="не сверять цены с текущим прайсом (для старых посещений)")
+    parser.add_argument("--rejected", help="куда сохранить отклоненные строки (CSV)")
+    args = parser.parse_args()
+
+    def print_progress(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    imported, rejected = import_visits(read_table(args.file), strict_prices=not args.keep_prices,
+                                       progress=print_progress)
+    print(f"\nИмпортировано: {imported}, отклонено: {len(rejected)}")
+    if args.rejected and len(rejected):
+        rejected.to_csv(args.rejected, index=False, encoding='utf-8')
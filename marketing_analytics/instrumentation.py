@@ -0,0 +1,149 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# --- ИНСТРУМЕНТАЦИЯ ---
+# Время этапов запуска страницы (загрузка, сводки, фильтры, отрисовка...),
+# объемы прочитанных/записанных строк и байтов, попадания в кэши. Этапы
+# текущего запуска копятся отдельно для каждого потока (у каждой сессии
+# Streamlit свой поток), итоги - на весь процесс. Итоги можно выгрузить в
+# текстовом формате Prometheus (файл MARKETING_METRICS_FILE, если переменная
+# задана), а один запуск - снять под cProfile.
+
+METRICS_PATH = os.environ.get("MARKETING_METRICS_FILE", "")
+PROFILE_LINES = 40
+
+
+class StageStats:
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+
+class Metrics:
+    """Счетчики процесса и этапы текущего запуска"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = Counter()
+        self.cache = {}  # имя кэша -> [попадания, промахи]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # --- ЗАПУСК СТРАНИЦЫ ---
+    def start_run(self):
+        self._local.run = {}
+        self._local.started = time.perf_counter()
+
+    def finish_run(self):
+        """Этапы завершенного запуска: {этап: секунды}, плюс 'total'"""
+        run = self.current_run()
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            run["total"] = time.perf_counter() - started
+            self._record("run", run["total"])
+        self._local.run = {}
+        self._local.started = None
+        return run
+
+    def current_run(self):
+        return dict(getattr(self._local, "run", {}))
+
+    # --- ИЗМЕРЕНИЯ ---
+    def _record(self, name, seconds):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.record(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Засекает этап; вложенные и повторные этапы суммируются в запуске"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self._record(name, seconds)
+            run = getattr(self._local, "run", None)
+            if run is not None:
+                run[name] = run.get(name, 0.0) + seconds
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def cache_hit(self, name, hit):
+        with self._lock:
+            counts = self.cache.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    # --- ВЫГРУЗКА ---
+    def to_prometheus(self, extra=None):
+        """Текстовый формат Prometheus; extra - дополнительные значения {имя: число}"""
+        lines = []
+        with self._lock:
+            stages = sorted(self.stages.items())
+            # Семейство метрик - подряд, после своей строки TYPE
+            for family, kind, value in (
+                ("marketing_stage_seconds_total", "counter", lambda stats: f"{stats.total:.6f}"),
+                ("marketing_stage_runs_total", "counter", lambda stats: stats.count),
+                ("marketing_stage_max_seconds", "gauge", lambda stats: f"{stats.max:.6f}"),
+            ):
+                lines.append(f"# TYPE {family} {kind}")
+                lines.extend(f'{family}{{stage="{name}"}} {value(stats)}' for name, stats in stages)
+            lines.append("# TYPE marketing_cache_requests_total counter")
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'marketing_cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'marketing_cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE marketing_{name}_total counter")
+                lines.append(f"marketing_{name}_total {value}")
+        for name, value in sorted((extra or {}).items()):
+            lines.append(f"# TYPE marketing_{name} gauge")
+            lines.append(f"marketing_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None, extra=None):
+        """Атомарно пишет метрики в файл (для node_exporter textfile collector)"""
+        path = path or METRICS_PATH
+        if not path:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            f.write(self.to_prometheus(extra))
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+class RunProfile:
+    """cProfile одного запуска: создается в начале скрипта, stop() - в конце"""
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, lines=PROFILE_LINES):
+        """Останавливает профиль; отчет - топ функций по cumulative time"""
+        self._profile.disable()
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(lines)
+        return out.getvalue()
@@ -0,0 +1,250 @@
+import json
+import os
+from contextlib import closing
+
+import pandas as pd
+
+from .contacts import contacts_path, get_contact_store
+from .identity import client_ids_for, contact_ids_for, hex_ids
+from .storage import (
+    CATEGORY_COLUMNS, DB_PATH, TEXT_COLUMNS, get_store, partition_path, read_manifest, sqlite_connect,
+    storage_format,
+)
+
+# --- МИГРАЦИИ СХЕМЫ ---
+# Версия схемы хранится рядом с базой в marketing_database.schema.json.
+# Миграции запускаются явно (python -m marketing_analytics.migrations или кнопкой в приложении),
+# обрабатывают снимок порциями и после сбоя продолжают с места остановки.
+# Горячий путь загрузки их никогда не выполняет.
+
+CHUNK_ROWS = 50_000
+
+
+def schema_path(path=DB_PATH):
+    return os.path.splitext(path)[0] + ".schema.json"
+
+
+def read_schema(path=DB_PATH):
+    try:
+        with open(schema_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_schema(schema, path=DB_PATH):
+    tmp_path = schema_path(path) + ".tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, schema_path(path))
+
+
+def read_header(path=DB_PATH):
+    if not os.path.exists(path):
+        return None
+    fmt = storage_format(path)
+    if fmt == "csv":
+        return list(pd.read_csv(path, encoding='utf-8', nrows=0).columns)
+    if fmt == "partitioned":
+        # У всех партиций одна схема - хватает первой
+        months = sorted(read_manifest(path))
+        return read_header(partition_path(path, months[0])) if months else None
+    if fmt == "sqlite":
+        with closing(sqlite_connect(path)) as conn:
+            return [row[1] for row in conn.execute("PRAGMA table_info(visits)")]
+    import pyarrow.parquet
+    import pyarrow.feather
+    if fmt == "parquet":
+        return pyarrow.parquet.read_schema(path).names
+    return pyarrow.feather.read_table(path).column_names
+
+
+# --- 1: visit_id для старых записей ---
+def visit_ids_for(chunk):
+    """Векторно считает visit_id по (Дата, Имя, Телефон): 64-битный хэш в hex"""
+    hashes = pd.util.hash_pandas_object(chunk[['Дата', 'Имя', 'Телефон']].astype(str), index=False)
+    return hex_ids(hashes.to_numpy())
+
+
+def add_visit_id(chunk, path):
+    if 'visit_id' not in chunk.columns:
+        chunk.insert(0, 'visit_id', visit_ids_for(chunk))
+    return chunk
+
+
+# --- 2: контакты рассылки в отдельное хранилище ---
+def move_contacts(chunk, path):
+    """Переносит строки «Рассылка» в хранилище контактов; повтор после сбоя безопасен"""
+    contact = (chunk['Направление'] == 'Рассылка').to_numpy()
+    if contact.any():
+        # Пустые ячейки CSV приходят как NaN - в контакте это пустая строка, а не 'nan'
+        contacts = chunk[contact].fillna('')
+        # Старый client_id у однофамильцев без телефона совпадает - ключ контакта
+        # строится по имени и ссылке VK, а без ссылки это visit_id строки
+        contacts['client_id'] = contact_ids_for(contacts['Имя'], contacts['Ссылка_VK'], contacts['visit_id'])
+        get_contact_store(contacts_path(path)).upsert_many(contacts.to_dict('records'))
+    return chunk[~contact]
+
+
+# --- 3: client_id по нормализованным имени и телефону ---
+def normalize_client_ids(chunk, path):
+    """Пересчитывает client_id; записи одного клиента в разном написании сливаются"""
+    chunk['client_id'] = client_ids_for(chunk['Имя'], chunk['Телефон'])
+    return chunk
+
+
+def rekey_contacts(path):
+    """Новые client_id контактов рассылки (имя + ссылка VK); сливаются только контакты
+    с одной ссылкой, контакт без ссылки сохраняет свой client_id"""
+    get_contact_store(contacts_path(path)).rekey(
+        lambda frame: contact_ids_for(frame['Имя'], frame['Ссылка_VK'], frame['client_id']))
+
+
+# (версия, описание, функция над порцией снимка и путем базы, нужна ли перезапись)
+MIGRATIONS = [
+    (1, "visit_id для старых записей", add_visit_id, lambda header: 'visit_id' not in header),
+    # По заголовку не видно, есть ли в базе контакты или дубли, - перезапись нужна всегда
+    (2, "контакты рассылки отдельно от посещений", move_contacts, lambda header: True),
+    (3, "нормализованный client_id и слияние дублей клиентов", normalize_client_ids, lambda header: True),
+]
+
+# Действия после перезаписи снимка; идемпотентны, поэтому после сбоя просто повторяются
+FINISH = {
+    3: rekey_contacts,
+}
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def mark_current(path=DB_PATH):
+    """Записывает актуальную версию схемы для только что созданной базы"""
+    if read_schema(path) is None:
+        write_schema({"version": SCHEMA_VERSION}, path)
+
+
+def current_version(path=DB_PATH):
+    """Версия схемы; по заголовку определяется только для старых баз без метаданных"""
+    schema = read_schema(path)
+    if schema is not None:
+        return schema["version"]
+    header = read_header(path)
+    if header is None:
+        # Базы еще нет - она будет создана уже в актуальной схеме
+        mark_current(path)
+        return SCHEMA_VERSION
+    version = 0
+    for migration_version, _, _, needs_rewrite in MIGRATIONS:
+        if needs_rewrite(header):
+            break
+        version = migration_version
+    return version
+
+
+def migration_in_progress(path=DB_PATH):
+    """Порционная перезапись начата и не закончена (в том числе прервана сбоем)"""
+    schema = read_schema(path)
+    return bool(schema and schema.get("in_progress"))
+
+
+def pending_migrations(path=DB_PATH):
+    version = current_version(path)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def run_migration(migration, path=DB_PATH, chunk_rows=CHUNK_ROWS, progress=None):
+    """Переписывает снимок порциями во временный файл и атомарно заменяет его.
+
+    Прогресс (строки исходного снимка и байты временного файла) сохраняется в метаданных схемы
+    после каждой порции, поэтому прерванная миграция продолжается, а не
+    начинается заново. Вся перезапись идет под блокировкой базы: компакция
+    другого потока или процесса не может заменить снимок и удалить журнал,
+    пока миграция читает старый снимок.
+    """
+    with get_store(path).exclusive():
+        _run_migration(migration, path, chunk_rows, progress)
+
+
+def _run_migration(migration, path, chunk_rows, progress):
+    version, _, transform, needs_rewrite = migration
+    schema = read_schema(path) or {"version": current_version(path)}
+    header = read_header(path)
+    if header is None or not needs_rewrite(header):
+        finish_migration(version, schema, path)
+        return
+
+    if storage_format(path) != "csv":
+        # Колоночные форматы и SQLite и так читаются целиком - мигрируем весь DataFrame
+        store = get_store(path)
+        store.compact(transform(store.data().copy(), path))
+        finish_migration(version, schema, path)
+        return
+
+    tmp_path = path + ".migrating"
+    state = schema.get("in_progress")
+    if not state or state["version"] != version or not os.path.exists(tmp_path):
+        state = {"version": version, "rows_done": 0, "bytes_done": 0}
+        store = get_store(path)
+        if 'visit_id' in header and os.path.exists(store.log_path):
+            # Журнал ссылается на посещения по visit_id - сворачиваем его в снимок,
+            # чтобы миграция увидела и записи, сделанные после последней компакции
+            store.compact()
+        # Отметка о начатой перезаписи - до первой порции, чтобы компакция ее видела
+        schema["in_progress"] = state
+        write_schema(schema, path)
+
+    with open(tmp_path, "ab") as out:
+        # Отрезаем порцию, записанную после последнего сохраненного прогресса
+        out.truncate(state["bytes_done"])
+        reader = pd.read_csv(
+            path, encoding='utf-8', chunksize=chunk_rows,
+            skiprows=range(1, state["rows_done"] + 1),
+            dtype={column: str for column in TEXT_COLUMNS + CATEGORY_COLUMNS},
+        )
+        for chunk in reader:
+            rows = len(chunk)
+            chunk = transform(chunk, path)
+            out.write(chunk.to_csv(index=False, header=state["bytes_done"] == 0).encode('utf-8'))
+            out.flush()
+            os.fsync(out.fileno())
+            # Считаем строки исходного снимка: миграция может убирать строки
+            state["rows_done"] += rows
+            state["bytes_done"] = out.tell()
+            schema["in_progress"] = state
+            write_schema(schema, path)
+            if progress:
+                progress(version, state["rows_done"])
+
+    os.replace(tmp_path, path)
+    finish_migration(version, schema, path)
+
+
+def finish_migration(version, schema, path):
+    finish = FINISH.get(version)
+    if finish:
+        finish(path)
+    schema["version"] = version
+    schema.pop("in_progress", None)
+    write_schema(schema, path)
+
+
+def migrate(path=DB_PATH, chunk_rows=CHUNK_ROWS, progress=None):
+    """Применяет все ожидающие миграции по порядку, не отпуская блокировку между ними"""
+    applied = []
+    with get_store(path).exclusive():
+        for migration in pending_migrations(path):
+            run_migration(migration, path, chunk_rows, progress)
+            applied.append(migration[1])
+    return applied
+
+
+if __name__ == "__main__":
+    def print_progress(version, rows_done):
+        print(f"  миграция {version}: обработано {rows_done} строк")
+
+    applied = migrate(progress=print_progress)
+    if applied:
+        print("Применены миграции: " + ", ".join(applied))
+    else:
+        print(f"Схема актуальна (версия {SCHEMA_VERSION})")
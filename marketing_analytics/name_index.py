@@ -0,0 +1,182 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+# --- ИНДЕКС ИМЕН И ТЕЛЕФОНОВ ---
+# Отсортированный список ключей (слова имени, полное имя, цифры телефона) и
+# для каждого ключа - счетчик записей по (Имя, Телефон, client_id) и те же
+# записи отсортированным списком. Поиск по префиксу - бинарный поиск и обход
+# соседних ключей до первых k совпадений, поэтому его цена не зависит от
+# размера базы. Индекс обновляется
+# по уведомлениям хранилища.
+
+DEFAULT_LIMIT = 10
+
+
+def normalize_text(text):
+    return " ".join(str(text).casefold().replace("ё", "е").split())
+
+
+def phone_digits(phone):
+    return re.sub(r"\D", "", str(phone))
+
+
+def index_keys(name, phone):
+    name_key = normalize_text(name)
+    keys = set(name_key.split())
+    if name_key:
+        keys.add(name_key)
+    digits = phone_digits(phone)
+    if digits:
+        keys.add(digits)
+    return keys
+
+
+class NameIndex:
+    """Поиск клиентов по началу имени, фамилии или телефона"""
+
+    def __init__(self):
+        self.keys = []
+        self.postings = {}
+        self.ordered = {}
+        self._lock = threading.RLock()
+
+    # --- ОБНОВЛЕНИЕ ---
+    def _update(self, rows, sign, ordered=True):
+        """Меняет счетчики; ordered=False - списки соберет вызывающий (перестроение)"""
+        entries = Counter(zip(
+            rows['Имя'].astype(str),
+            rows['Телефон'].astype(str),
+            rows['client_id'].astype(str),
+        ))
+        with self._lock:
+            for entry, count in entries.items():
+                name, phone, _ = entry
+                if not name:
+                    continue
+                for key in index_keys(name, phone):
+                    posting = self.postings.get(key)
+                    if posting is None:
+                        posting = self.postings[key] = Counter()
+                        insort(self.keys, key)
+                        if ordered:
+                            self.ordered[key] = []
+                    known = entry in posting
+                    posting[entry] += sign * count
+                    if posting[entry] <= 0:
+                        del posting[entry]
+                    if ordered:
+                        # Список меняется, только когда запись появляется или исчезает
+                        ordered_entries = self.ordered[key]
+                        if not known and entry in posting:
+                            insort(ordered_entries, entry)
+                        elif known and entry not in posting:
+                            del ordered_entries[bisect_left(ordered_entries, entry)]
+                    if not posting:
+                        del self.postings[key]
+                        self.ordered.pop(key, None)
+                        del self.keys[bisect_left(self.keys, key)]
+
+    def on_reload(self, df):
+        with self._lock:
+            self.keys = []
+            self.postings = {}
+            self._update(df, 1, ordered=False)
+            # Каждый список сортируется один раз, а не вставками по одной записи
+            self.ordered = {key: sorted(posting) for key, posting in self.postings.items()}
+
+    def on_append(self, rows):
+        self._update(rows, 1)
+
+    def on_delete(self, rows):
+        self._update(rows, -1)
+
+    # --- ПОИСК ---
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Первые limit записей (Имя, Телефон, client_id) по префиксу запроса"""
+        compact = re.sub(r"[\s()+-]", "", query)
+        prefix = compact if compact.isdigit() else normalize_text(query)
+        found = {}
+        with self._lock:
+            position = bisect_left(self.keys, prefix)
+            while position < len(self.keys) and len(found) < limit:
+                key = self.keys[position]
+                if not key.startswith(prefix):
+                    break
+                for entry in self.ordered[key]:
+                    if entry not in found:
+                        found[entry] = None
+                        if len(found) >= limit:
+                            break
+                position += 1
+        return list(found)
+
+    def search_names(self, query, limit=DEFAULT_LIMIT):
+        """Уникальные имена по префиксу - для полей вроде «Кто пригласил»"""
+        names = []
+        for name, _, _ in self.search(query, limit * 2):
+            if name not in names:
+                names.append(name)
+        return names[:limit]
+
+
+class ContactNameIndex:
+    """Индекс имен контактов рассылки - их тоже можно выбрать в «Кто пригласил».
+
+    У хранилища контактов нет подписчиков, поэтому индекс перестраивается по
+    версии хранилища при первом поиске после изменения контактов.
+    """
+
+    def __init__(self, contacts):
+        self.contacts = contacts
+        self.index = NameIndex()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        with self._lock:
+            frame = self.contacts.frame()
+            if self._version != self.contacts.version:
+                self.index.on_reload(frame.assign(Телефон=''))
+                self._version = self.contacts.version
+            return self.index
+
+    def search_names(self, query, limit=DEFAULT_LIMIT):
+        return self._current().search_names(query, limit)
+
+
+def search_names(indexes, query, limit=DEFAULT_LIMIT):
+    """Уникальные имена по префиксу из нескольких индексов (клиенты, контакты)"""
+    names = []
+    for index in indexes:
+        for name in index.search_names(query, limit):
+            if name not in names:
+                names.append(name)
+    return names[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_name_index(store):
+    """Индекс, подписанный на хранилище, - один на процесс"""
+    with _indexes_lock:
+        index = _indexes.get(store.path)
+        if index is None:
+            index = _indexes[store.path] = NameIndex()
+            store.subscribe(index)
+        return index
+
+
+_contact_indexes = {}
+
+
+def get_contact_name_index(contacts):
+    """Индекс имен контактов рассылки - один на хранилище контактов"""
+    with _indexes_lock:
+        index = _contact_indexes.get(contacts.path)
+        if index is None:
+            index = _contact_indexes[contacts.path] = ContactNameIndex(contacts)
+        return index
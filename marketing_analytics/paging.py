@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+# --- ПОСТРАНИЧНЫЙ ВЫВОД ---
+# В браузер уходит только видимая страница таблицы. Сортировка по Дате
+# бесплатна (строки хранилища уже упорядочены по времени), по остальным
+# колонкам сортируются позиции одной колонки, а не весь DataFrame.
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def page_count(total, page_size):
+    return max(1, -(-total // page_size))
+
+
+def sort_keys(column):
+    if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column):
+        return column.to_numpy()
+    codes, _ = pd.factorize(column, sort=True)
+    return codes
+
+
+def page_slice(df, page, page_size, sort_by='Дата', descending=True):
+    """Строки страницы page (с нуля) при заданной сортировке"""
+    total = len(df)
+    start = min(page * page_size, total)
+    stop = min(start + page_size, total)
+    if sort_by == 'Дата':
+        if descending:
+            return df.iloc[total - stop:total - start].iloc[::-1]
+        return df.iloc[start:stop]
+    order = np.argsort(sort_keys(df[sort_by]), kind='stable')
+    if descending:
+        order = order[::-1]
+    return df.iloc[order[start:stop]]
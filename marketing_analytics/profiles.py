@@ -0,0 +1,184 @@
+import threading
+
+import pandas as pd
+
+# --- ПРОФИЛИ КЛИЕНТОВ ---
+# Для каждого client_id хранится сводка: число посещений, сумма, первое и
+# последнее посещение и несколько последних визитов. Сводки обновляются по
+# уведомлениям хранилища, так что карточка клиента открывается без сканирования
+# базы. Полная история клиента читается из хранилища один раз - при первом
+# обращении к профилю после перезагрузки - и дальше хранится вместе с профилем:
+# добавления и удаления обновляют ее, поэтому следующие страницы истории и
+# пересчет профиля после удаления базу не сканируют. Удаление у клиента без
+# загруженной истории помечает профиль устаревшим - он пересчитывается по
+# истории при следующем обращении.
+
+RECENT_VISITS = 20
+VISIT_FIELDS = ["visit_id", "Дата", "Направление", "Услуга", "Цена", "Кто_пригласил"]
+
+
+class ClientProfile:
+    __slots__ = ("client_id", "name", "phone", "visits", "total_spent",
+                 "first_visit", "last_visit", "recent", "stale")
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.name = ""
+        self.phone = ""
+        self.visits = 0
+        self.total_spent = 0
+        self.first_visit = None
+        self.last_visit = None
+        self.recent = []  # кортежи VISIT_FIELDS, новые первыми; None - еще не загружены
+        self.stale = False
+
+    @property
+    def average_check(self):
+        return self.total_spent / self.visits if self.visits else 0
+
+    def recent_frame(self):
+        return pd.DataFrame(self.recent, columns=VISIT_FIELDS)
+
+
+class ClientProfiles:
+    """Инкрементальные профили клиентов по client_id"""
+
+    def __init__(self, store):
+        self.store = store
+        self.profiles = {}
+        self.histories = {}  # client_id -> все посещения клиента, новые сверху
+        self._lock = threading.RLock()
+
+    # --- ОБНОВЛЕНИЕ ---
+    def _fill(self, history):
+        """Строит профили по посещениям, упорядоченным по времени"""
+        summary = history.groupby('client_id', sort=False).agg(
+            name=('Имя', 'last'),
+            phone=('Телефон', 'last'),
+            visits=('Цена', 'size'),
+            total_spent=('Цена', 'sum'),
+            first_visit=('Дата', 'min'),
+            last_visit=('Дата', 'max'),
+        )
+        for row in summary.itertuples():
+            profile = ClientProfile(row.Index)
+            profile.name = row.name
+            profile.phone = row.phone
+            profile.visits = int(row.visits)
+            profile.total_spent = int(row.total_spent)
+            profile.first_visit = row.first_visit
+            profile.last_visit = row.last_visit
+            profile.recent = None
+            self.profiles[row.Index] = profile
+
+    def on_reload(self, df):
+        with self._lock:
+            self.profiles = {}
+            self.histories = {}
+            self._fill(df)
+
+    def on_append(self, rows):
+        with self._lock:
+            for visit in rows.itertuples(index=False):
+                visit = visit._asdict()
+                client_id = visit['client_id']
+                profile = self.profiles.get(client_id)
+                if profile is None:
+                    profile = self.profiles[client_id] = ClientProfile(client_id)
+                profile.name = visit['Имя']
+                profile.phone = visit['Телефон']
+                profile.visits += 1
+                profile.total_spent += int(visit['Цена'])
+                date = visit['Дата']
+                if profile.first_visit is None or date < profile.first_visit:
+                    profile.first_visit = date
+                if profile.last_visit is None or date >= profile.last_visit:
+                    profile.last_visit = date
+                if profile.recent is not None:
+                    # Незагруженные визиты придут из истории вместе с этим посещением
+                    profile.recent.append(tuple(visit[field] for field in VISIT_FIELDS))
+                    profile.recent.sort(key=lambda item: item[1], reverse=True)
+                    del profile.recent[RECENT_VISITS:]
+            for client_id in self.histories.keys() & set(rows['client_id']):
+                added = rows[rows['client_id'] == client_id]
+                # Тот же порядок, что дает хранилище: по времени, при равенстве - позже добавленные выше
+                merged = pd.concat([self.histories[client_id].iloc[::-1], added])
+                self.histories[client_id] = merged.sort_values('Дата', kind='stable').iloc[::-1]
+
+    def on_delete(self, rows):
+        with self._lock:
+            for client_id in rows['client_id'].unique():
+                history = self.histories.get(client_id)
+                if history is not None:
+                    # История загружена - пересчитываем профиль по ней без обращения к базе
+                    self._set_history(client_id, history[~history['visit_id'].isin(rows['visit_id'])], True)
+                elif client_id in self.profiles:
+                    self.profiles[client_id].stale = True
+
+    def _set_history(self, client_id, history, refill):
+        """Запоминает историю клиента (новые сверху); refill - пересчитать сводку профиля по ней"""
+        self.histories[client_id] = history
+        if refill:
+            self.profiles.pop(client_id, None)
+            if not history.empty:
+                self._fill(history.iloc[::-1])
+        profile = self.profiles.get(client_id)
+        if profile is not None:
+            head = history.head(RECENT_VISITS)
+            profile.recent = list(zip(*(head[field] for field in VISIT_FIELDS)))
+
+    # --- ЧТЕНИЕ ---
+    def get(self, client_id):
+        """Профиль клиента или None, если посещений нет"""
+        with self._lock:
+            profile = self.profiles.get(client_id)
+            if profile is None or not (profile.stale or profile.recent is None):
+                return profile
+        self.history(client_id)
+        with self._lock:
+            return self.profiles.get(client_id)
+
+    def history(self, client_id):
+        """Все посещения клиента, новые сверху; из хранилища читаются один раз"""
+        while True:
+            with self._lock:
+                history = self.histories.get(client_id)
+                if history is not None:
+                    return history
+            # История читается без блокировки профилей: хранилище уведомляет
+            # профили под своей блокировкой, обратный порядок дал бы взаимную блокировку
+            version = self.store.version
+            history = self.store.client_history(client_id)
+            with self._lock:
+                if self.store.version != version:
+                    # Между чтением и блокировкой была запись - читаем историю заново
+                    continue
+                profile = self.profiles.get(client_id)
+                self._set_history(client_id, history, profile is not None and profile.stale)
+                return history
+
+    def visits_page(self, client_id, page, page_size):
+        """Страница посещений клиента (новые первыми): сначала из профиля,
+        глубже - из сохраненной истории клиента"""
+        profile = self.get(client_id)
+        if profile is None:
+            return pd.DataFrame(columns=VISIT_FIELDS)
+        start = page * page_size
+        stop = start + page_size
+        if stop <= len(profile.recent) or len(profile.recent) == profile.visits:
+            return profile.recent_frame().iloc[start:stop]
+        return self.history(client_id)[VISIT_FIELDS].iloc[start:stop]
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_profiles(store):
+    """Профили, подписанные на хранилище, - одни на процесс"""
+    with _profiles_lock:
+        profiles = _profiles.get(store.path)
+        if profiles is None:
+            profiles = _profiles[store.path] = ClientProfiles(store)
+            store.subscribe(profiles)
+        return profiles
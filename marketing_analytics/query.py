@@ -0,0 +1,188 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import metrics
+
+# --- ЗАПРОСЫ СТРАНИЦЫ АНАЛИТИКА ---
+# Фильтр (период, направления, услуги, диапазон цены) описывается FilterSpec и
+# превращается в одну маску строк. Период - бинарный поиск по отсортированной
+# Дате, направления и услуги - таблица «код категории -> подходит» и выборка по
+# целочисленным кодам, цена - сравнение numpy-массива. Итоги (выручка, клиенты,
+# услуги, средний чек) считаются по той же маске, без копий всей базы.
+# Результаты кэшируются в LRU по (фильтр, версия данных): повторный rerun с теми
+# же фильтрами ничего не пересчитывает.
+
+CACHE_SIZE = 32
+
+
+class FilterSpec:
+    """Неизменяемое описание фильтров; пустые значения - без ограничения"""
+    __slots__ = ("start", "end", "directions", "services", "min_price", "max_price")
+
+    def __init__(self, start=None, end=None, directions=(), services=(), min_price=None, max_price=None):
+        self.start = None if start is None else pd.Timestamp(start)
+        self.end = None if end is None else pd.Timestamp(end)
+        self.directions = frozenset(directions)
+        self.services = frozenset(services)
+        self.min_price = None if min_price is None else int(min_price)
+        self.max_price = None if max_price is None else int(max_price)
+
+    def key(self):
+        return (self.start, self.end, self.directions, self.services, self.min_price, self.max_price)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"FilterSpec{self.key()!r}"
+
+
+class QueryResult:
+    """Отфильтрованные строки и итоги по ним"""
+    __slots__ = ("rows", "revenue", "clients", "services", "avg_check", "max_price")
+
+    def __init__(self, rows, revenue, clients, services, max_price):
+        self.rows = rows
+        self.revenue = revenue
+        self.clients = clients
+        self.services = services
+        self.avg_check = revenue / services if services else 0
+        self.max_price = max_price
+
+
+class QueryColumns:
+    """Колонки базы в виде numpy-массивов и кодов категорий - одни на версию данных"""
+
+    def __init__(self, df):
+        self.dates = df['Дата'].to_numpy()
+        self.prices = df['Цена'].to_numpy()
+        # Клиенты различаются по client_id: одно имя в разном написании - один клиент
+        self.clients, _ = pd.factorize(df['client_id'])
+        self.codes = {}
+        self.categories = {}
+        self._options = {}
+        for column in ('Направление', 'Услуга'):
+            values = df[column].astype('category')
+            self.codes[column] = values.cat.codes.to_numpy()
+            self.categories[column] = values.cat.categories
+
+    def lookup(self, column, values):
+        """Таблица «код -> подходит»; последний элемент - для пропусков (код -1)"""
+        categories = self.categories[column]
+        table = np.zeros(len(categories) + 1, dtype=bool)
+        positions = categories.get_indexer(list(values))
+        table[positions[positions >= 0]] = True
+        return table
+
+    def options(self, column):
+        """Значения категории, которые встречаются в данных"""
+        options = self._options.get(column)
+        if options is None:
+            codes = self.codes[column]
+            counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[column]))
+            options = self._options[column] = list(self.categories[column][counts > 0])
+        return options
+
+
+def run_query(df, columns, spec):
+    """Применяет спецификацию к базе: одна маска на фильтры и итоги"""
+    lo, hi = 0, len(df)
+    if spec.start is not None:
+        lo = columns.dates.searchsorted(spec.start.to_datetime64())
+    if spec.end is not None:
+        hi = columns.dates.searchsorted(spec.end.to_datetime64())
+    hi = max(lo, hi)
+
+    mask = None
+
+    def narrow(condition):
+        nonlocal mask
+        mask = condition if mask is None else mask & condition
+
+    if spec.directions:
+        narrow(columns.lookup('Направление', spec.directions)[columns.codes['Направление'][lo:hi]])
+    if spec.services:
+        narrow(columns.lookup('Услуга', spec.services)[columns.codes['Услуга'][lo:hi]])
+    prices = columns.prices[lo:hi]
+    if spec.min_price is not None:
+        narrow(prices >= spec.min_price)
+    if spec.max_price is not None:
+        narrow(prices <= spec.max_price)
+
+    if mask is None:
+        # Без фильтров по значениям - срез по периоду без копирования
+        selection = slice(lo, hi)
+        rows = df.iloc[lo:hi]
+    else:
+        selection = np.flatnonzero(mask) + lo
+        rows = df.iloc[selection]
+    prices = columns.prices[selection]
+    clients = columns.clients[selection]
+    return QueryResult(
+        rows,
+        revenue=int(prices.sum()),
+        clients=int(np.count_nonzero(np.bincount(clients[clients >= 0]))) if len(clients) else 0,
+        services=len(prices),
+        max_price=int(prices.max()) if len(prices) else 0,
+    )
+
+
+class QueryEngine:
+    """Запросы страницы Аналитика с LRU-кэшем по (фильтр, версия данных)"""
+
+    def __init__(self, store, cache_size=CACHE_SIZE):
+        self.store = store
+        self.cache_size = cache_size
+        self._results = OrderedDict()
+        self._columns = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _prepare(self, df):
+        if self._version != self.store.version:
+            # Данные изменились - старые результаты больше не понадобятся
+            self._results.clear()
+            self._columns = QueryColumns(df)
+            self._version = self.store.version
+        return self._columns
+
+    def query(self, spec=None):
+        spec = spec or FilterSpec()
+        df = self.store.data()
+        with self._lock:
+            columns = self._prepare(df)
+            key = (spec, self._version)
+            result = self._results.get(key)
+            metrics.cache_hit("analytics_query", result is not None)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+            result = self._results[key] = run_query(df, columns, spec)
+            if len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+            return result
+
+    def options(self, column):
+        """Значения для фильтра по категории (Направление, Услуга)"""
+        df = self.store.data()
+        with self._lock:
+            return self._prepare(df).options(column)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_query_engine(store):
+    """Движок запросов для хранилища - один на процесс"""
+    with _engines_lock:
+        engine = _engines.get(store.path)
+        if engine is None:
+            engine = _engines[store.path] = QueryEngine(store)
+        return engine
@@ -0,0 +1,152 @@
+import threading
+from collections import Counter
+
+import pandas as pd
+
+# --- ГРАФ РЕФЕРАЛОВ ---
+# Ребро «пригласивший -> приглашенный» строится по полю Кто_пригласил. Ребра,
+# выручка клиентов и списки смежности обновляются по уведомлениям хранилища.
+# Метрики цепочек считаются по дереву первых приглашений: у каждого клиента
+# один «основной» пригласивший - тот, кто привел его раньше всех (ребро,
+# замыкающее цикл, пропускается). Так транзитивные счетчики и выручка
+# цепочки считаются за один обход O(V + E) и не учитывают клиента дважды.
+
+
+class ReferralGraph:
+    """Граф приглашений с прямыми и транзитивными метриками"""
+
+    def __init__(self):
+        self.edges = {}      # (пригласивший, приглашенный) -> Counter(месяц -> записей)
+        self.invited = {}    # пригласивший -> множество приглашенных
+        self.revenue = Counter()
+        self._metrics = None
+        self._lock = threading.RLock()
+
+    # --- ОБНОВЛЕНИЕ ---
+    def _update(self, rows, sign):
+        if rows.empty:
+            return
+        revenue = rows.groupby(rows['Имя'].astype(str), sort=False)['Цена'].sum()
+        referred = rows[(rows['Кто_пригласил'] != '') & (rows['Кто_пригласил'] != rows['Имя'])]
+        referrals = referred.groupby(
+            [referred['Кто_пригласил'].astype(str), referred['Имя'].astype(str),
+             referred['Дата'].dt.strftime('%Y-%m')],
+            sort=False,
+        ).size()
+        with self._lock:
+            for name, amount in revenue.items():
+                self.revenue[name] += sign * int(amount)
+                if self.revenue[name] == 0:
+                    del self.revenue[name]
+            for (referrer, invitee, month), count in referrals.items():
+                months = self.edges.setdefault((referrer, invitee), Counter())
+                months[month] += sign * int(count)
+                if months[month] <= 0:
+                    del months[month]
+                if months:
+                    self.invited.setdefault(referrer, set()).add(invitee)
+                else:
+                    del self.edges[(referrer, invitee)]
+                    self.invited[referrer].discard(invitee)
+                    if not self.invited[referrer]:
+                        del self.invited[referrer]
+            self._metrics = None
+
+    def on_reload(self, df):
+        with self._lock:
+            self.edges = {}
+            self.invited = {}
+            self.revenue = Counter()
+            self._update(df, 1)
+
+    def on_append(self, rows):
+        self._update(rows, 1)
+
+    def on_delete(self, rows):
+        self._update(rows, -1)
+
+    # --- МЕТРИКИ ---
+    def _primary_tree(self):
+        """Основной пригласивший для каждого клиента и месяц приглашения"""
+        first = {}
+        for (referrer, invitee), months in self.edges.items():
+            candidate = (min(months), referrer)
+            if invitee not in first or candidate < first[invitee]:
+                first[invitee] = candidate
+        parent = {}
+        for invitee, (month, referrer) in sorted(first.items(), key=lambda item: item[1]):
+            # Пропускаем ребро, если пригласивший сам происходит от приглашенного
+            node = referrer
+            while node in parent and node != invitee:
+                node = parent[node][0]
+            if node != invitee:
+                parent[invitee] = (referrer, month)
+        return parent
+
+    def _compute(self):
+        parent = self._primary_tree()
+        children = {}
+        for invitee, (referrer, _) in parent.items():
+            children.setdefault(referrer, []).append(invitee)
+
+        chain_size = Counter()
+        chain_revenue = Counter()
+        # Обход снизу вверх без рекурсии: корни, затем потомки, затем в обратном порядке
+        roots = [node for node in children if node not in parent]
+        order = []
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(children.get(node, ()))
+        for node in reversed(order):
+            for child in children.get(node, ()):
+                chain_size[node] += 1 + chain_size[child]
+                chain_revenue[node] += self.revenue.get(child, 0) + chain_revenue[child]
+
+        table = pd.DataFrame({
+            'Пригласивший': list(self.invited),
+            'Прямых': [len(invitees) for invitees in self.invited.values()],
+        })
+        table['Всего в цепочке'] = [chain_size[name] for name in table['Пригласивший']]
+        table['Выручка цепочки'] = [chain_revenue[name] for name in table['Пригласивший']]
+        table = table.sort_values(['Всего в цепочке', 'Выручка цепочки'], ascending=False, ignore_index=True)
+
+        by_month = pd.DataFrame(
+            [(month, referrer, invitee) for invitee, (referrer, month) in parent.items()],
+            columns=['Месяц', 'Пригласивший', 'Приглашенный'],
+        )
+        return table, by_month
+
+    def metrics(self):
+        """Таблица пригласивших: прямые приглашения, размер и выручка цепочки"""
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = self._compute()
+            return self._metrics[0]
+
+    def top_influencers(self, year_month, limit=10):
+        """Кто привел больше всего новых клиентов в указанном месяце"""
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = self._compute()
+            table, by_month = self._metrics
+        month = by_month[by_month['Месяц'] == year_month]
+        top = month.groupby('Пригласивший').size().rename('Новых за месяц').reset_index()
+        top = top.merge(table, on='Пригласивший', how='left')
+        return top.sort_values(['Новых за месяц', 'Выручка цепочки'], ascending=False,
+                               ignore_index=True).head(limit)
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def get_referral_graph(store):
+    """Граф, подписанный на хранилище, - один на процесс"""
+    with _graphs_lock:
+        graph = _graphs.get(store.path)
+        if graph is None:
+            graph = _graphs[store.path] = ReferralGraph()
+            store.subscribe(graph)
+        return graph
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+from collections import Counter
+
+import pandas as pd
+
+# --- СВОДНЫЕ ТАБЛИЦЫ ПО ДНЯМ И МЕСЯЦАМ ---
+# Для каждой пары (день, направление) и (месяц, направление) хранится число
+# посещений, выручка и счетчик посещений по client_id - по нему считается число
+# уникальных клиентов и корректно отрабатывается удаление. Сводки обновляются
+# по уведомлениям хранилища, поэтому дашборды не сканируют сырые посещения.
+
+ROLLUPS_SUFFIX = ".rollups.json"
+LEVELS = {"day": 10, "month": 7}  # длина префикса дня 'YYYY-MM-DD'
+# Версия сохраненных сводок: сводки со счетчиками по именам (без версии) перестраиваются
+ROLLUPS_FORMAT = 2
+
+
+class Cell:
+    __slots__ = ("visits", "revenue", "clients")
+
+    def __init__(self):
+        self.visits = 0
+        self.revenue = 0
+        self.clients = Counter()
+
+
+class Rollups:
+    """Инкрементальные сводки посещений по (период, направление)"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.path = os.path.splitext(store.path)[0] + ROLLUPS_SUFFIX if store else None
+        self.cells = {level: {} for level in LEVELS}
+        self._lock = threading.RLock()
+
+    # --- ОБНОВЛЕНИЕ ---
+    def _cells_for(self, day, direction):
+        for level, width in LEVELS.items():
+            by_direction = self.cells[level].setdefault(day[:width], {})
+            cell = by_direction.get(direction)
+            if cell is None:
+                cell = by_direction[direction] = Cell()
+            yield level, day[:width], by_direction, cell
+
+    def _add(self, day, direction, client_id, visits, revenue):
+        for level, period, by_direction, cell in self._cells_for(day, direction):
+            cell.visits += visits
+            cell.revenue += revenue
+            cell.clients[client_id] += visits
+            if cell.clients[client_id] <= 0:
+                del cell.clients[client_id]
+            if cell.visits <= 0:
+                del by_direction[direction]
+                if not by_direction:
+                    del self.cells[level][period]
+
+    def _apply(self, rows, sign):
+        if rows.empty:
+            return
+        grouped = rows.groupby(
+            [rows['Дата'].dt.strftime('%Y-%m-%d'), rows['Направление'], rows['client_id'].fillna('')],
+            sort=False,
+        )['Цена'].agg(['size', 'sum'])
+        with self._lock:
+            for (day, direction, client_id), count, revenue in zip(grouped.index, grouped['size'], grouped['sum']):
+                self._add(day, direction, client_id, sign * int(count), sign * int(revenue))
+
+    def rebuild(self, df):
+        with self._lock:
+            self.cells = {level: {} for level in LEVELS}
+            self._apply(df, 1)
+
+    # --- ПОДПИСКА НА ХРАНИЛИЩЕ ---
+    def on_reload(self, df):
+        if not self.load():
+            self.rebuild(df)
+            self.save()
+
+    def on_append(self, rows):
+        self._apply(rows, 1)
+
+    def on_delete(self, rows):
+        self._apply(rows, -1)
+
+    def on_compact(self, df):
+        self.save()
+
+    # --- ХРАНЕНИЕ ---
+    def _stamp(self):
+        return json.loads(json.dumps(self.store.signature))
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            days = self.cells["day"]
+            payload = {
+                "format": ROLLUPS_FORMAT,
+                "signature": self._stamp(),
+                "cells": [
+                    [day, direction, cell.visits, cell.revenue]
+                    for day, by_direction in days.items()
+                    for direction, cell in by_direction.items()
+                ],
+                "clients": [
+                    [day, direction, client_id, visits]
+                    for day, by_direction in days.items()
+                    for direction, cell in by_direction.items()
+                    for client_id, visits in cell.clients.items()
+                ],
+            }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Поднимает сохраненные сводки, если они соответствуют текущим файлам"""
+        if self.path is None:
+            return False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                payload = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if payload.get("format") != ROLLUPS_FORMAT or payload.get("signature") != self._stamp():
+            return False
+        with self._lock:
+            self.cells = {level: {} for level in LEVELS}
+            for day, direction, visits, revenue in payload["cells"]:
+                for _, _, _, cell in self._cells_for(day, direction):
+                    cell.visits += visits
+                    cell.revenue += revenue
+            for day, direction, client_id, visits in payload["clients"]:
+                for _, _, _, cell in self._cells_for(day, direction):
+                    cell.clients[client_id] += visits
+        return True
+
+    # --- ЧТЕНИЕ ---
+    def periods(self, level):
+        return list(self.cells[level])
+
+    def summary(self, level, period):
+        """Итоги периода: клиенты, посещения, выручка и разбивка по направлениям"""
+        with self._lock:
+            by_direction = self.cells[level].get(period, {})
+            clients = set()
+            result = {'clients': 0, 'visits': 0, 'revenue': 0, 'by_direction': {}}
+            for direction, cell in by_direction.items():
+                clients.update(cell.clients)
+                result['visits'] += cell.visits
+                result['revenue'] += cell.revenue
+                result['by_direction'][direction] = {
+                    'clients': len(cell.clients),
+                    'visits': cell.visits,
+                    'revenue': cell.revenue,
+                }
+            result['clients'] = len(clients)
+            return result
+
+
+# --- ИТОГИ ПЕРИОДА ПРЯМО ИЗ ХРАНИЛИЩА ---
+# Те же итоги, что и Rollups.summary, но по выборке за период из хранилища:
+# помесячная база открывает только партицию нужного месяца и не загружается
+# целиком. Итог кэшируется до следующего изменения файлов базы.
+def summarize(rows):
+    """Итоги строк в виде Rollups.summary"""
+    clients = rows['client_id'].fillna('')
+    by_direction = {}
+    if not rows.empty:
+        grouped = rows.assign(client_id=clients).groupby('Направление', observed=True, sort=False).agg(
+            clients=('client_id', 'nunique'), visits=('Цена', 'size'), revenue=('Цена', 'sum'))
+        by_direction = {
+            direction: {'clients': int(count), 'visits': int(visits), 'revenue': int(revenue)}
+            for direction, count, visits, revenue in zip(
+                grouped.index, grouped['clients'], grouped['visits'], grouped['revenue'])
+        }
+    return {
+        'clients': int(clients.nunique()),
+        'visits': len(rows),
+        'revenue': int(rows['Цена'].sum()),
+        'by_direction': by_direction,
+    }
+
+
+class PeriodSummaries:
+    """Итоги дня и месяца по выборкам хранилища - замена Rollups без загрузки всей базы"""
+
+    def __init__(self, store):
+        self.store = store
+        self._summaries = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def periods(self, level):
+        months = self.store.months()
+        return months if level == "month" else []
+
+    def summary(self, level, period):
+        start = pd.Timestamp(period if level == "day" else period + "-01")
+        end = start + (pd.Timedelta(days=1) if level == "day" else pd.offsets.MonthBegin(1))
+        stamp = self.store.disk_signature()
+        with self._lock:
+            if stamp != self._stamp:
+                self._summaries.clear()
+                self._stamp = stamp
+            summary = self._summaries.get((level, period))
+            if summary is None:
+                summary = self._summaries[(level, period)] = summarize(self.store.period_frame(start, end))
+            return summary
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollups(store):
+    """Сводки, подписанные на хранилище, - одни на процесс"""
+    with _rollups_lock:
+        rollups = _rollups.get(store.path)
+        if rollups is None:
+            rollups = _rollups[store.path] = Rollups(store)
+            store.subscribe(rollups)
+        return rollups
+
+
+_summaries = {}
+_summaries_lock = threading.Lock()
+
+
+def get_period_summaries(store):
+    """Итоги периодов по выборкам хранилища - одни на процесс"""
+    with _summaries_lock:
+        summaries = _summaries.get(store.path)
+        if summaries is None:
+            summaries = _summaries[store.path] = PeriodSummaries(store)
+        return summaries
@@ -0,0 +1,226 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrumentation import metrics
+
+# --- ФОНОВЫЕ ЗАДАЧИ ---
+# Тяжелая работа выполняется в пуле потоков процесса, а не в rerun пользователя:
+# компакция журнала, пересчет когорт и итогов страницы Аналитика, миграция схемы.
+# Запросы на задачу откладываются на DEBOUNCE_SECONDS и сливаются: серия
+# сохранений формы дает один пересчет, но не позже MAX_DELAY_SECONDS после
+# первого запроса. Одна задача не выполняется в двух потоках сразу - запрос во
+# время выполнения приводит к одному повтору после него. Задачи подписаны на
+# хранилище: после загрузки и записей они запрашиваются сами, при старте -
+# прогревают кэши.
+
+WORKERS = 2
+DEBOUNCE_SECONDS = 1.0
+MAX_DELAY_SECONDS = 10.0
+
+IDLE = "ожидает"
+SCHEDULED = "запланирована"
+RUNNING = "выполняется"
+DONE = "готово"
+FAILED = "ошибка"
+
+
+class Job:
+    __slots__ = ("name", "title", "func", "delay", "state", "runs", "last_seconds",
+                 "finished_at", "error", "progress", "rerun")
+
+    def __init__(self, name, title, func, delay):
+        self.name = name
+        self.title = title
+        self.func = func
+        self.delay = delay
+        self.state = IDLE
+        self.runs = 0
+        self.last_seconds = None
+        self.finished_at = None
+        self.error = None
+        self.progress = None
+        self.rerun = False
+
+
+class Scheduler:
+    """Пул фоновых задач с отложенным и слитым запуском"""
+
+    def __init__(self, workers=WORKERS, max_delay=MAX_DELAY_SECONDS):
+        self.max_delay = max_delay
+        self.jobs = {}
+        self._due = {}        # задача -> момент запуска
+        self._requested = {}  # задача -> момент первого неисполненного запроса
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="marketing-job")
+        self._wake = threading.Condition()
+        self._dispatcher = None
+
+    def register(self, name, title, func, delay=DEBOUNCE_SECONDS):
+        self.jobs[name] = Job(name, title, func, delay)
+
+    # --- ЗАПРОСЫ ---
+    def request(self, name, delay=None):
+        """Планирует задачу; повторные запросы до запуска сливаются в один"""
+        job = self.jobs[name]
+        delay = job.delay if delay is None else delay
+        with self._wake:
+            now = time.monotonic()
+            first = self._requested.setdefault(name, now)
+            self._due[name] = min(now + delay, first + self.max_delay)
+            if job.state != RUNNING:
+                job.state = SCHEDULED
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="marketing-scheduler",
+                                                    daemon=True)
+                self._dispatcher.start()
+            self._wake.notify()
+
+    def request_all(self, delay=None):
+        for name in self.jobs:
+            self.request(name, delay)
+
+    def wait(self, name, timeout=None):
+        """Ждет, пока задача не будет ни запланирована, ни выполняться; True - дождались"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self.jobs[name]
+        with self._wake:
+            while job.state in (SCHEDULED, RUNNING):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wake.wait(remaining)
+        return True
+
+    # --- ВЫПОЛНЕНИЕ ---
+    def _dispatch(self):
+        while True:
+            with self._wake:
+                now = time.monotonic()
+                ready = [name for name, due in self._due.items() if due <= now]
+                for name in ready:
+                    job = self.jobs[name]
+                    if job.state == RUNNING:
+                        # Выполняется - повторим один раз после окончания
+                        job.rerun = True
+                    else:
+                        job.state = RUNNING
+                        self._pool.submit(self._run, job)
+                    del self._due[name]
+                    del self._requested[name]
+                if not ready:
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._wake.wait(timeout)
+
+    def _run(self, job):
+        started = time.perf_counter()
+        error = None
+        try:
+            with metrics.stage(f"job_{job.name}"):
+                job.func(job)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        with self._wake:
+            job.runs += 1
+            job.last_seconds = time.perf_counter() - started
+            job.finished_at = time.time()
+            job.error = error
+            job.progress = None
+            job.state = FAILED if error else DONE
+            if job.rerun:
+                job.rerun = False
+                job.state = SCHEDULED
+                self._due[job.name] = time.monotonic()
+                self._requested[job.name] = time.monotonic()
+            self._wake.notify_all()
+
+    # --- СОСТОЯНИЕ ---
+    def busy(self):
+        return [job for job in self.jobs.values() if job.state in (SCHEDULED, RUNNING)]
+
+    def status(self):
+        """Строки для таблицы состояния задач"""
+        with self._wake:
+            return [
+                {
+                    "Задача": job.title,
+                    "Состояние": job.progress if job.state == RUNNING and job.progress else job.state,
+                    "Запусков": job.runs,
+                    "мс": None if job.last_seconds is None else round(job.last_seconds * 1000, 1),
+                    "Ошибка": job.error or "",
+                }
+                for job in self.jobs.values()
+            ]
+
+
+class StoreJobs:
+    """Подписка планировщика на хранилище: записи и загрузки запрашивают пересчеты"""
+
+    def __init__(self, scheduler, names):
+        self.scheduler = scheduler
+        self.names = names
+
+    def _request(self, rows=None):
+        for name in self.names:
+            self.scheduler.request(name)
+
+    on_append = on_delete = on_compact = _request
+
+    def on_reload(self, df):
+        # Загрузка при старте или после внешних изменений - прогреваем сразу
+        for name in self.names:
+            self.scheduler.request(name, delay=0)
+
+
+def compact_job(store):
+    def run(job):
+        if store.needs_compaction():
+            store.compact()
+    return run
+
+
+def cohorts_job(cohorts):
+    def run(job):
+        cohorts.report(True)
+        cohorts.report(False)
+    return run
+
+
+def analytics_job(engine):
+    def run(job):
+        engine.query()
+        engine.options("Направление")
+        engine.options("Услуга")
+    return run
+
+
+def migrate_job(path):
+    def run(job):
+        from .migrations import migrate
+
+        def progress(version, rows_done):
+            job.progress = f"миграция {version}: {rows_done:,} строк"
+
+        migrate(path, progress=progress)
+    return run
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(store):
+    """Фоновые задачи хранилища - один пул на процесс"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(store.path)
+        if scheduler is None:
+            from .cohorts import get_cohorts
+            from .query import get_query_engine
+
+            scheduler = _schedulers[store.path] = Scheduler()
+            scheduler.register("compact", "Компакция журнала", compact_job(store))
+            scheduler.register("cohorts", "Когорты", cohorts_job(get_cohorts(store)))
+            scheduler.register("analytics", "Итоги аналитики", analytics_job(get_query_engine(store)))
+            # Миграция запускается только по кнопке, не по записям
+            scheduler.register("migrate", "Миграция схемы", migrate_job(store.path), delay=0)
+            store.subscribe(StoreJobs(scheduler, ["compact", "cohorts", "analytics"]))
+        return scheduler
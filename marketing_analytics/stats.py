@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pandas as pd
+
+# --- АГРЕГАЦИЯ ПО НАПРАВЛЕНИЯМ ---
+DIRECTIONS = ["Учеба", "Продукты", "Цветочный", "Почта", "Chop", "Случайный"]
+
+DIRECTION_ICONS = {
+    "Учеба": "📚",
+    "Продукты": "🛍️",
+    "Цветочный": "💐",
+    "Почта": "📮",
+    "Chop": "✂️",
+    "Случайный": "🎲",
+}
+
+# --- ЦЕНЫ УСЛУГ ---
+SERVICE_PRICES = {
+    "Стрижка": 900,
+    "Борода": 500,
+    "VIP": 500,
+    "Удаление воском 1": 200,
+    "Удаление воском 2": 300,
+    "Уходовая маска Nishman": 1000,
+    "Стрижка+борода": 1400,
+    "Детская": 800,
+    "Под машинку": 900
+}
+
+
+def direction_table(by_direction):
+    """Таблица Направление / clients / income по разбивке из сводок.
+
+    Сначала идут известные направления (с нулями, если посещений нет), затем новые.
+    """
+    order = DIRECTIONS + [d for d in by_direction if d not in DIRECTIONS]
+    empty = {'clients': 0, 'revenue': 0}
+    return pd.DataFrame({
+        'Направление': order,
+        'clients': [by_direction.get(d, empty)['clients'] for d in order],
+        'income': [by_direction.get(d, empty)['revenue'] for d in order],
+    })
+
+
+def get_today_stats(rollups):
+    today = datetime.now().strftime("%Y-%m-%d")
+    summary = rollups.summary("day", today)
+
+    clients_today = summary['clients']
+    records_today = summary['visits']
+    income_today = summary['revenue']
+    salary_today = income_today * 0.4
+
+    return clients_today, records_today, income_today, salary_today
+
+
+def get_month_stats(rollups, year_month=None):
+    if year_month is None:
+        year_month = datetime.now().strftime("%Y-%m")
+
+    summary = rollups.summary("month", year_month)
+
+    return {
+        'all_clients': summary['clients'],
+        'all_income': summary['revenue'],
+        'by_direction': direction_table(summary['by_direction']),
+    }
+
+
+def available_months(rollups):
+    return sorted(rollups.periods("month"), reverse=True)
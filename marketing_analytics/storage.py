@@ -0,0 +1,968 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import metrics
+
+# --- ХРАНИЛИЩЕ ПОСЕЩЕНИЙ ---
+# Базовый снимок лежит в marketing_database.csv, а все изменения после него
+# дописываются по одной записи в журнал marketing_database.log (JSON Lines):
+#   {"op": "add", "visit": {...}}      - новое посещение
+#   {"op": "del", "visit_id": "..."}   - удаление (tombstone)
+# При загрузке журнал накатывается поверх снимка. Когда журнал разрастается,
+# снимок перезаписывается целиком (компакция), а журнал обнуляется.
+#
+# Хранилище держит разобранный DataFrame в памяти процесса, общий для всех
+# сессий Streamlit. Повторный разбор происходит только если файлы изменились
+# не через это хранилище (сверяется mtime/размер снимка и журнала).
+#
+# Производные структуры (сводки, индексы) подписываются на хранилище через
+# subscribe() и получают уведомления:
+#   on_append(rows)  - добавлены посещения (DataFrame)
+#   on_delete(rows)  - удалены посещения (DataFrame удаленных строк)
+#   on_reload(df)    - данные перечитаны или перезаписаны целиком
+#   on_compact(df)   - журнал свернут в снимок, данные не изменились
+# Обработчики необязательны: отсутствующие просто пропускаются.
+#
+# Формат снимка задается переменной окружения MARKETING_STORAGE_FORMAT:
+#   csv (по умолчанию), parquet или feather. Колоночные форматы хранят
+# Направление/Услугу/Согласие словарем (category), а Цену - как int32;
+# для них нужен pyarrow. Формат sqlite хранит посещения во встроенной базе
+# SQLite с индексами вместо снимка с журналом (см. SqliteStore). Формат
+# partitioned делит снимок по месяцам и ведет манифест (см. PartitionedStore).
+# Конвертер между любыми форматами: python -m marketing_analytics.storage convert SRC DST.
+#
+# Все записи идут под межпроцессной блокировкой marketing_database.lock:
+# внутри нее кэш сверяется с диском, а полная перезапись снимка сливается с
+# последней версией на диске и делается через временный файл и os.replace.
+
+FORMAT_SUFFIXES = {
+    "csv": ".csv", "parquet": ".parquet", "feather": ".feather", "sqlite": ".sqlite",
+    "partitioned": ".parts",
+}
+STORAGE_FORMAT = os.environ.get("MARKETING_STORAGE_FORMAT", "csv")
+
+DB_PATH = "marketing_database" + FORMAT_SUFFIXES[STORAGE_FORMAT]
+LOG_SUFFIX = ".log"
+LOCK_SUFFIX = ".lock"
+COMPACT_THRESHOLD = 1000
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+COLUMNS = [
+    "visit_id", "client_id", "Дата", "Направление", "Имя", "Телефон", "Услуга",
+    "Цена", "Кто_пригласил", "Место_учебы", "Ссылка_VK", "Согласие_рассылка"
+]
+
+
+TEXT_COLUMNS = ["visit_id", "client_id", "Имя", "Телефон", "Кто_пригласил", "Место_учебы", "Ссылка_VK"]
+CATEGORY_COLUMNS = ["Направление", "Услуга", "Согласие_рассылка"]
+
+
+def empty_frame():
+    return pd.DataFrame(columns=COLUMNS)
+
+
+# --- SQLITE ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    visit_id TEXT PRIMARY KEY,
+    client_id TEXT,
+    "Дата" TEXT,
+    "Направление" TEXT,
+    "Имя" TEXT,
+    "Телефон" TEXT,
+    "Услуга" TEXT,
+    "Цена" INTEGER,
+    "Кто_пригласил" TEXT,
+    "Место_учебы" TEXT,
+    "Ссылка_VK" TEXT,
+    "Согласие_рассылка" TEXT
+);
+CREATE INDEX IF NOT EXISTS visits_client_id ON visits (client_id);
+CREATE INDEX IF NOT EXISTS visits_date ON visits ("Дата");
+CREATE INDEX IF NOT EXISTS visits_direction ON visits ("Направление", "Дата");
+"""
+
+SQLITE_INSERT = "INSERT OR REPLACE INTO visits ({}) VALUES ({})".format(
+    ", ".join(f'"{column}"' for column in COLUMNS), ", ".join("?" for _ in COLUMNS)
+)
+
+
+def sqlite_connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
+
+
+def sqlite_value(value):
+    """Значение ячейки в виде, пригодном для параметра запроса"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime(DATE_FORMAT)
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+# --- ФОРМАТЫ СНИМКА ---
+def storage_format(path):
+    suffix = os.path.splitext(path)[1]
+    for fmt, fmt_suffix in FORMAT_SUFFIXES.items():
+        if suffix == fmt_suffix:
+            return fmt
+    raise ValueError(f"Неизвестный формат базы: {path}")
+
+
+def read_frame(path):
+    fmt = storage_format(path)
+    if fmt == "csv":
+        # Текст читаем как текст: иначе телефоны превращаются в float
+        dtype = {column: str for column in TEXT_COLUMNS + CATEGORY_COLUMNS}
+        return pd.read_csv(path, encoding='utf-8', dtype=dtype)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    if fmt == "partitioned":
+        return read_partitions(path)
+    if fmt == "sqlite":
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        with closing(sqlite_connect(path)) as conn:
+            return pd.read_sql_query('SELECT * FROM visits ORDER BY "Дата"', conn)
+    return pd.read_feather(path)
+
+
+def write_frame_atomic(df, path, raw_dates=None):
+    """Пишет снимок во временный файл и подменяет им старый одной операцией"""
+    stem, suffix = os.path.splitext(path)
+    tmp_path = f"{stem}.tmp{suffix}"
+    write_frame(df, tmp_path, raw_dates)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_frame(df, path, raw_dates=None):
+    """Пишет снимок; raw_dates - исходные строки неразобранных дат (см. to_typed)"""
+    fmt = storage_format(path)
+    if fmt == "partitioned":
+        write_partitions(df, path, raw_dates=raw_dates)
+        return
+    df = with_raw_dates(df, raw_dates)
+    if fmt == "csv":
+        df.to_csv(path, index=False, encoding='utf-8', date_format=DATE_FORMAT)
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "sqlite":
+        rows = [tuple(sqlite_value(value) for value in row)
+                for row in df[COLUMNS].itertuples(index=False, name=None)]
+        with closing(sqlite_connect(path)) as conn, conn:
+            conn.execute("DELETE FROM visits")
+            conn.executemany(SQLITE_INSERT, rows)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
+
+# --- ВРЕМЕННОЙ ИНДЕКС ---
+# В памяти Дата всегда datetime64, а строки упорядочены по времени. Поэтому
+# выборки за день/месяц/диапазон - это бинарный поиск, а не сканирование строк.
+# Дата, которую не удалось разобрать, в памяти - NaT; ее исходная строка
+# хранится у хранилища по visit_id и возвращается в файл при перезаписи,
+# чтобы компакция не стирала данные.
+def to_typed(df, raw_dates=None):
+    """Приводит колонки к типам хранилища и сортирует строки по времени.
+
+    raw_dates - словарь visit_id -> исходная Дата, в который добавляются
+    строки с неразобранной датой.
+    """
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna('').astype(str)
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].fillna('').astype(str).astype('category')
+    df['Цена'] = pd.to_numeric(df['Цена'], errors='coerce').fillna(0).astype('int32')
+    dates = pd.to_datetime(df['Дата'], format='ISO8601', errors='coerce')
+    if raw_dates is not None and 'visit_id' in df.columns:
+        unparsed = dates.isna() & df['Дата'].notna()
+        if unparsed.any():
+            text = df.loc[unparsed, 'Дата'].astype(str).str.strip()
+            text = text[text != '']
+            raw_dates.update(zip(df.loc[text.index, 'visit_id'], text))
+    df['Дата'] = dates
+    return df.sort_values('Дата', kind='stable', ignore_index=True)
+
+
+def date_strings(df, raw_dates=None):
+    """Дата строками для записи; неразобранные даты - в исходном виде"""
+    dates = df['Дата'].dt.strftime(DATE_FORMAT)
+    if raw_dates:
+        missing = dates.isna()
+        if missing.any():
+            dates = dates.where(~missing, df['visit_id'].map(raw_dates))
+    return dates
+
+
+def with_raw_dates(df, raw_dates):
+    """Строки для записи в файл: с исходными неразобранными датами, если они есть"""
+    if not raw_dates or not df['Дата'].isna().any():
+        return df
+    return df.assign(Дата=date_strings(df, raw_dates))
+
+
+def align_categories(df, rows):
+    """Приводит словари категорий к общему виду, чтобы concat их не терял"""
+    for column in CATEGORY_COLUMNS:
+        categories = df[column].cat.categories
+        new = rows[column].cat.categories.difference(categories)
+        if len(new):
+            df = df.assign(**{column: df[column].cat.add_categories(new)})
+            categories = df[column].cat.categories
+        rows = rows.assign(**{column: pd.Categorical(rows[column].astype(str), categories=categories)})
+    return df, rows
+
+
+def insert_sorted(df, rows):
+    """Добавляет строки с сохранением порядка по времени"""
+    if df.empty:
+        return rows.reset_index(drop=True)
+    df, rows = align_categories(df, rows)
+    merged = pd.concat([df, rows], ignore_index=True)
+    if rows['Дата'].min() >= df['Дата'].iloc[-1]:
+        # Обычный случай - новое посещение позже всех остальных
+        return merged
+    return merged.sort_values('Дата', kind='stable', ignore_index=True)
+
+
+def time_slice(df, start, end):
+    """Посещения с start <= Дата < end"""
+    lo, hi = df['Дата'].searchsorted([pd.Timestamp(start), pd.Timestamp(end)])
+    return df.iloc[lo:hi]
+
+
+def day_slice(df, day):
+    start = pd.Timestamp(day).normalize()
+    return time_slice(df, start, start + pd.Timedelta(days=1))
+
+
+def month_slice(df, year_month):
+    start = pd.Timestamp(year_month + "-01")
+    return time_slice(df, start, start + pd.offsets.MonthBegin(1))
+
+
+# --- ПОМЕСЯЧНЫЕ ПАРТИЦИИ ---
+# База формата partitioned - каталог marketing_database.parts: по снимку на
+# месяц (2026-10.csv) и манифест manifest.json с числом строк, выручкой и
+# первой/последней датой каждой партиции. Выборка за период открывает только
+# партиции, чьи даты с ним пересекаются, итоги за все время складываются из
+# манифеста. Манифест пишется последним, поэтому его отпечаток меняется при
+# любой перезаписи партиций.
+PARTITION_SUFFIX = ".csv"
+MANIFEST_NAME = "manifest.json"
+UNDATED_PARTITION = "undated"  # строки, дату которых не удалось разобрать
+
+
+def manifest_path(path):
+    return os.path.join(path, MANIFEST_NAME)
+
+
+def partition_path(path, month):
+    return os.path.join(path, month + PARTITION_SUFFIX)
+
+
+def read_manifest(path):
+    """{месяц: {"rows", "revenue", "min_date", "max_date"}}; без манифеста партиций нет"""
+    try:
+        with open(manifest_path(path), encoding='utf-8') as f:
+            return json.load(f)["partitions"]
+    except FileNotFoundError:
+        return {}
+
+
+def month_keys(dates):
+    """Партиции для дат (строк или Timestamp)"""
+    dates = pd.to_datetime(pd.Series(dates, dtype=object), format='ISO8601', errors='coerce')
+    return set(dates.dt.strftime('%Y-%m').fillna(UNDATED_PARTITION))
+
+
+def sorted_by_date(df):
+    """df с Датой-datetime, упорядоченный по времени (пустые даты в конце)"""
+    dates = df['Дата']
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dated = int(dates.notna().sum())
+        if dates.iloc[:dated].is_monotonic_increasing and dates.iloc[dated:].isna().all():
+            return df
+    return to_typed(df.copy())
+
+
+def month_ranges(df):
+    """(месяц, начало, конец) для строк упорядоченного по времени df"""
+    dates = df['Дата']
+    dated = int(dates.notna().sum())
+    if dated:
+        starts = pd.date_range(dates.iloc[0].to_period('M').start_time, dates.iloc[dated - 1], freq='MS')
+        bounds = list(dates.iloc[:dated].searchsorted(starts)) + [dated]
+        for month, lo, hi in zip(starts, bounds, bounds[1:]):
+            if hi > lo:
+                yield month.strftime('%Y-%m'), lo, hi
+    if dated < len(df):
+        yield UNDATED_PARTITION, dated, len(df)
+
+
+def read_partitions(path, months=None):
+    """Строки партиций (все или только months) одним DataFrame"""
+    manifest = read_manifest(path)
+    frames = [read_frame(partition_path(path, month)) for month in sorted(manifest)
+              if months is None or month in months]
+    return pd.concat(frames, ignore_index=True) if frames else empty_frame()
+
+
+def write_partitions(df, path, months=None, raw_dates=None):
+    """Пишет помесячные снимки и манифест; months - переписать только эти месяцы.
+
+    Возвращает переписанные месяцы.
+    """
+    os.makedirs(path, exist_ok=True)
+    df = sorted_by_date(df)
+    manifest = {} if months is None else read_manifest(path)
+    if months is not None:
+        # Месяцы, где строк не осталось, пропадут из манифеста
+        for month in months:
+            manifest.pop(month, None)
+    written = []
+    for month, lo, hi in month_ranges(df):
+        if months is not None and month not in months:
+            continue
+        part = df.iloc[lo:hi]
+        write_frame_atomic(part, partition_path(path, month), raw_dates)
+        dates = part['Дата'].dropna()
+        manifest[month] = {
+            "rows": len(part),
+            "revenue": int(pd.to_numeric(part['Цена'], errors='coerce').fillna(0).sum()),
+            "min_date": dates.iloc[0].strftime(DATE_FORMAT) if len(dates) else None,
+            "max_date": dates.iloc[-1].strftime(DATE_FORMAT) if len(dates) else None,
+        }
+        written.append(month)
+
+    tmp_path = manifest_path(path) + ".tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump({"partitions": dict(sorted(manifest.items()))}, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(path))
+
+    # Снимки месяцев, которых больше нет в манифесте
+    for name in os.listdir(path):
+        stem, suffix = os.path.splitext(name)
+        if suffix == PARTITION_SUFFIX and stem not in manifest:
+            os.remove(os.path.join(path, name))
+    return written
+
+
+# --- БЛОКИРОВКА И МЕТРИКИ ЗАПИСИ ---
+@contextmanager
+def file_lock(path):
+    """Эксклюзивная advisory-блокировка между процессами; отдает время ожидания"""
+    started = time.perf_counter()
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield time.perf_counter() - started
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class WriteStats:
+    """Ожидание блокировки и длительность записей хранилища"""
+
+    def __init__(self):
+        self.writes = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        self.write_total = 0.0
+        self.write_max = 0.0
+
+    def record(self, lock_wait, duration):
+        self.writes += 1
+        self.lock_wait_total += lock_wait
+        self.lock_wait_max = max(self.lock_wait_max, lock_wait)
+        self.write_total += duration
+        self.write_max = max(self.write_max, duration)
+
+    def as_dict(self):
+        return {
+            "writes": self.writes,
+            "lock_wait_total_seconds": self.lock_wait_total,
+            "lock_wait_max_seconds": self.lock_wait_max,
+            "write_total_seconds": self.write_total,
+            "write_max_seconds": self.write_max,
+        }
+
+
+class VisitStore:
+    """Общая часть хранилищ: кэш в памяти процесса, подписчики и выборки.
+
+    Наследники реализуют load(), _persist_append(), _persist_delete() и
+    _rewrite(), а также перечисляют свои файлы в _files().
+    """
+
+    # Умеет отвечать на выборки за период, не загружая всю историю
+    partitioned = False
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = os.path.splitext(path)[0] + LOCK_SUFFIX
+        self.write_stats = WriteStats()
+        self.version = 0
+        self._df = None
+        self._signature = None
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._lock_owner = None
+        self._raw_dates = {}
+
+    def subscribe(self, listener):
+        """Подписывает производную структуру; сразу строит ее по текущим данным"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+                if self._df is not None:
+                    listener.on_reload(self._df)
+
+    def _notify(self, event, rows):
+        for listener in self._listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(rows)
+
+    # --- КЭШ В ПАМЯТИ ---
+    def _files(self):
+        return (self.path,)
+
+    def _file_signature(self):
+        signature = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _set_cached(self, df, event="on_reload", rows=None):
+        self._df = df
+        self._signature = self._file_signature()
+        self.version += 1
+        self._notify(event, df if rows is None else rows)
+
+    def data(self):
+        """Возвращает общий DataFrame; перечитывает файлы только при внешних изменениях.
+
+        Результат разделяется между сессиями - изменять его на месте нельзя.
+        """
+        with self._lock:
+            signature = self._file_signature()
+            reload = self._df is None or signature != self._signature
+            metrics.cache_hit("store", not reload)
+            if reload:
+                with metrics.stage("store_load"):
+                    self._df = self.load()
+                metrics.add("rows_read", len(self._df))
+                metrics.add("bytes_read", sum(size for _, size in filter(None, signature)))
+                self._signature = signature
+                self.version += 1
+                with metrics.stage("store_notify"):
+                    self._notify("on_reload", self._df)
+            return self._df
+
+    @property
+    def signature(self):
+        """Отпечаток файлов, которому соответствуют данные в памяти"""
+        return self._signature
+
+    def disk_signature(self):
+        """Текущий отпечаток файлов на диске - меняется с каждой записью"""
+        return self._file_signature()
+
+    def _is_cache_current(self):
+        return self._df is not None and self._file_signature() == self._signature
+
+    # --- ЗАПИСЬ ---
+    @contextmanager
+    def exclusive(self):
+        """Межпроцессная блокировка базы; отдает время ожидания.
+
+        Повторный вход из того же потока не ждет сам себя - так миграция держит
+        блокировку все время перезаписи и при этом может свернуть журнал.
+        """
+        me = threading.get_ident()
+        if self._lock_owner == me:
+            yield 0.0
+            return
+        with file_lock(self.lock_path) as lock_wait:
+            self._lock_owner = me
+            try:
+                yield lock_wait
+            finally:
+                self._lock_owner = None
+
+    @contextmanager
+    def _locked_write(self):
+        """Запись под блокировкой; отдает, совпадал ли кэш с диском до записи"""
+        # Сначала файловая блокировка, затем блокировка кэша: миграция держит
+        # файловую и берет блокировку кэша при свертке журнала - обратный порядок
+        # здесь дал бы взаимную блокировку
+        with self.exclusive() as lock_wait, self._lock:
+            started = time.perf_counter()
+            created = not any(self._file_signature())
+            yield self._is_cache_current()
+            if created:
+                # Первая запись создает базу - сразу в актуальной схеме, чтобы
+                # ее не приняли за старую по заголовку (migrations импортирует storage)
+                from .migrations import mark_current
+
+                mark_current(self.path)
+            self.write_stats.record(lock_wait, time.perf_counter() - started)
+
+    def append(self, visit):
+        """Сохраняет одно посещение, не переписывая остальные"""
+        with self._locked_write() as current:
+            self._persist_append([visit])
+            metrics.add("rows_written")
+            if current:
+                rows = to_typed(pd.DataFrame([visit]), self._raw_dates)
+                self._set_cached(insert_sorted(self._df, rows), "on_append", rows)
+
+    def append_many(self, rows):
+        """Сохраняет пачку посещений (DataFrame) одной записью и одним уведомлением"""
+        if rows.empty:
+            return
+        rows = to_typed(rows[COLUMNS].copy(), self._raw_dates)
+        records = (rows.assign(Дата=date_strings(rows, self._raw_dates))
+                   .astype(object).to_dict('records'))
+        with self._locked_write() as current:
+            self._persist_append(records)
+            metrics.add("rows_written", len(records))
+            if current:
+                self._set_cached(insert_sorted(self._df, rows), "on_append", rows)
+
+    def delete(self, visit_ids):
+        """Удаляет посещения по visit_id"""
+        visit_ids = list(visit_ids)
+        if not visit_ids:
+            return
+        with self._locked_write() as current:
+            self._persist_delete(visit_ids)
+            metrics.add("rows_deleted", len(visit_ids))
+            if current:
+                df = self._df
+                mask = df['visit_id'].isin(visit_ids)
+                self._set_cached(df[~mask].reset_index(drop=True), "on_delete", df[mask])
+
+    def needs_compaction(self):
+        return False
+
+    def _merge_latest(self, df, latest):
+        """Переносит в df изменения, сделанные другими процессами после нашей загрузки"""
+        known = self._df['visit_id'] if self._df is not None else pd.Series(dtype=str)
+        added = latest[~latest['visit_id'].isin(known)]
+        removed = known[~known.isin(latest['visit_id'])]
+        df = df[~df['visit_id'].isin(removed)]
+        if len(added):
+            df = to_typed(pd.concat([df, added], ignore_index=True))
+        return df
+
+    def compact(self, df=None):
+        """Перезаписывает базу целиком (без df - сворачивает накопленные изменения)"""
+        with self._locked_write() as current:
+            # Без df пишется ровно то, что уже есть в снимке и журнале
+            on_disk = df is None
+            if df is None:
+                df = self._df if current else self.load()
+            elif not current:
+                df = self._merge_latest(df, self.load())
+            unchanged = current and df is self._df
+            with metrics.stage("store_rewrite"):
+                self._rewrite(df, unchanged or on_disk)
+            if unchanged:
+                # Данные не изменились - обновляем только отпечаток файлов
+                self._signature = self._file_signature()
+                self._notify("on_compact", df)
+            else:
+                metrics.add("rows_written", len(df))
+                self._set_cached(df)
+
+    # --- ВЫБОРКИ ---
+    def client_history(self, client_id):
+        """Посещения клиента, новые сверху"""
+        df = self.data()
+        # Строки уже упорядочены по времени - достаточно развернуть выборку
+        return df[df['client_id'] == client_id].iloc[::-1]
+
+    def period_frame(self, start, end):
+        """Посещения с start <= Дата < end"""
+        return time_slice(self.data(), start, end)
+
+    def months(self):
+        """Месяцы ('YYYY-MM'), в которых есть посещения"""
+        dates = self.data()['Дата'].dropna().to_numpy()
+        return list(np.unique(dates.astype('datetime64[M]')).astype(str))
+
+    def totals(self):
+        """Итоги за все время: посещения, выручка, первая и последняя даты"""
+        df = self.data()
+        dates = df['Дата'].dropna()
+        return {
+            "visits": len(df),
+            "revenue": int(df['Цена'].sum()),
+            "first_date": dates.iloc[0] if len(dates) else None,
+            "last_date": dates.iloc[-1] if len(dates) else None,
+        }
+
+
+class JournalStore(VisitStore):
+    """Снимок (CSV/Parquet/Feather) + журнал добавлений/удалений"""
+
+    def __init__(self, path=DB_PATH, compact_threshold=COMPACT_THRESHOLD):
+        super().__init__(path)
+        self.log_path = os.path.splitext(path)[0] + LOG_SUFFIX
+        self.compact_threshold = compact_threshold
+        self.log_records = 0
+
+    def _files(self):
+        return (self.path, self.log_path)
+
+    # --- ЧТЕНИЕ ---
+    def read_base(self):
+        try:
+            return read_frame(self.path)
+        except FileNotFoundError:
+            return empty_frame()
+
+    def read_log(self):
+        """Возвращает добавленные посещения и tombstone-ы (visit_id -> запись) для снимка"""
+        added = {}
+        deleted = {}
+        records = 0
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после сбоя - пропускаем
+                        continue
+                    records += 1
+                    if record["op"] == "add":
+                        visit = record["visit"]
+                        added[visit["visit_id"]] = visit
+                    elif record["op"] == "del":
+                        visit_id = record["visit_id"]
+                        if added.pop(visit_id, None) is None:
+                            deleted[visit_id] = record
+        except FileNotFoundError:
+            pass
+        self.log_records = records
+        return added, deleted
+
+    @staticmethod
+    def apply_log(df, added, deleted, raw_dates=None):
+        """Накатывает разобранный журнал на строки снимка"""
+        if 'visit_id' in df.columns and (deleted or added):
+            # Записи журнала, уже попавшие в снимок (сбой между заменой снимка и
+            # очисткой журнала), заменяют строки снимка, а не дублируют их
+            df = df[~df['visit_id'].isin(deleted.keys() | added.keys())]
+        if added:
+            df = pd.concat([df, pd.DataFrame(list(added.values()))], ignore_index=True)
+        return to_typed(df, raw_dates)
+
+    def load(self):
+        df = self.read_base()
+        added, deleted = self.read_log()
+        return self.apply_log(df, added, deleted, self._raw_dates)
+
+    # --- ЗАПИСЬ ---
+    def _write_log(self, records):
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                       for record in records).encode('utf-8')
+        with open(self.log_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.add("bytes_written", len(data))
+        self.log_records += len(records)
+
+    def _persist_append(self, visits):
+        self._write_log([{"op": "add", "visit": visit} for visit in visits])
+
+    def _persist_delete(self, visit_ids):
+        self._write_log([{"op": "del", "visit_id": visit_id} for visit_id in visit_ids])
+
+    def needs_compaction(self):
+        if self.log_records < self.compact_threshold:
+            return False
+        # Прерванная миграция продолжит перезапись снимка - компакция ее не опережает
+        from .migrations import migration_in_progress
+
+        return not migration_in_progress(self.path)
+
+    def _rewrite(self, df, unchanged):
+        write_frame_atomic(df, self.path, self._raw_dates)
+        metrics.add("bytes_written", os.path.getsize(self.path))
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_records = 0
+
+
+class PartitionedStore(JournalStore):
+    """Помесячные снимки с манифестом + общий журнал.
+
+    Выборки за период и итоги за все время берутся из нужных партиций и
+    манифеста без загрузки всей базы; компакция переписывает только месяцы,
+    которых касался журнал. Tombstone-ы хранят месяц и цену удаленного
+    посещения - по ним поправляются итоги манифеста и выбираются партиции.
+    """
+
+    partitioned = True
+
+    def _files(self):
+        return (manifest_path(self.path), self.log_path)
+
+    def read_base(self):
+        return read_partitions(self.path)
+
+    # --- ВЫБОРКИ БЕЗ ПОЛНОЙ ЗАГРУЗКИ ---
+    def period_frame(self, start, end):
+        """Посещения с start <= Дата < end: только пересекающиеся партиции и журнал"""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        with self._lock:
+            if self._is_cache_current():
+                return time_slice(self._df, start, end)
+            first, last = start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+            months = [month for month, entry in read_manifest(self.path).items()
+                      if entry["min_date"] is not None and entry["min_date"] < last and entry["max_date"] >= first]
+            with metrics.stage("store_period_load"):
+                df = read_partitions(self.path, months)
+                metrics.add("rows_read", len(df))
+                added, deleted = self.read_log()
+                df = self.apply_log(df, added, deleted)
+            return time_slice(df, start, end)
+
+    def months(self):
+        with self._lock:
+            if self._is_cache_current():
+                return super().months()
+            months = {month for month, entry in read_manifest(self.path).items() if entry["rows"]}
+            added, _ = self.read_log()
+            months |= month_keys([visit.get("Дата") for visit in added.values()])
+            months.discard(UNDATED_PARTITION)
+            return sorted(months)
+
+    def totals(self):
+        """Итоги за все время: суммы манифеста с поправкой на журнал"""
+        with self._lock:
+            if self._is_cache_current():
+                return super().totals()
+            manifest = read_manifest(self.path)
+            added, deleted = self.read_log()
+            # Tombstone без месяца - посещения уже не было, итоги он не меняет
+            removed = [record for record in deleted.values() if record.get("month")]
+            first_date, last_date = self._date_bounds(manifest, deleted, {record["month"] for record in removed})
+        entries = manifest.values()
+        prices = pd.to_numeric(pd.Series([visit.get("Цена") for visit in added.values()], dtype=object),
+                               errors='coerce').fillna(0)
+        dates = pd.to_datetime(pd.Series(
+            [first_date, last_date] + [visit.get("Дата") for visit in added.values()], dtype=object,
+        ), format='ISO8601', errors='coerce').dropna()
+        return {
+            "visits": sum(entry["rows"] for entry in entries) + len(added) - len(removed),
+            "revenue": (sum(entry["revenue"] for entry in entries) + int(prices.sum())
+                        - sum(record.get("price", 0) for record in removed)),
+            "first_date": dates.min() if len(dates) else None,
+            "last_date": dates.max() if len(dates) else None,
+        }
+
+    def _date_bounds(self, manifest, deleted, touched):
+        """Первая и последняя даты снимка ('YYYY-MM-DD HH:MM:SS' или None) с учетом удалений.
+
+        Границы берутся из манифеста; если удаление коснулось крайнего месяца,
+        его границы пересчитываются по партиции - удалено могло быть именно
+        крайнее посещение.
+        """
+        months = sorted(month for month, entry in manifest.items() if entry["min_date"] is not None)
+        recomputed = {}
+
+        def bounds(month):
+            if month not in touched:
+                return manifest[month]["min_date"], manifest[month]["max_date"]
+            if month not in recomputed:
+                part = read_frame(partition_path(self.path, month))
+                part = part[~part['visit_id'].isin(deleted.keys())]
+                dates = pd.to_datetime(part['Дата'], format='ISO8601', errors='coerce').dropna()
+                recomputed[month] = ((None, None) if dates.empty else
+                                     (dates.min().strftime(DATE_FORMAT), dates.max().strftime(DATE_FORMAT)))
+            return recomputed[month]
+
+        first = next(filter(None, (bounds(month)[0] for month in months)), None)
+        last = next(filter(None, (bounds(month)[1] for month in reversed(months))), None)
+        return first, last
+
+    # --- ЗАПИСЬ ---
+    def _persist_delete(self, visit_ids):
+        df = self._df if self._is_cache_current() else self.load()
+        rows = df[df['visit_id'].isin(visit_ids)]
+        found = dict(zip(rows['visit_id'], zip(rows['Дата'], rows['Цена'].tolist())))
+        records = []
+        for visit_id in visit_ids:
+            record = {"op": "del", "visit_id": visit_id}
+            if visit_id in found:
+                date, price = found[visit_id]
+                record["month"] = UNDATED_PARTITION if pd.isna(date) else date.strftime('%Y-%m')
+                record["price"] = price
+            records.append(record)
+        self._write_log(records)
+
+    def _journal_months(self):
+        """Месяцы, которых касаются записи журнала"""
+        added, deleted = self.read_log()
+        months = month_keys([visit.get("Дата") for visit in added.values()])
+        return months | {record["month"] for record in deleted.values() if record.get("month")}
+
+    def _rewrite(self, df, unchanged):
+        # Данные совпадают со снимком и журналом - достаточно переписать месяцы из журнала
+        written = write_partitions(df, self.path, self._journal_months() if unchanged else None,
+                                   self._raw_dates)
+        metrics.add("bytes_written", sum(os.path.getsize(partition_path(self.path, month)) for month in written))
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_records = 0
+
+
+class SqliteStore(VisitStore):
+    """Встроенная SQLite-база: индексы по client_id, Дате и Направлению, режим WAL.
+
+    Каждая операция открывает свое соединение, поэтому несколько сессий и
+    процессов могут писать одновременно - блокировки берет сама SQLite.
+    """
+
+    def _files(self):
+        return (self.path, self.path + "-wal")
+
+    def _connect(self):
+        return sqlite_connect(self.path)
+
+    def load(self):
+        try:
+            return to_typed(read_frame(self.path), self._raw_dates)
+        except FileNotFoundError:
+            return to_typed(empty_frame())
+
+    def _persist_append(self, visits):
+        rows = [tuple(sqlite_value(visit.get(column)) for column in COLUMNS) for visit in visits]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(SQLITE_INSERT, rows)
+
+    def _persist_delete(self, visit_ids):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM visits WHERE visit_id = ?", [(v,) for v in visit_ids])
+
+    def _rewrite(self, df, unchanged):
+        if unchanged:
+            with closing(self._connect()) as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        else:
+            write_frame(df, self.path, self._raw_dates)
+            metrics.add("bytes_written", os.path.getsize(self.path))
+
+    def client_history(self, client_id):
+        """Посещения клиента по индексу client_id, новые сверху"""
+        with closing(self._connect()) as conn:
+            history = pd.read_sql_query(
+                'SELECT * FROM visits WHERE client_id = ? ORDER BY "Дата" DESC',
+                conn, params=(client_id,),
+            )
+        return to_typed(history).iloc[::-1].reset_index(drop=True)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_class(path):
+    fmt = storage_format(path)
+    if fmt == "sqlite":
+        return SqliteStore
+    if fmt == "partitioned":
+        return PartitionedStore
+    return JournalStore
+
+
+def get_store(path=DB_PATH):
+    """Единственный экземпляр хранилища на файл в пределах процесса"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = store_class(path)(path)
+        return store
+
+
+def convert(src, dst):
+    """Переносит базу в другой формат и проверяет, что без потерь.
+
+    Журнал сначала сворачивается в исходный снимок: у снимков с одним именем
+    общий журнал, и иначе его записи попали бы в новый снимок дважды.
+    """
+    source = store_class(src)(src)
+    source.compact()
+    df = source.data()
+    write_frame(df, dst, source._raw_dates)
+    # Строки без даты каждый формат упорядочивает по-своему - сравниваем по (Дата, visit_id)
+    key = ['Дата', 'visit_id']
+    converted = to_typed(read_frame(dst)).sort_values(key, ignore_index=True)
+    if not converted.equals(df.sort_values(key, ignore_index=True)):
+        raise ValueError(f"Конвертация {src} -> {dst} прошла с потерями")
+    return len(df)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обслуживание базы посещений")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("compact", help="свернуть журнал в снимок")
+    convert_parser = commands.add_parser(
+        "convert", help="перевести базу в другой формат (csv/parquet/feather/sqlite/partitioned)")
+    convert_parser.add_argument("src")
+    convert_parser.add_argument("dst")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        store = get_store()
+        store.compact()
+        print(f"Снимок {store.path} пересобран, журнал очищен")
+    else:
+        rows = convert(args.src, args.dst)
+        print(f"{args.src} -> {args.dst}: {rows} строк")
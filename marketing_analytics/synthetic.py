@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from .contacts import CONTACT_COLUMNS, contacts_path
+from .identity import client_ids_for, contact_ids_for, hex_ids
+from .stats import DIRECTIONS, SERVICE_PRICES
+from .storage import COLUMNS, DATE_FORMAT, to_typed
+
+# --- СИНТЕТИЧЕСКИЕ ДАННЫЕ ---
+# Детерминированный генератор посещений для замеров: одинаковые rows и seed
+# дают побайтно одинаковую базу. Распределения похожи на настоящие: частота
+# посещений у клиентов неравномерная (немногие постоянные дают большую часть
+# визитов), у каждого клиента свое основное направление, часть клиентов пришла
+# по приглашению. Контакты рассылки генерируются отдельно - около 2% от числа
+# посещений.
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+VISITS_PER_CLIENT = 8
+CONTACT_SHARE = 0.02
+REFERRED_SHARE = 0.2
+DIRECTION_WEIGHTS = [0.3, 0.2, 0.1, 0.1, 0.2, 0.1]
+SERVICE_WEIGHTS = [0.35, 0.1, 0.03, 0.03, 0.03, 0.04, 0.2, 0.07, 0.15]
+FIRST_NAMES = ["Иван", "Петр", "Алексей", "Дмитрий", "Сергей", "Андрей", "Максим",
+               "Артем", "Михаил", "Никита", "Егор", "Кирилл", "Илья", "Роман"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров",
+              "Соколов", "Михайлов", "Новиков", "Федоров", "Морозов", "Волков"]
+STUDY_PLACES = ["", "", "", "МГУ", "ВШЭ", "МФТИ", "Колледж"]
+
+
+def parse_size(size):
+    """'100k' / '1m' / '25000' -> число строк"""
+    return SIZES.get(str(size).lower()) or int(size)
+
+
+def generate_visits(rows, seed=0, start="2022-01-01", days=3 * 365):
+    """DataFrame из rows посещений в типах хранилища, упорядоченный по времени"""
+    rng = np.random.default_rng(seed)
+    clients = max(1, rows // VISITS_PER_CLIENT)
+
+    # Клиенты: имя, уникальный телефон, основное направление, кто пригласил
+    names = (np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=clients)] + " "
+             + np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=clients)])
+    phones = np.array([f"+79{number:09d}" for number in rng.permutation(clients)], dtype=object)
+    client_ids = client_ids_for(names, phones)
+    home = rng.choice(len(DIRECTIONS), size=clients, p=DIRECTION_WEIGHTS)
+    referrer = rng.integers(clients, size=clients)
+    referred = (rng.random(clients) < REFERRED_SHARE) & (referrer != np.arange(clients))
+    invited_by = np.where(referred, names[referrer], "")
+
+    # Посещения: клиент по распределению с тяжелым хвостом, время в часы работы
+    weights = rng.pareto(1.5, size=clients) + 1
+    who = rng.choice(clients, size=rows, p=weights / weights.sum())
+    day = rng.integers(days, size=rows)
+    second = rng.integers(10 * 3600, 21 * 3600, size=rows)
+    moments = np.sort(np.datetime64(start, "s") + day * 86400 + second)
+
+    services = np.array(list(SERVICE_PRICES), dtype=object)
+    service = rng.choice(len(services), size=rows, p=SERVICE_WEIGHTS)
+    directions = np.array(DIRECTIONS, dtype=object)[home[who]]
+    prices = np.array(list(SERVICE_PRICES.values()), dtype="int32")[service]
+    service = services[service]
+
+    df = pd.DataFrame({
+        "visit_id": "",
+        "client_id": client_ids[who],
+        "Дата": moments.astype("datetime64[ns]"),
+        "Направление": directions,
+        "Имя": names[who],
+        "Телефон": phones[who],
+        "Услуга": service,
+        "Цена": prices,
+        "Кто_пригласил": invited_by[who],
+        "Место_учебы": "",
+        "Ссылка_VK": "",
+        "Согласие_рассылка": "",
+    }, columns=COLUMNS)
+    # visit_id - 64-битный хэш (seed, номер строки), в том же виде, что дает миграция
+    numbers = np.arange(1, rows + 1, dtype="uint64") + np.uint64(seed << 40)
+    df["visit_id"] = hex_ids(pd.util.hash_array(numbers))
+    return to_typed(df)
+
+
+def generate_contacts(count, seed=0, start="2022-01-01", days=3 * 365):
+    """DataFrame из count контактов рассылки с уникальными client_id"""
+    rng = np.random.default_rng([seed, 1])
+    names = (np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=count)] + " "
+             + np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=count)])
+    # Телефона у контакта нет - различаем однофамильцев по ссылке VK
+    vk_links = np.array([f"https://vk.com/id{number}" for number in rng.permutation(count) + 1], dtype=object)
+    moments = np.datetime64(start, "s") + rng.integers(days * 86400, size=count)
+    return pd.DataFrame({
+        # Ссылка есть у всех, собственные ключи (own_ids) не понадобятся
+        "client_id": contact_ids_for(names, vk_links, hex_ids(np.arange(count))),
+        "Дата": pd.Series(moments).dt.strftime(DATE_FORMAT),
+        "Имя": names,
+        "Место_учебы": np.array(STUDY_PLACES, dtype=object)[rng.integers(len(STUDY_PLACES), size=count)],
+        "Ссылка_VK": vk_links,
+        "Согласие_рассылка": np.where(rng.random(count) < 0.8, "Да", "Нет"),
+    }, columns=CONTACT_COLUMNS)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .migrations import mark_current
+    from .storage import write_frame, write_frame_atomic
+
+    parser = argparse.ArgumentParser(description="Синтетическая база посещений для замеров")
+    parser.add_argument("size", help="число строк: 10k, 100k, 1m, 10m или число")
+    parser.add_argument("output", help="файл базы (.csv, .parquet, .feather или .sqlite)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = generate_visits(parse_size(args.size), args.seed)
+    write_frame(df, args.output)
+    contacts = generate_contacts(int(len(df) * CONTACT_SHARE), args.seed)
+    write_frame_atomic(contacts, contacts_path(args.output))
+    # База сразу в текущей схеме - отмечаем, чтобы приложение не запускало миграции
+    mark_current(args.output)
+    print(f"{args.output}: {len(df)} строк, {df['client_id'].nunique()} клиентов, {len(contacts)} контактов")
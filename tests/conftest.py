@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from marketing_analytics.migrations import mark_current
+from marketing_analytics.storage import DATE_FORMAT, JournalStore, write_frame
+from marketing_analytics.synthetic import generate_visits
+
+
+def visit_rows(template, **changes):
+    """Копия строк template с новыми visit_id (new-0, new-1, ...) и изменениями"""
+    rows = template.copy()
+    rows['visit_id'] = [f"new-{number}" for number in range(len(rows))]
+    return rows.assign(**changes)
+
+
+def same_visits(left, right):
+    """Одинаковые посещения без учета порядка строк"""
+    key = ['visit_id']
+    left = left.sort_values(key, ignore_index=True)
+    right = right.sort_values(key, ignore_index=True)
+    return left.astype(str).equals(right.astype(str))
+
+
+@pytest.fixture
+def visits():
+    return generate_visits(300, seed=7)
+
+
+@pytest.fixture
+def db_path(tmp_path, visits):
+    """CSV-база в актуальной схеме"""
+    path = str(tmp_path / "marketing_database.csv")
+    write_frame(visits, path)
+    mark_current(path)
+    return path
+
+
+@pytest.fixture
+def store(db_path):
+    # Отдельный экземпляр, а не get_store: у каждого теста свое хранилище
+    return JournalStore(db_path)
+
+
+@pytest.fixture
+def legacy_path(tmp_path, visits):
+    """Старая CSV-база: без visit_id, контакты рассылки вперемешку с посещениями,
+    один клиент записан в разном написании"""
+    legacy = visits.drop(columns=['visit_id']).copy()
+    legacy['Дата'] = legacy['Дата'].dt.strftime(DATE_FORMAT)
+    legacy.loc[1, ['Имя', 'Телефон']] = [legacy.loc[0, 'Имя'].upper(), legacy.loc[0, 'Телефон']]
+    contacts = pd.DataFrame({
+        'client_id': 'old',
+        'Дата': ['2024-01-0%d 10:00:00' % day for day in range(1, 5)],
+        'Направление': 'Рассылка',
+        'Имя': ['Анна Петрова', 'Анна Петрова', 'Анна Петрова', 'Олег Попов'],
+        'Ссылка_VK': ['https://vk.com/anna', 'https://vk.com/anna', None, None],
+        'Согласие_рассылка': 'Да',
+    })
+    path = str(tmp_path / "legacy.csv")
+    pd.concat([legacy, contacts], ignore_index=True).to_csv(path, index=False, encoding='utf-8')
+    return path
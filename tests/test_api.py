@@ -0,0 +1,98 @@
+import pytest
+
+from marketing_analytics.api import ApiApp, ApiClient
+from marketing_analytics.importer import REASON_COLUMN
+from marketing_analytics.stats import DIRECTIONS, SERVICE_PRICES
+from marketing_analytics.storage import JournalStore
+
+SERVICE, PRICE = next(iter(SERVICE_PRICES.items()))
+
+
+def visit(name="Тест Тестов", phone="+79990000001", **changes):
+    return {"Дата": "2030-01-15 12:00:00", "Направление": DIRECTIONS[0], "Имя": name,
+            "Телефон": phone, "Услуга": SERVICE, "Цена": PRICE, **changes}
+
+
+@pytest.fixture
+def client(store):
+    return ApiClient(ApiApp(store, token=""))
+
+
+def test_unchanged_data_answers_304(client):
+    status, headers, body = client.get("/api/month?month=2030-01")
+    assert status == 200 and body["month"] == "2030-01"
+
+    status, _, body = client.get("/api/month?month=2030-01", {"If-None-Match": headers["ETag"]})
+    assert status == 304 and body is None
+
+
+def test_etag_changes_with_data_and_survives_restart(client, db_path):
+    _, headers, _ = client.get("/api/month?month=2030-01")
+    etag = headers["ETag"]
+
+    restarted = ApiClient(ApiApp(JournalStore(db_path), token=""))
+    status, _, _ = restarted.get("/api/month?month=2030-01", {"If-None-Match": etag})
+    assert status == 304
+
+    client.post("/api/visits", visit())
+    status, headers, body = client.get("/api/month?month=2030-01", {"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert body["income"] == PRICE
+
+
+def test_ingest_accepts_valid_visits_and_reports_rejected(client, store):
+    status, _, body = client.post("/api/visits", [visit(), visit(name="Без Услуги", Услуга="Нет такой")])
+
+    assert status == 201
+    assert body["imported"] == 1
+    assert [row["Имя"] for row in body["rejected"]] == ["Без Услуги"]
+    assert body["rejected"][0][REASON_COLUMN]
+    assert "Тест Тестов" in set(store.data()['Имя'])
+
+    # Повтор того же посещения не дублирует его
+    status, _, body = client.post("/api/visits", visit())
+    assert body["imported"] == 0
+    assert body["rejected"][0][REASON_COLUMN] == "уже есть в базе"
+
+
+def test_ingest_rejects_malformed_payload(client):
+    status, _, body = client.post("/api/visits", "не посещение")
+    assert status == 400 and body["error"]
+
+    status, _, _ = client.get("/api/visits")
+    assert status == 405
+
+
+def test_ingest_unavailable_until_migrated(legacy_path):
+    client = ApiClient(ApiApp(JournalStore(legacy_path), token=""))
+
+    status, _, _ = client.post("/api/visits", visit())
+    assert status == 503
+
+
+def test_client_history_pages_follow_deletes(client, store, visits):
+    client_id = visits['client_id'].value_counts().index[0]
+    status, _, body = client.get(f"/api/clients/{client_id}/visits?page_size=5")
+    assert status == 200
+    total = body["visits"]
+    newest = [item["visit_id"] for item in body["items"]]
+    assert len(newest) == 5
+
+    store.delete([newest[0]])
+    _, _, body = client.get(f"/api/clients/{client_id}/visits?page_size=5")
+    assert body["visits"] == total - 1
+    assert [item["visit_id"] for item in body["items"]][:4] == newest[1:]
+
+    status, _, _ = client.get("/api/clients/нет-такого/visits")
+    assert status == 404
+    status, _, _ = client.get(f"/api/clients/{client_id}/visits?page=-1")
+    assert status == 400
+
+
+def test_ingest_requires_token(store):
+    client = ApiClient(ApiApp(store, token="secret"))
+
+    status, _, _ = client.post("/api/visits", visit())
+    assert status == 401
+    status, _, _ = client.post("/api/visits", visit(), {"Authorization": "Bearer secret"})
+    assert status == 201
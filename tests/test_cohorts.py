@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from marketing_analytics.cohorts import Cohorts, cohort_report
+
+from conftest import visit_rows
+
+
+def reference_report(df):
+    """Те же когорты циклом по клиентам - эталон для векторного расчета"""
+    df = df[df['Дата'].notna()]
+    months = df['Дата'].dt.year * 12 + df['Дата'].dt.month - 1
+    span = months.max() - months.min() + 1
+    sizes, active, revenue = {}, {}, {}
+    for _, visits in df.assign(month=months).groupby('client_id', sort=False):
+        first = visits.iloc[0]
+        key = (first['Дата'].strftime('%Y-%m'), first['Направление'])
+        sizes[key] = sizes.get(key, 0) + 1
+        for offset in set(visits['month'] - first['month']):
+            active[key + (offset,)] = active.get(key + (offset,), 0) + 1
+        for offset, amount in visits.groupby(visits['month'] - first['month'])['Цена'].sum().items():
+            revenue[key + (offset,)] = revenue.get(key + (offset,), 0) + amount
+    last = months.max()
+    result = {}
+    for key, size in sizes.items():
+        year, month = map(int, key[0].split('-'))
+        remaining = last - (year * 12 + month - 1) + 1
+        retention = [active.get(key + (offset,), 0) / size for offset in range(remaining)]
+        ltv = np.cumsum([revenue.get(key + (offset,), 0) for offset in range(remaining)]) / size
+        result[key] = (size, retention + [np.nan] * (span - remaining), list(ltv) + [np.nan] * (span - remaining))
+    return result
+
+
+def test_vectorized_cohorts_match_reference(visits):
+    report = cohort_report(visits)
+    reference = reference_report(visits)
+
+    assert set(report.sizes.index) == set(reference)
+    for key, (size, retention, ltv) in reference.items():
+        assert report.sizes[key] == size
+        np.testing.assert_allclose(report.retention.loc[key].to_numpy(), retention)
+        np.testing.assert_allclose(report.ltv.loc[key].to_numpy(), ltv)
+
+    overall = cohort_report(visits, by_direction=False)
+    assert overall.sizes.sum() == visits['client_id'].nunique()
+
+
+def test_cached_report_follows_appends_and_deletes(store, visits):
+    cohorts = Cohorts(store)
+    report = cohorts.report()
+    assert cohorts.report() is report
+    assert cohorts.latest() == (report, True)
+
+    store.append_many(visit_rows(visits.iloc[:1], client_id="new-client", Дата=pd.Timestamp("2030-01-15")))
+    assert cohorts.latest() == (report, False)
+    updated = cohorts.report()
+    assert updated.sizes[("2030-01", visits['Направление'].iloc[0])] == 1
+
+    store.delete(["new-0"])
+    restored = cohorts.report()
+    assert restored.sizes.equals(report.sizes)
+    assert restored.retention.equals(report.retention)
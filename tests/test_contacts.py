@@ -0,0 +1,53 @@
+import pandas as pd
+
+from marketing_analytics.contacts import CONTACT_COLUMNS, ContactStore, contacts_path
+from marketing_analytics.migrations import migrate, pending_migrations
+from marketing_analytics.storage import JournalStore
+
+
+def contact(client_id, name, consent="Да"):
+    return {"client_id": client_id, "Дата": "2030-01-01 10:00:00", "Имя": name, "Согласие_рассылка": consent}
+
+
+def test_migration_moves_contacts_out_of_visits(legacy_path):
+    migrate(legacy_path, chunk_rows=50)
+
+    visits = pd.read_csv(legacy_path, dtype=str, keep_default_na=False)
+    assert not (visits['Направление'] == 'Рассылка').any()
+    contacts = ContactStore(contacts_path(legacy_path)).frame()
+    assert set(contacts['Имя']) == {"Анна Петрова", "Олег Попов"}
+    assert contacts['client_id'].is_unique
+    assert not contacts.isin(['nan']).any().any()
+
+
+def test_new_database_starts_in_current_schema(tmp_path, visits):
+    path = str(tmp_path / "marketing_database.csv")
+    JournalStore(path).append_many(visits.iloc[:3])
+
+    assert pending_migrations(path) == []
+
+
+def test_contact_store_upserts_deletes_and_reloads(tmp_path):
+    path = str(tmp_path / "contacts.csv")
+    contacts = ContactStore(path)
+    contacts.upsert_many([contact("c1", "Анна"), contact("c2", "Борис"), contact("c3", "Вера", "Нет")])
+    contacts.upsert(contact("c1", "Анна Петрова"))
+    contacts.delete({"c2", "нет такого"})
+
+    expected = {"c1": "Анна Петрова", "c3": "Вера"}
+    assert dict(zip(contacts.frame()['client_id'], contacts.frame()['Имя'])) == expected
+    other = ContactStore(path)
+    assert dict(zip(other.frame()['client_id'], other.frame()['Имя'])) == expected
+
+    # Запись другого экземпляра видна после перечитывания по сигнатуре файлов
+    version = contacts.version
+    other.delete(["c3"])
+    assert list(contacts.contacts()) == ["c1"]
+    assert contacts.version > version
+
+    contacts.compact()
+    reloaded = ContactStore(path)
+    assert reloaded.frame().columns.tolist() == CONTACT_COLUMNS
+    assert reloaded.frame()['client_id'].tolist() == ["c1"]
+    assert reloaded.log_records == 0
+    assert [chunk['client_id'].tolist() for chunk in reloaded.iter_consenting()] == [["c1"]]
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from marketing_analytics.storage import JournalStore
+
+from conftest import visit_rows
+
+
+def test_appended_visits_keep_time_order(store, visits):
+    store.data()
+    middle = visits['Дата'].iloc[len(visits) // 2]
+    store.append_many(visit_rows(visits.iloc[:2], Дата=middle))
+    store.append_many(visit_rows(visits.iloc[:1], Дата=visits['Дата'].min() - pd.Timedelta(days=1)).assign(visit_id="earliest"))
+
+    for df in (store.data(), JournalStore(store.path).data()):
+        assert df['Дата'].is_monotonic_increasing
+        assert df['visit_id'].iloc[0] == "earliest"
+        start, end = middle.normalize(), middle.normalize() + pd.Timedelta(days=1)
+        expected = df[(df['Дата'] >= start) & (df['Дата'] < end)]
+        assert store.period_frame(start, end)['visit_id'].tolist() == expected['visit_id'].tolist()
+
+
+def test_unparseable_date_survives_compaction(store, visits):
+    store.append_many(visit_rows(visits.iloc[:1], Дата="15.03.2024"))
+    assert store.data().loc[store.data()['visit_id'] == "new-0", 'Дата'].isna().all()
+    store.compact()
+    store.compact(store.data().copy())
+
+    raw = pd.read_csv(store.path, dtype=str, keep_default_na=False)
+    assert raw.loc[raw['visit_id'] == "new-0", 'Дата'].tolist() == ["15.03.2024"]
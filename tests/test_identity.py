@@ -0,0 +1,92 @@
+import pandas as pd
+
+from marketing_analytics.contacts import ContactStore, contacts_path
+from marketing_analytics.identity import IdentityIndex, client_ids_for
+from marketing_analytics.migrations import migrate
+from marketing_analytics.query import FilterSpec, QueryEngine
+from marketing_analytics.rollups import Rollups, summarize
+from marketing_analytics.stats import DIRECTIONS, SERVICE_PRICES
+from marketing_analytics.storage import JournalStore
+
+SERVICE, PRICE = next(iter(SERVICE_PRICES.items()))
+
+
+def form_visit(name, phone, date="2030-01-15 12:00:00", **changes):
+    """Посещение так, как его сохраняет форма: client_id по нормализованным имени и телефону"""
+    visit = {"visit_id": f"{name}|{phone}|{date}", "client_id": client_ids_for([name], [phone])[0],
+             "Дата": date, "Направление": DIRECTIONS[0], "Имя": name, "Телефон": phone,
+             "Услуга": SERVICE, "Цена": PRICE, "Кто_пригласил": "", "Место_учебы": "",
+             "Ссылка_VK": "", "Согласие_рассылка": ""}
+    visit.update(changes)
+    return visit
+
+
+def test_two_spellings_count_as_one_client(tmp_path):
+    store = JournalStore(str(tmp_path / "marketing_database.csv"))
+    rollups = Rollups(store)
+    store.subscribe(rollups)
+    store.append(form_visit("Иван Петров", "+7 900 123-45-67"))
+    store.append(form_visit("иван  петров ", "8 (900) 1234567", date="2030-01-15 15:00:00"))
+
+    df = store.data()
+    assert df['client_id'].nunique() == 1
+    for level, period in (("day", "2030-01-15"), ("month", "2030-01")):
+        summary = rollups.summary(level, period)
+        assert summary['clients'] == 1 and summary['visits'] == 2
+        assert summary['by_direction'][DIRECTIONS[0]]['clients'] == 1
+    assert summarize(df)['clients'] == 1
+    assert QueryEngine(store).query(FilterSpec()).clients == 1
+
+    # Полная пересборка считает так же, как инкрементальные обновления
+    rebuilt = Rollups()
+    rebuilt.rebuild(df)
+    assert rebuilt.summary("month", "2030-01")['clients'] == 1
+
+
+def test_phone_lookup_built_before_first_visit_sees_new_clients(tmp_path):
+    # Форма спрашивает by_phone еще до первой записи в пустую базу
+    index = IdentityIndex()
+    index.on_reload(JournalStore(str(tmp_path / "marketing_database.csv")).data())
+    assert index.by_phone("+7 900 123-45-67") == []
+
+    index.on_append(pd.DataFrame([form_visit("Иван Петров", "+7 900 123-45-67")]))
+
+    assert [client.name for client in index.by_phone("8 900 1234567")] == ["Иван Петров"]
+    assert index.find("ИВАН ПЕТРОВ", "9001234567") is not None
+
+
+def test_identity_index_merges_spellings_and_follows_deletes():
+    index = IdentityIndex()
+    first = form_visit("Иван Петров", "+7 900 123-45-67")
+    second = form_visit("иван  петров ", "8 (900) 1234567", date="2030-01-16 12:00:00")
+    other = form_visit("Анна Смирнова", "+7 900 123-45-67")
+    index.on_reload(pd.DataFrame([first]))
+    index.on_append(pd.DataFrame([second, other]))
+
+    assert len(index.clients) == 2
+    assert index.find("Иван Петров", "+79001234567").visits == 2
+    assert {client.name for client in index.by_phone("+79001234567")} == {"иван  петров ", "Анна Смирнова"}
+
+    index.on_delete(pd.DataFrame([first, other]))
+    assert index.find("Иван Петров", "+79001234567").visits == 1
+    assert [client.name for client in index.by_phone("+79001234567")] == ["иван  петров "]
+
+    # После полной перезагрузки тот же результат
+    rebuilt = IdentityIndex()
+    rebuilt.on_reload(pd.DataFrame([second]))
+    assert [client.client_id for client in rebuilt.by_phone("+79001234567")] == \
+        [client.client_id for client in index.by_phone("+79001234567")]
+
+
+def test_migration_merges_spellings_and_contacts_by_vk_link(legacy_path):
+    migrate(legacy_path, chunk_rows=50)
+
+    visits = pd.read_csv(legacy_path, dtype=str, keep_default_na=False)
+    # Одно имя в разном написании с тем же телефоном - один клиент
+    assert visits.loc[0, 'client_id'] == visits.loc[1, 'client_id']
+    assert (visits['client_id'] == client_ids_for(visits['Имя'], visits['Телефон'])).all()
+
+    contacts = ContactStore(contacts_path(legacy_path)).frame()
+    # Одна ссылка VK - один контакт, без ссылки однофамильцы не сливаются
+    assert len(contacts) == 3
+    assert contacts['Имя'].value_counts()["Анна Петрова"] == 2
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+
+from marketing_analytics.contacts import ContactStore, contacts_path
+from marketing_analytics.importer import REASON_COLUMN, import_visits, read_table
+from marketing_analytics.stats import DIRECTIONS, SERVICE_PRICES
+from marketing_analytics.storage import JournalStore
+
+SERVICE, PRICE = next(iter(SERVICE_PRICES.items()))
+DIRECTION = DIRECTIONS[0]
+
+
+def csv_table(*lines):
+    header = "Дата,Направление,Имя,Телефон,Услуга,Цена,Ссылка_VK\n"
+    return read_table(io.StringIO(header + "\n".join(lines) + "\n"), name="import.csv")
+
+
+def test_import_validates_rows_and_skips_repeats(store):
+    raw = csv_table(
+        f"2030-01-15 12:00:00,{DIRECTION},Импорт Первый,+79990000001,{SERVICE},{PRICE},",
+        f"2030-01-16 12:00:00,{DIRECTION},Импорт Второй,89990000002,{SERVICE},,",
+        f"2030-01-15 12:00:00,{DIRECTION},Импорт Первый,+79990000001,{SERVICE},{PRICE},",
+        f"15.01.2030,{DIRECTION},Плохая Дата,+79990000003,{SERVICE},{PRICE},",
+        f"2030-01-15 12:00:00,Неизвестное,Без Направления,+79990000004,{SERVICE},{PRICE},",
+        f"2030-01-15 12:00:00,{DIRECTION},Не Та Цена,+79990000005,{SERVICE},{PRICE + 1},",
+        f"2030-01-15 12:00:00,{DIRECTION},Без Телефона,,{SERVICE},{PRICE},",
+        "2030-01-15 12:00:00,Рассылка,Контакт Рассылки,,,,https://vk.com/contact",
+    )
+
+    imported, rejected = import_visits(raw, store)
+
+    assert imported == 3
+    reasons = dict(zip(rejected['Имя'], rejected[REASON_COLUMN]))
+    assert reasons == {
+        "Импорт Первый": "повтор в файле",
+        "Плохая Дата": "неверная дата",
+        "Без Направления": "неизвестное направление",
+        "Не Та Цена": "цена не совпадает с прайсом",
+        "Без Телефона": "нет телефона",
+    }
+    reloaded = JournalStore(store.path).data()
+    added = reloaded[reloaded['Имя'].str.startswith("Импорт")]
+    assert sorted(added['Имя']) == ["Импорт Второй", "Импорт Первый"]
+    assert (added['Цена'] == PRICE).all()
+    contacts = ContactStore(contacts_path(store.path)).frame()
+    assert contacts['Имя'].tolist() == ["Контакт Рассылки"]
+
+    # Повторный импорт того же файла ничего не добавляет
+    imported, rejected = import_visits(raw, store)
+    assert imported == 1  # контакт рассылки обновляется по ключу, посещения - уже в базе
+    assert (rejected[REASON_COLUMN] == "уже есть в базе").sum() == 3
+    assert len(JournalStore(store.path).data()) == len(reloaded)
+
+
+def test_import_after_delete_restores_visit(store):
+    raw = csv_table(f"2030-01-15 12:00:00,{DIRECTION},Импорт Первый,+79990000001,{SERVICE},{PRICE},")
+    import_visits(raw, store)
+    visit_id = store.data().loc[store.data()['Имя'] == "Импорт Первый", 'visit_id'].iloc[0]
+    store.delete([visit_id])
+
+    imported, _ = import_visits(raw, store)
+    assert imported == 1
+    assert visit_id in set(JournalStore(store.path).data()['visit_id'])
+
+
+def test_import_requires_columns(store):
+    raw = read_table(io.StringIO("Имя,Телефон\nКто-то,+79990000001\n"), name="import.csv")
+    with pytest.raises(ValueError, match="Дата"):
+        import_visits(raw, store)
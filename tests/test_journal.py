@@ -0,0 +1,49 @@
+import os
+
+from marketing_analytics.storage import JournalStore
+
+from conftest import same_visits, visit_rows
+
+
+def test_journal_replay_restores_appends_and_deletes(store, visits):
+    store.data()
+    store.append_many(visit_rows(visits.iloc[:3]))
+    store.delete([visits['visit_id'].iloc[10], "new-1"])
+
+    assert os.path.exists(store.log_path)
+    reloaded = JournalStore(store.path).data()
+    assert len(reloaded) == len(visits) + 1
+    assert {"new-0", "new-2"} <= set(reloaded['visit_id'])
+    assert not {visits['visit_id'].iloc[10], "new-1"} & set(reloaded['visit_id'])
+    assert same_visits(reloaded, store.data())
+
+
+def test_journal_replay_skips_torn_last_line(store, visits):
+    store.append_many(visit_rows(visits.iloc[:2]))
+    with open(store.log_path, "ab") as f:
+        f.write(b'{"op": "add", "visit": {"visit_id": "tor')
+
+    reloaded = JournalStore(store.path).data()
+    assert len(reloaded) == len(visits) + 2
+
+
+def test_journal_entry_already_in_snapshot_is_not_duplicated(store, visits):
+    # Сбой между заменой снимка и удалением журнала: записи есть и там, и там
+    store.append_many(visit_rows(visits.iloc[:2]))
+    with open(store.log_path, "rb") as f:
+        journal = f.read()
+    store.compact()
+    with open(store.log_path, "wb") as f:
+        f.write(journal)
+
+    assert len(JournalStore(store.path).data()) == len(visits) + 2
+
+
+def test_compact_folds_journal_into_snapshot(store, visits):
+    store.append_many(visit_rows(visits.iloc[:5]))
+    store.delete([visits['visit_id'].iloc[0]])
+    expected = store.data()
+    store.compact()
+
+    assert not os.path.exists(store.log_path)
+    assert same_visits(JournalStore(store.path).data(), expected)
@@ -0,0 +1,44 @@
+import os
+import threading
+
+from marketing_analytics.storage import JournalStore
+
+from conftest import visit_rows
+
+
+def test_compact_keeps_writes_of_other_processes(store, visits):
+    df = store.data()
+    other = JournalStore(store.path)
+    other.append_many(visit_rows(visits.iloc[:2]))
+
+    # Перезапись по устаревшей копии: удаляем одно посещение у себя
+    removed = df['visit_id'].iloc[0]
+    store.compact(df[df['visit_id'] != removed].copy())
+
+    result = JournalStore(store.path).data()
+    assert {"new-0", "new-1"} <= set(result['visit_id'])
+    assert removed not in set(result['visit_id'])
+    assert len(result) == len(visits) + 1
+
+
+def test_concurrent_writers_lose_nothing(store, visits):
+    # Отдельные экземпляры хранилища ведут себя как разные процессы
+    writers = [store, JournalStore(store.path), JournalStore(store.path)]
+
+    def write(number, writer):
+        for step in range(5):
+            rows = visit_rows(visits.iloc[:1]).assign(visit_id=f"w{number}-{step}")
+            writer.append_many(rows)
+            if step == 2:
+                writer.compact()
+
+    threads = [threading.Thread(target=write, args=item) for item in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = JournalStore(store.path).data()
+    assert len(result) == len(visits) + 15
+    assert result['visit_id'].is_unique
+    assert not os.path.exists(os.path.splitext(store.path)[0] + ".tmp.csv")
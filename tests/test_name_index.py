@@ -0,0 +1,44 @@
+from marketing_analytics.contacts import ContactStore
+from marketing_analytics.name_index import ContactNameIndex, NameIndex, search_names
+
+from conftest import visit_rows
+
+
+def index_state(index):
+    return index.keys, dict(index.postings), index.ordered
+
+
+def test_name_index_matches_rebuild_after_appends_and_deletes(store, visits):
+    store.data()
+    index = NameIndex()
+    store.subscribe(index)
+
+    store.append_many(visit_rows(visits.iloc[:2], Имя="Ёлкина Мария", Телефон="+7 900 555-00-11"))
+    only_visits = visits[visits['Имя'] == visits['Имя'].iloc[-1]]
+    store.delete(list(only_visits['visit_id']) + ["new-1"])
+
+    rebuilt = NameIndex()
+    rebuilt.on_reload(store.data())
+    assert index_state(index) == index_state(rebuilt)
+
+    assert index.search("елкина")[0][:2] == ("Ёлкина Мария", "+7 900 555-00-11")
+    assert index.search("ёлкина ма")
+    assert index.search("мария ел") == []
+    assert index.search("+7 900 555")[0][0] == "Ёлкина Мария"
+    assert only_visits['Имя'].iloc[0] not in index.search_names(only_visits['Имя'].iloc[0])
+
+    store.delete(["new-0"])
+    assert index.search("елкина") == []
+
+
+def test_contact_names_follow_contact_store(tmp_path, store):
+    store.data()
+    contacts = ContactStore(str(tmp_path / "contacts.csv"))
+    index = ContactNameIndex(contacts)
+    assert index.search_names("Анна") == []
+
+    contacts.upsert({"client_id": "c1", "Имя": "Анна Петрова"})
+    assert index.search_names("анна") == ["Анна Петрова"]
+
+    contacts.delete(["c1"])
+    assert search_names([NameIndex(), index], "анна") == []
@@ -0,0 +1,68 @@
+import os
+
+import pandas as pd
+
+from marketing_analytics import storage
+from marketing_analytics.storage import PartitionedStore, convert
+
+from conftest import same_visits, visit_rows
+
+
+def partitioned(tmp_path, db_path):
+    path = str(tmp_path / "marketing_database.parts")
+    convert(db_path, path)
+    return path
+
+
+def test_totals_follow_deleted_edge_visits(tmp_path, db_path, visits):
+    path = partitioned(tmp_path, db_path)
+    # Удаляет другой процесс - у нашего хранилища кэш устарел, итоги идут из манифеста
+    PartitionedStore(path).delete([visits['visit_id'].iloc[0], visits['visit_id'].iloc[-1]])
+
+    totals = PartitionedStore(path).totals()
+    assert totals["visits"] == len(visits) - 2
+    assert totals["first_date"] == visits['Дата'].iloc[1]
+    assert totals["last_date"] == visits['Дата'].iloc[-2]
+    assert totals["revenue"] == int(visits['Цена'].iloc[1:-1].sum())
+
+
+def test_totals_without_dates(tmp_path, db_path, visits):
+    path = partitioned(tmp_path, db_path)
+    store = PartitionedStore(path)
+    store.delete(list(visits['visit_id']))
+
+    totals = PartitionedStore(path).totals()
+    assert totals["visits"] == 0
+    assert totals["first_date"] is None and totals["last_date"] is None
+
+
+def test_partitioned_compact_matches_full_reload(tmp_path, db_path, visits):
+    path = partitioned(tmp_path, db_path)
+    store = PartitionedStore(path)
+    store.data()
+    store.append_many(visit_rows(visits.iloc[:3], Дата=pd.Timestamp("2030-01-15 12:00")))
+    store.delete([visits['visit_id'].iloc[0]])
+    expected = store.data()
+    store.compact()
+
+    assert not os.path.exists(store.log_path)
+    assert same_visits(PartitionedStore(path).data(), expected)
+    assert "2030-01" in PartitionedStore(path).months()
+
+
+def test_period_frame_reads_only_matching_partitions(tmp_path, db_path, visits, monkeypatch):
+    path = partitioned(tmp_path, db_path)
+    writer = PartitionedStore(path)
+    writer.append_many(visit_rows(visits.iloc[:2], Дата=pd.Timestamp("2030-01-15 12:00")))
+    month = visits['Дата'].iloc[len(visits) // 2].to_period('M')
+    start, end = month.start_time, month.end_time.ceil('D')
+
+    read = []
+    read_frame = storage.read_frame
+    monkeypatch.setattr(storage, "read_frame", lambda file: read.append(file) or read_frame(file))
+    rows = PartitionedStore(path).period_frame(start, end)
+
+    assert read == [storage.partition_path(path, str(month))]
+    full = writer.data()
+    assert same_visits(rows, full[(full['Дата'] >= start) & (full['Дата'] < end)])
+    assert len(PartitionedStore(path).period_frame("2030-01-01", "2030-02-01")) == 2
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from marketing_analytics.profiles import RECENT_VISITS, ClientProfiles
+
+from conftest import visit_rows
+
+
+def snapshot(profiles, client_id):
+    """Сводка профиля и вся история клиента - для сравнения с пересборкой"""
+    profile = profiles.get(client_id)
+    if profile is None:
+        return None
+    pages = pd.concat([profiles.visits_page(client_id, page, 7) for page in range(profile.visits // 7 + 1)])
+    return (profile.name, profile.visits, profile.total_spent, profile.first_visit, profile.last_visit,
+            list(pages['visit_id']))
+
+
+def test_profiles_match_rebuild_after_appends_and_deletes(store, visits):
+    store.data()
+    profiles = ClientProfiles(store)
+    store.subscribe(profiles)
+    busiest = visits['client_id'].value_counts().index[:3]
+    client_ids = list(busiest) + [visits['client_id'].iloc[-1]]
+    for client_id in client_ids[:2]:
+        profiles.get(client_id)
+
+    client_visits = visits[visits['client_id'] == busiest[0]]
+    store.append_many(visit_rows(client_visits.iloc[:2], Дата=pd.Timestamp("2030-01-01")))
+    store.delete([client_visits['visit_id'].iloc[0], visits['visit_id'].iloc[-1]])
+    store.delete(list(visits.loc[visits['client_id'] == busiest[2], 'visit_id']))
+
+    rebuilt = ClientProfiles(store)
+    rebuilt.on_reload(store.data())
+    for client_id in client_ids:
+        assert snapshot(profiles, client_id) == snapshot(rebuilt, client_id)
+    assert profiles.get(busiest[2]) is None
+    assert profiles.get(busiest[0]).recent[0][0] in {"new-0", "new-1"}
+
+
+def test_history_is_read_from_store_once_per_client(store, visits):
+    store.data()
+    profiles = ClientProfiles(store)
+    store.subscribe(profiles)
+    client_id = visits['client_id'].value_counts().index[0]
+    assert (visits['client_id'] == client_id).sum() > RECENT_VISITS
+
+    reads = []
+    client_history = store.client_history
+    store.client_history = lambda client_id: reads.append(client_id) or client_history(client_id)
+    for page in range(4):
+        profiles.visits_page(client_id, page, 10)
+    store.delete([visits.loc[visits['client_id'] == client_id, 'visit_id'].iloc[-1]])
+    profiles.visits_page(client_id, 3, 10)
+
+    assert reads == [client_id]
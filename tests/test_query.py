@@ -0,0 +1,76 @@
+import pandas as pd
+
+from marketing_analytics.query import FilterSpec, QueryEngine
+
+from conftest import visit_rows
+
+
+def expected(df, spec):
+    mask = pd.Series(True, index=df.index)
+    if spec.start is not None:
+        mask &= df['Дата'] >= spec.start
+    if spec.end is not None:
+        mask &= df['Дата'] < spec.end
+    if spec.directions:
+        mask &= df['Направление'].isin(spec.directions)
+    if spec.services:
+        mask &= df['Услуга'].isin(spec.services)
+    if spec.min_price is not None:
+        mask &= df['Цена'] >= spec.min_price
+    if spec.max_price is not None:
+        mask &= df['Цена'] <= spec.max_price
+    rows = df[mask]
+    return rows['visit_id'].tolist(), int(rows['Цена'].sum()), rows['client_id'].nunique()
+
+
+def check(engine, df, spec):
+    result = engine.query(spec)
+    assert (result.rows['visit_id'].tolist(), result.revenue, result.clients) == expected(df, spec)
+    assert result.services == len(result.rows)
+
+
+def specs(df):
+    middle = df['Дата'].iloc[len(df) // 2].normalize()
+    direction, service = df['Направление'].iloc[0], df['Услуга'].iloc[0]
+    return [
+        FilterSpec(),
+        FilterSpec(start=middle, end=middle + pd.Timedelta(days=30)),
+        FilterSpec(directions=[direction]),
+        FilterSpec(start=middle, directions=[direction], services=[service, "Нет такой"]),
+        FilterSpec(min_price=df['Цена'].median(), max_price=df['Цена'].max() - 1),
+    ]
+
+
+def test_queries_match_pandas_filters_after_appends_and_deletes(store, visits):
+    engine = QueryEngine(store)
+    for spec in specs(visits):
+        check(engine, store.data(), spec)
+
+    store.append_many(visit_rows(visits.iloc[:3], Дата=visits['Дата'].iloc[len(visits) // 2]))
+    store.delete([visits['visit_id'].iloc[0], visits['visit_id'].iloc[len(visits) // 2], "new-2"])
+    for spec in specs(visits):
+        check(engine, store.data(), spec)
+
+    reloaded = QueryEngine(type(store)(store.path))
+    for spec in specs(visits):
+        check(reloaded, store.data(), spec)
+
+
+def test_results_are_cached_per_data_version(store, visits):
+    engine = QueryEngine(store, cache_size=2)
+    spec = FilterSpec(directions=[visits['Направление'].iloc[0]])
+    result = engine.query(spec)
+    assert engine.query(FilterSpec(directions=[visits['Направление'].iloc[0]])) is result
+
+    store.append_many(visit_rows(visits.iloc[:1]))
+    updated = engine.query(spec)
+    assert updated is not result
+    assert len(updated.rows) == len(result.rows) + 1
+    assert engine.query(spec) is updated
+
+    engine.query(FilterSpec(min_price=1))
+    engine.query(FilterSpec(min_price=2))
+    assert len(engine._results) == 2
+    assert engine.query(spec) is not updated
+
+    assert set(engine.options('Направление')) == set(store.data()['Направление'].astype(str))
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from marketing_analytics.referrals import ReferralGraph
+
+from conftest import visit_rows
+
+
+def chain_visits(template):
+    """Цепочка Анна -> Борис -> Вера и обратное ребро Вера -> Анна, замыкающее цикл"""
+    rows = visit_rows(template.iloc[:4], Цена=1000)
+    rows['Имя'] = ["Анна Цепь", "Борис Цепь", "Вера Цепь", "Анна Цепь"]
+    rows['Кто_пригласил'] = ["", "Анна Цепь", "Борис Цепь", "Вера Цепь"]
+    rows['Дата'] = pd.to_datetime(["2030-01-05", "2030-01-10", "2030-02-03", "2030-03-01"])
+    return rows
+
+
+def row(table, name):
+    return table.set_index('Пригласивший').loc[name]
+
+
+def test_chain_metrics_skip_cycles_and_follow_deletes(store, visits):
+    store.data()
+    graph = ReferralGraph()
+    store.subscribe(graph)
+    store.append_many(chain_visits(visits))
+
+    anna = row(graph.metrics(), "Анна Цепь")
+    assert (anna['Прямых'], anna['Всего в цепочке'], anna['Выручка цепочки']) == (1, 2, 2000)
+    assert row(graph.metrics(), "Вера Цепь")['Всего в цепочке'] == 0
+    top = graph.top_influencers("2030-02")
+    assert top['Пригласивший'].tolist() == ["Борис Цепь"]
+
+    # Без посещения Бориса цепочка Анны обрывается
+    store.delete(["new-1"])
+    assert "Анна Цепь" not in set(graph.metrics()['Пригласивший'])
+    assert row(graph.metrics(), "Вера Цепь")['Всего в цепочке'] == 1
+
+    rebuilt = ReferralGraph()
+    rebuilt.on_reload(store.data())
+    assert graph.edges == rebuilt.edges
+    assert graph.invited == rebuilt.invited
+    assert graph.revenue == rebuilt.revenue
+    assert graph.metrics().equals(rebuilt.metrics())
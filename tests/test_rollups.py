@@ -0,0 +1,47 @@
+import pandas as pd
+
+from marketing_analytics.rollups import Rollups, summarize
+
+from conftest import visit_rows
+
+
+def summaries(rollups):
+    return {(level, period): rollups.summary(level, period)
+            for level in ("day", "month") for period in rollups.periods(level)}
+
+
+def test_rollups_follow_appends_and_deletes(store, visits):
+    store.data()
+    rollups = Rollups(store)
+    store.subscribe(rollups)
+
+    store.append_many(visit_rows(visits.iloc[:4], Дата=pd.Timestamp("2030-01-15 12:00")))
+    # Удаляем все посещения одного дня - день и месяц должны исчезнуть из сводок
+    day = visits['Дата'].dt.strftime('%Y-%m-%d')
+    store.delete(list(visits.loc[day == day.iloc[0], 'visit_id']) + ["new-0", "new-1", "new-2", "new-3"])
+    store.delete([visits['visit_id'].iloc[-1]])
+
+    rebuilt = Rollups()
+    rebuilt.rebuild(store.data())
+    assert summaries(rollups) == summaries(rebuilt)
+    assert day.iloc[0] not in rollups.periods("day")
+    assert "2030-01" not in rollups.periods("month")
+
+    month = day.iloc[-2][:7]
+    rows = store.data()[store.data()['Дата'].dt.strftime('%Y-%m') == month]
+    assert rollups.summary("month", month) == summarize(rows)
+
+
+def test_saved_rollups_reload_only_for_same_files(store, visits):
+    store.data()
+    rollups = Rollups(store)
+    store.subscribe(rollups)
+    store.append_many(visit_rows(visits.iloc[:2]))
+    rollups.save()
+
+    restored = Rollups(store)
+    assert restored.load()
+    assert summaries(restored) == summaries(rollups)
+
+    store.append_many(visit_rows(visits.iloc[5:6]).assign(visit_id="later"))
+    assert not Rollups(store).load()
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from marketing_analytics.scheduler import DONE, FAILED, Scheduler, StoreJobs, compact_job
+
+from conftest import visit_rows
+
+
+def counting_job(scheduler, name, delay, started=None, release=None):
+    calls = []
+
+    def run(job):
+        calls.append(time.monotonic())
+        if started is not None:
+            started.set()
+            release.wait(5)
+
+    scheduler.register(name, name, run, delay=delay)
+    return calls
+
+
+def test_requests_before_start_are_coalesced():
+    scheduler = Scheduler()
+    calls = counting_job(scheduler, "job", delay=0.1)
+    for _ in range(5):
+        scheduler.request("job")
+
+    assert scheduler.wait("job", timeout=5)
+    time.sleep(0.2)
+    assert len(calls) == 1
+    assert scheduler.jobs["job"].state == DONE
+
+
+def test_steady_requests_run_no_later_than_max_delay():
+    scheduler = Scheduler(max_delay=0.2)
+    calls = counting_job(scheduler, "job", delay=0.1)
+    first = time.monotonic()
+    while time.monotonic() - first < 0.5:
+        scheduler.request("job")
+        time.sleep(0.02)
+
+    assert calls and calls[0] - first < 0.4
+    assert scheduler.wait("job", timeout=5)
+
+
+def test_requests_while_running_give_one_rerun():
+    scheduler = Scheduler()
+    started, release = threading.Event(), threading.Event()
+    calls = counting_job(scheduler, "job", delay=0, started=started, release=release)
+    scheduler.request("job")
+    assert started.wait(5)
+
+    started.clear()
+    for _ in range(3):
+        scheduler.request("job", delay=0)
+    time.sleep(0.1)
+    release.set()
+
+    assert started.wait(5)
+    assert scheduler.wait("job", timeout=5)
+    assert len(calls) == 2
+
+
+def test_failed_job_reports_error():
+    scheduler = Scheduler()
+
+    def fail(job):
+        raise RuntimeError("нет базы")
+
+    scheduler.register("job", "job", fail, delay=0)
+    scheduler.request("job")
+
+    assert scheduler.wait("job", timeout=5)
+    assert scheduler.jobs["job"].state == FAILED
+    assert scheduler.status()[0]["Ошибка"] == "RuntimeError: нет базы"
+
+
+def test_store_writes_schedule_compaction(store, visits):
+    store.data()
+    store.compact_threshold = 2
+    scheduler = Scheduler()
+    scheduler.register("compact", "Компакция журнала", compact_job(store), delay=0.05)
+    store.subscribe(StoreJobs(scheduler, ["compact"]))
+    assert scheduler.wait("compact", timeout=5)
+
+    store.append_many(visit_rows(visits.iloc[:1]))
+    store.delete([visits['visit_id'].iloc[0]])
+    assert scheduler.wait("compact", timeout=5)
+
+    assert not os.path.exists(store.log_path)
+    assert len(type(store)(store.path).data()) == len(visits)